@@ -0,0 +1 @@
+default_app_config = 'carmanagement_api.apps.CarmanagementApiConfig'
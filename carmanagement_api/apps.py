@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CarmanagementApiConfig(AppConfig):
     name = 'carmanagement_api'
+
+    def ready(self):
+        from carmanagement_api import serializers
+
+        # Content types can be given new ids when the database is migrated or flushed
+        post_migrate.connect(serializers.forget_location_content_types, sender=self)
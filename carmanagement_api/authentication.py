@@ -0,0 +1,189 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+TOKEN_SALT = 'carmanagement_api.tokens'
+TOKEN_KEYWORD = 'Bearer'
+
+
+class TokenUser:
+    """The user a token was issued to, built from the token's claims without reading the user from the database"""
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __init__(self, claims):
+        self.id = self.pk = claims['uid']
+        self.username = claims['usr']
+        self.is_staff = claims['stf']
+        self.is_superuser = claims['su']
+        self.token_id = claims['jti']
+        self.issued_at = claims['iat']
+        self.expires_at = claims['exp']
+
+    def __str__(self):
+        """Return the username of the user"""
+        return self.username
+
+
+def issue_token(user):
+    """Return a signed token for a user and the time it expires, as seconds since the epoch"""
+    # Times of issue keep the microseconds stored in each revocation, so a token issued just after every token of
+    # its user was revoked is not revoked with them
+    now = time.time()
+    issued_at = round(now, 6)
+    expires_at = int(now) + getattr(settings, 'TOKEN_MAX_AGE', 12 * 60 * 60)
+
+    token = signing.dumps({
+        'uid': user.pk,
+        'usr': user.get_username(),
+        'stf': user.is_staff,
+        'su': user.is_superuser,
+        'jti': secrets.token_urlsafe(8),
+        'iat': issued_at,
+        'exp': expires_at,
+    }, salt=TOKEN_SALT)
+
+    return token, expires_at
+
+
+class DenyList:
+    """The ids of revoked tokens, and the time before which every token of a user was revoked, that have not expired
+
+    Tokens expire on their own, so only revocations of tokens that could still be used are kept, which keeps the list
+    small enough to hold in memory and reload in full.
+    """
+
+    def __init__(self):
+        self.tokens = frozenset()
+        self.users = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Reload the revocations that have not expired"""
+        from carmanagement_api.models import TokenRevocation
+
+        tokens = set()
+        users = {}
+        for user_id, token_id, revoked_at in TokenRevocation.objects.filter(expires_at__gt=timezone.now()) \
+                .values_list('user_id', 'token_id', 'revoked_at'):
+            if token_id:
+                tokens.add(token_id)
+            else:
+                users[user_id] = max(users.get(user_id, 0), revoked_at.timestamp())
+
+        self.tokens = frozenset(tokens)
+        self.users = users
+        self.loaded_at = time.monotonic()
+
+    def refresh(self):
+        """Reload the revocations if they were last loaded more than TOKEN_DENY_LIST_REFRESH seconds ago"""
+        interval = getattr(settings, 'TOKEN_DENY_LIST_REFRESH', 30)
+
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > interval:
+            with self.lock:
+                if self.loaded_at is None or time.monotonic() - self.loaded_at > interval:
+                    self.load()
+
+    def denies(self, principal):
+        """Return whether a token has been revoked"""
+        return principal.token_id in self.tokens or principal.issued_at <= self.users.get(principal.id, -1)
+
+
+class PrincipalCache:
+    """Least recently used cache of the users of tokens whose signatures have already been checked"""
+
+    def __init__(self):
+        self.principals = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, token):
+        """Return the user of a token, checking its signature if it is not in the cache"""
+        with self.lock:
+            principal = self.principals.get(token)
+            if principal is not None:
+                self.principals.move_to_end(token)
+                return principal
+
+        try:
+            principal = TokenUser(signing.loads(token, salt=TOKEN_SALT))
+        except (signing.BadSignature, KeyError, TypeError):
+            raise AuthenticationFailed('Invalid token.')
+
+        with self.lock:
+            self.principals[token] = principal
+            while len(self.principals) > getattr(settings, 'TOKEN_CACHE_SIZE', 10000):
+                self.principals.popitem(last=False)
+
+        return principal
+
+    def clear(self):
+        """Forget every user"""
+        with self.lock:
+            self.principals.clear()
+
+
+# The state of this process, shared by every request it serves
+deny_list = DenyList()
+principals = PrincipalCache()
+
+
+def revoke(user_id, token_id=None, expires_at=None):
+    """Revoke a token, or every token issued to a user so far if no token is given"""
+    from carmanagement_api.models import TokenRevocation
+
+    now = timezone.now()
+    if expires_at is None:
+        # Every token issued so far will have expired by the time the longest lived one would
+        expires_at = int(now.timestamp()) + getattr(settings, 'TOKEN_MAX_AGE', 12 * 60 * 60)
+
+    TokenRevocation.objects.filter(expires_at__lte=now).delete()
+    TokenRevocation.objects.create(
+        user_id=user_id,
+        token_id=token_id or '',
+        revoked_at=now,
+        expires_at=datetime.fromtimestamp(expires_at, timezone.utc)
+    )
+
+    # Other processes see the revocation when they next refresh their deny-list
+    deny_list.load()
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """Authenticate requests with a signed token in the Authorization header, without reading the database
+
+    The signature and expiry are checked in memory, the users of recently seen tokens are kept in a least
+    recently used cache, and revoked tokens are found in a deny-list reloaded every TOKEN_DENY_LIST_REFRESH seconds.
+    """
+
+    def authenticate(self, request):
+        """Return the user of the token and the token, or None if no token was given"""
+        parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+
+        if len(parts) != 2 or parts[0] != TOKEN_KEYWORD:
+            return None
+
+        principal = principals.get(parts[1])
+
+        if principal.expires_at <= time.time():
+            raise AuthenticationFailed('Token has expired.')
+
+        deny_list.refresh()
+        if deny_list.denies(principal):
+            raise AuthenticationFailed('Token has been revoked.')
+
+        return (principal, parts[1])
+
+    def authenticate_header(self, request):
+        """Ask clients that are not authenticated for a token"""
+        return TOKEN_KEYWORD
@@ -0,0 +1,167 @@
+import io
+import json
+import logging
+import re
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.urls import resolve, Resolver404
+from rest_framework import status
+from rest_framework.settings import api_settings
+
+from carmanagement_api.dbrouters import use_primary, fleet_database
+
+
+logger = logging.getLogger(__name__)
+
+# A value such as "{{driver.body.0.id}}" is replaced with that value from the response to an earlier sub-request
+REFERENCE = re.compile(r'\{\{\s*([^{}\s]+)\s*\}\}')
+
+# Headers of the batch request that are not passed on to its sub-requests
+EXCLUDED_HEADERS = ('HTTP_IDEMPOTENCY_KEY', 'CONTENT_TYPE', 'CONTENT_LENGTH')
+
+
+class BatchReferenceError(Exception):
+    """Raised when a sub-request refers to a response or value that does not exist"""
+
+
+def lookup(results, reference):
+    """Return the value a reference points to, where results maps names to earlier responses"""
+    name, *keys = reference.split('.')
+
+    if name not in results:
+        raise BatchReferenceError(f'{name} does not refer to an earlier request.')
+
+    value = results[name]
+    for key in keys:
+        try:
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise BatchReferenceError(f'{reference} could not be found.')
+
+    return value
+
+
+def substitute(value, results):
+    """Replace the references to earlier responses in a path, body or header value"""
+    if isinstance(value, str):
+        # A value that is only a reference keeps the type of the value it refers to
+        whole = REFERENCE.fullmatch(value)
+        if whole:
+            return lookup(results, whole.group(1))
+        return REFERENCE.sub(lambda m: str(lookup(results, m.group(1))), value)
+    elif isinstance(value, list):
+        return [substitute(v, results) for v in value]
+    elif isinstance(value, dict):
+        return {k: substitute(v, results) for k, v in value.items()}
+
+    return value
+
+
+def build_request(request, method, path, body, headers):
+    """Create a request for a sub-request, with the client address and credentials of the batch request
+
+    Sub-requests are passed straight to their views without going through the middleware again, so they are
+    served from the region and database chosen for the batch request and use its session.
+    """
+    url = urlsplit(path)
+    content = json.dumps(body).encode('utf-8') if body is not None else b''
+
+    environ = {k: v for k, v in request.META.items() if k not in EXCLUDED_HEADERS and k != 'wsgi.input'}
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': io.BytesIO(content),
+    })
+    environ.update({'HTTP_' + k.upper().replace('-', '_'): str(v) for k, v in headers.items()})
+
+    return WSGIRequest(environ)
+
+
+def run_request(request, sub_request, results):
+    """Run a single sub-request and return its status and parsed body"""
+    try:
+        path = substitute(sub_request['path'], results)
+        body = substitute(sub_request.get('body'), results)
+        headers = substitute(sub_request.get('headers', {}), results)
+    except BatchReferenceError as e:
+        return status.HTTP_424_FAILED_DEPENDENCY, {'error': str(e)}
+
+    # Only API routes can be called, and batches cannot be nested
+    try:
+        if not urlsplit(path).path.startswith('/api/'):
+            raise Resolver404()
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        return status.HTTP_404_NOT_FOUND, {'error': f'{path} was not found.'}
+
+    if match.url_name == 'batch':
+        return status.HTTP_400_BAD_REQUEST, {'error': 'Batches cannot contain other batches.'}
+
+    sub = build_request(request, sub_request['method'], path, body, headers)
+    try:
+        response = match.func(sub, *match.args, **match.kwargs)
+    except Exception as e:
+        # An error in one sub-request is its response, so the rest of the batch still gets theirs
+        response = api_settings.EXCEPTION_HANDLER(e, {'request': sub, 'view': None})
+        if response is None:
+            logger.exception('%s %s failed in a batch', sub_request['method'], path)
+            return status.HTTP_500_INTERNAL_SERVER_ERROR, {'error': 'The request failed.'}
+
+    if hasattr(response, 'render'):
+        response.render()
+
+    return response.status_code, parse_content(response)
+
+
+def parse_content(response):
+    """Return the body of a sub-request's response, parsed if it is JSON and as text otherwise"""
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    if not content:
+        return None
+
+    if response.get('Content-Type', '').split(';')[0].strip().endswith('json'):
+        return json.loads(content)
+    return content.decode(response.charset, 'replace')
+
+
+def run_batch(request, sub_requests, atomic=False):
+    """Run each sub-request in order, returning their responses and whether their changes were kept
+
+    In an atomic batch the sub-requests run in one transaction, which is rolled back and the batch stopped at
+    the first response with an error status.
+    """
+    responses = []
+    results = {}
+    committed = True
+
+    # Later sub-requests must see the changes of earlier ones, so reads go to the primary if anything is changed
+    writes = any(r['method'] not in ('GET', 'HEAD', 'OPTIONS') for r in sub_requests)
+
+    with ExitStack() as stack:
+        if writes:
+            stack.enter_context(use_primary())
+        if atomic:
+            stack.enter_context(transaction.atomic(using=fleet_database()))
+
+        for index, sub_request in enumerate(sub_requests):
+            name = sub_request.get('name') or str(index)
+            status_code, body = run_request(request, sub_request, results)
+
+            result = {'name': name, 'status': status_code, 'body': body}
+            responses.append(result)
+            results[name] = results[str(index)] = result
+
+            if atomic and status_code >= 400:
+                transaction.set_rollback(True, using=fleet_database())
+                committed = False
+                break
+
+    return responses, committed
+
@@ -0,0 +1,132 @@
+import gzip
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+# Brotli and Zstandard compress better than gzip but are optional, so they are only offered when installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def available_encodings():
+    """Return the encodings that can be used, in order of preference"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+def choose_encoding(accept_encoding):
+    """Return the preferred available encoding accepted by the client, or None"""
+    accepted = {}
+
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+
+        accepted[coding.strip().lower()] = quality
+
+    # The highest quality wins, and ties are decided by the order of preference
+    candidates = [
+        (accepted.get(e, accepted.get('*', 0)), -i, e)
+        for i, e in enumerate(available_encodings())
+    ]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+
+def compress(encoding, content):
+    """Compress a whole response body"""
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=settings.COMPRESSION_LEVELS['zstd']).compress(content)
+    elif encoding == 'br':
+        return brotli.compress(content, quality=settings.COMPRESSION_LEVELS['br'])
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_LEVELS['gzip'])
+
+
+def compress_stream(encoding, chunks):
+    """Compress a streamed response body, flushing after each chunk so the client can decode it as it arrives"""
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=settings.COMPRESSION_LEVELS['zstd']).compressobj()
+        process = compressor.compress
+        flush = lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        finish = compressor.flush
+    elif encoding == 'br':
+        compressor = brotli.Compressor(quality=settings.COMPRESSION_LEVELS['br'])
+        process = compressor.process
+        flush = compressor.flush
+        finish = compressor.finish
+    else:
+        # A wbits of 31 writes the gzip header and trailer
+        compressor = zlib.compressobj(settings.COMPRESSION_LEVELS['gzip'], zlib.DEFLATED, 31)
+        process = compressor.compress
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+
+    for chunk in chunks:
+        data = process(chunk) + flush()
+        if data:
+            yield data
+
+    yield finish()
+
+
+class CompressionMiddleware:
+    """Compress responses with the best encoding the client accepts, from zstd, brotli and gzip"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        # Only text-based responses are worth compressing
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if not (content_type.startswith('text/') or content_type.endswith('json')):
+            return response
+
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(encoding, response.streaming_content)
+            del response['Content-Length']
+        else:
+            compressed = compress(encoding, response.content)
+
+            # Leave responses that do not get any smaller alone
+            if len(compressed) >= len(response.content):
+                return response
+
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # Only the coding changes, so an ETag naming the version of a row is left strong for If-Match to compare
+        response['Content-Encoding'] = encoding
+        return response
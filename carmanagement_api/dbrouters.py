@@ -0,0 +1,225 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, DatabaseError
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework.throttling import BaseThrottle
+
+
+_state = threading.local()
+
+# The time each replica's lag was last checked and whether it was within the limit
+_replica_health = {}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+@contextmanager
+def use_primary():
+    """Send every read made inside the block to the primary database"""
+    _state.primary = getattr(_state, 'primary', 0) + 1
+    try:
+        yield
+    finally:
+        _state.primary -= 1
+
+
+@contextmanager
+def use_region(region):
+    """Send every query for fleet data made inside the block to the database of a region"""
+    previous = getattr(_state, 'region', None)
+    _state.region = region
+    try:
+        yield
+    finally:
+        _state.region = previous
+
+
+def current_region():
+    """Return the region whose fleet data is being used, or None if the default database is being used"""
+    # Outside of a request, such as in management commands, DEFAULT_REGION is used
+    return getattr(_state, 'region', None) or settings.DEFAULT_REGION
+
+
+def fleet_database():
+    """Return the alias of the database holding the fleet data of the current region"""
+    return settings.DATABASE_REGIONS.get(current_region(), 'default')
+
+
+def replica_lag(alias):
+    """Return how many seconds a replica is behind the primary, based on the heartbeat it last received"""
+    from carmanagement_api.models import ReplicationHeartbeat
+
+    try:
+        heartbeat = ReplicationHeartbeat.objects.using(alias).values_list('updated_at', flat=True).first()
+    except DatabaseError:
+        heartbeat = None
+
+    if heartbeat is None:
+        return float('inf')
+
+    return (timezone.now() - heartbeat).total_seconds()
+
+
+def healthy_replicas():
+    """Return the replicas whose lag is within REPLICA_MAX_LAG, checking each at most every REPLICA_LAG_CHECK_INTERVAL"""
+    now = time.monotonic()
+    healthy = []
+
+    for alias in settings.DATABASE_REPLICAS:
+        checked, ok = _replica_health.get(alias, (None, False))
+
+        if checked is None or now - checked > settings.REPLICA_LAG_CHECK_INTERVAL:
+            ok = replica_lag(alias) <= settings.REPLICA_MAX_LAG
+            _replica_health[alias] = (now, ok)
+
+        if ok:
+            healthy.append(alias)
+
+    return healthy
+
+
+class RegionRouter:
+    """Send queries for fleet data to the database of the current region"""
+
+    # Models that are stored once for every region rather than in each region's database
+    SHARED_MODELS = ('replicationheartbeat', 'tokenrevocation')
+
+    def is_fleet_model(self, model):
+        """Return whether a model holds fleet data, which is split between the regions"""
+        return model._meta.app_label == 'carmanagement_api' and model._meta.model_name not in self.SHARED_MODELS
+
+    def db_for_read(self, model, **hints):
+        """Use the current region's database, leaving other models to the next router"""
+        if self.is_fleet_model(model) and current_region() is not None:
+            return fleet_database()
+        return None
+
+    def db_for_write(self, model, **hints):
+        """Use the current region's database, leaving other models to the next router"""
+        return self.db_for_read(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Fleet data in different regions cannot be related"""
+        regional = set(settings.DATABASE_REGIONS.values())
+        databases = {obj1._state.db, obj2._state.db}
+
+        if self.is_fleet_model(type(obj1)) and self.is_fleet_model(type(obj2)) and databases & regional:
+            return len(databases) == 1
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Every region's database has the full schema, so leave this to the next router"""
+        return None
+
+
+class ReplicaRouter:
+    """Send reads to a read replica and writes to the primary database"""
+
+    def db_for_read(self, model, **hints):
+        """Use a replica unless the read must see the latest writes"""
+        if getattr(_state, 'primary', 0) or connections['default'].in_atomic_block:
+            return 'default'
+
+        replicas = healthy_replicas()
+        return random.choice(replicas) if replicas else 'default'
+
+    def db_for_write(self, model, **hints):
+        """Always write to the primary"""
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Every database holds the same data, so objects can always be related"""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Replicas receive their schema from the primary"""
+        return db not in settings.DATABASE_REPLICAS
+
+
+def client_ident(request):
+    """Identify a client by its address, in the same way as the rate limiter"""
+    return BaseThrottle().get_ident(request)
+
+
+class ReplicaRoutingMiddleware:
+    """Send every read of a request to the primary if it or a recent request from the same client was a write"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        cache = caches[settings.REPLICA_STICKY_CACHE]
+        key = f'replica:sticky:{client_ident(request)}'
+        write = request.method not in SAFE_METHODS
+
+        if write or cache.get(key):
+            with use_primary():
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+
+        # Clients read their own writes until the replicas have had time to catch up
+        if write:
+            cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+
+        return response
+
+
+def region_from_host(host):
+    """Return the region named by the first part of a host name such as north.example.com, or None"""
+    subdomain = host.split(':')[0].split('.')[0].lower()
+    return subdomain if subdomain in settings.DATABASE_REGIONS else None
+
+
+class RegionMiddleware:
+    """Serve each request from the database of the region given by the X-Region header or the subdomain"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REGIONS:
+            return self.get_response(request)
+
+        region = request.META.get('HTTP_X_REGION')
+
+        if region is not None and region not in settings.DATABASE_REGIONS:
+            return JsonResponse({'error': f'{region} is not a known region.'}, status=400)
+
+        region = region or region_from_host(request.META.get('HTTP_HOST', '')) or settings.DEFAULT_REGION
+
+        with use_region(region):
+            return self.get_response(request)
+
+
+def fan_out(function):
+    """Call a function once for each region in parallel, returning a dict of each region's result
+
+    When there are no regions the function is called once for the default database, under the name 'default'.
+    """
+    if not settings.DATABASE_REGIONS:
+        return {'default': function()}
+
+    def run(region):
+        with use_region(region):
+            try:
+                return function()
+            finally:
+                # Each thread has its own connections, which would otherwise be left open
+                connections.close_all()
+
+    regions = sorted(settings.DATABASE_REGIONS)
+    workers = max(1, min(settings.REGION_FAN_OUT_WORKERS, len(regions)))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(regions, pool.map(run, regions)))
@@ -0,0 +1,133 @@
+import csv
+import math
+
+from django.conf import settings
+
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0
+GEOHASH_PRECISION = 9
+
+# Cells of this precision are roughly 5km across, which is where nearest branch searches start
+SEARCH_PRECISION = 5
+
+
+class PostcodeLookupError(Exception):
+    """Raised when the postcode service could not be reached or returned an error"""
+
+
+def normalise_postcode(postcode):
+    """Return a postcode in upper case with no spaces so it can be used as a key"""
+    return postcode.replace(' ', '').upper()
+
+
+_offline_postcodes = None
+
+
+def get_offline_postcodes():
+    """Load the offline postcode dataset, a CSV file with postcode, latitude and longitude columns"""
+    global _offline_postcodes
+
+    if _offline_postcodes is None:
+        _offline_postcodes = {}
+        path = getattr(settings, 'POSTCODE_DATASET', None)
+
+        if path:
+            with open(path, newline='') as f:
+                for row in csv.DictReader(f):
+                    _offline_postcodes[normalise_postcode(row['postcode'])] = (
+                        float(row['latitude']),
+                        float(row['longitude'])
+                    )
+
+    return _offline_postcodes
+
+
+def lookup_postcode(postcode):
+    """Return the (latitude, longitude) of a postcode, or None if the postcode is invalid"""
+    offline = get_offline_postcodes()
+    if normalise_postcode(postcode) in offline:
+        return offline[normalise_postcode(postcode)]
+
+    # requests is slow to import and only needed when a branch is created, so it is imported here
+    import requests
+
+    try:
+        response_json = requests.get(f'https://api.postcodes.io/postcodes/{postcode}', timeout=5).json()
+    except (requests.RequestException, ValueError) as e:
+        raise PostcodeLookupError(str(e))
+
+    if response_json['status'] == 200:
+        return (response_json['result']['latitude'], response_json['result']['longitude'])
+    elif response_json['status'] == 404:
+        return None
+    else:
+        raise PostcodeLookupError(response_json.get('error'))
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash, where nearby points share a common prefix"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = ''
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(geohash) < precision:
+        # Bits alternate between halving the longitude and latitude ranges
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+
+        if value >= mid:
+            bits = bits * 2 + 1
+            value_range[0] = mid
+        else:
+            bits = bits * 2
+            value_range[1] = mid
+
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            geohash += BASE32[bits]
+            bits = 0
+            bit_count = 0
+
+    return geohash
+
+
+def cell_size(precision):
+    """Return the (height, width) in degrees of a geohash cell of the given precision"""
+    lat_bits = (5 * precision) // 2
+    lon_bits = 5 * precision - lat_bits
+    return (180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits)
+
+
+def neighbourhood(latitude, longitude, precision):
+    """Return the geohash of the cell containing a point and of the eight cells around it"""
+    height, width = cell_size(precision)
+    cells = set()
+
+    for d_lat in (-height, 0, height):
+        for d_lon in (-width, 0, width):
+            lat = max(-90.0, min(90.0, latitude + d_lat))
+            lon = (longitude + d_lon + 180.0) % 360.0 - 180.0
+            cells.add(encode_geohash(lat, lon, precision))
+
+    return cells
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Return the great-circle distance between two points in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def covered_radius_km(latitude, precision):
+    """Return the distance from a point within which every branch is inside its 3x3 neighbourhood of cells"""
+    height, width = cell_size(precision)
+    widest_lat = min(90.0, abs(latitude) + height)
+    return min(height * 111.0, width * 111.0 * math.cos(math.radians(widest_lat)))
+
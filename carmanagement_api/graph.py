@@ -0,0 +1,305 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+from graphql import (
+    GraphQLArgument, GraphQLError, GraphQLField, GraphQLFloat, GraphQLID, GraphQLInt, GraphQLList, GraphQLNonNull,
+    GraphQLObjectType, GraphQLSchema, GraphQLString, FieldNode, FragmentDefinitionNode, FragmentSpreadNode,
+    IntValueNode, OperationDefinitionNode, OperationType, VariableNode, execute, get_named_type,
+    get_nullable_type, parse, validate
+)
+
+from carmanagement_api import models
+
+
+class DataLoader:
+    """Load values by key for a whole batch of keys at once, caching each value for the rest of the request
+
+    A relation of a row is loaded along with the same relation of every row listed beside it, so a nested query
+    makes one query for each level of relations however many rows each level has.
+    """
+
+    def __init__(self, batch_load, default=None):
+        self.batch_load = batch_load
+        self.default = default
+        self.cache = {}
+
+    def load(self, key, batch_keys):
+        """Return the value of a key, loading it with the keys of the rest of its batch if it is not cached"""
+        if key is None:
+            return self.default
+
+        if key not in self.cache:
+            keys = {key} | {k for k in batch_keys if k is not None and k not in self.cache}
+            found = self.batch_load(keys)
+
+            loaded = []
+            for k in keys:
+                value = found.get(k, self.default)
+                self.cache[k] = value
+                loaded.extend(value if isinstance(value, list) else [value] if value is not None else [])
+
+            # The rows loaded together are the batch their own relations are loaded in
+            batch(loaded)
+
+        return self.cache[key]
+
+
+def batch(rows):
+    """Mark rows as being listed together, so their relations are loaded together"""
+    for row in rows:
+        row._graph_batch = rows
+    return rows
+
+
+def batch_of(row):
+    """Return the rows listed with a row"""
+    return getattr(row, '_graph_batch', [row])
+
+
+def by_id(model):
+    """Return a batch loader of rows of a model by their ids"""
+    return lambda ids: model.objects.in_bulk(list(ids))
+
+
+def cars_by(inventory, field):
+    """Return a batch loader of the lists of cars held in an inventory by each branch or driver id"""
+    def load(ids):
+        cars = defaultdict(list)
+        for row in inventory.objects.filter(**{f'{field}__in': ids}).select_related('car').order_by('car'):
+            cars[getattr(row, f'{field}_id')].append(row.car)
+        return cars
+    return load
+
+
+class Loaders:
+    """The data loaders of one request, which is the context every resolver is given"""
+
+    def __init__(self):
+        self.branches = DataLoader(by_id(models.Branch))
+        self.drivers = DataLoader(by_id(models.Driver))
+        self.branch_cars = DataLoader(cars_by(models.BranchInventory, 'branch'), default=[])
+        self.driver_cars = DataLoader(cars_by(models.DriverInventory, 'driver'), default=[])
+
+
+def relation(loader_name, key_name):
+    """Return a resolver that loads a relation of a row through a data loader, keyed by one of its fields"""
+    def resolve(row, info):
+        loader = getattr(info.context, loader_name)
+        return loader.load(getattr(row, key_name), [getattr(r, key_name) for r in batch_of(row)])
+    return resolve
+
+
+# Rows in a page of a root list when no limit, or a null limit, is given
+DEFAULT_LIMIT = 100
+
+# Ids are stored as signed 64 bit integers
+MAX_ID = 2 ** 63 - 1
+
+
+def page_arguments(search):
+    """Return the arguments of a root list, which can be searched and paged"""
+    return {
+        'search': GraphQLArgument(GraphQLString, description=search),
+        'limit': GraphQLArgument(GraphQLInt, default_value=DEFAULT_LIMIT),
+        'offset': GraphQLArgument(GraphQLInt, default_value=0),
+    }
+
+
+def page(queryset, search_fields, search=None, limit=DEFAULT_LIMIT, offset=0):
+    """Return a page of rows, matching the search in any of the given fields"""
+    # Arguments given as null are the same as arguments left out
+    limit = DEFAULT_LIMIT if limit is None else limit
+    offset = offset or 0
+
+    if not 0 < limit <= settings.GRAPHQL_MAX_LIMIT:
+        raise GraphQLError(f'limit must be between 1 and {settings.GRAPHQL_MAX_LIMIT}.')
+    if offset < 0:
+        raise GraphQLError('offset cannot be negative.')
+
+    if search is not None:
+        condition = Q()
+        for field in search_fields:
+            condition |= Q(**{f'{field}__icontains': search})
+        queryset = queryset.filter(condition)
+
+    return batch(list(queryset.order_by('id')[offset:offset + limit]))
+
+
+def parse_id(value):
+    """Return an id given as a string, or raise a GraphQLError if it is not a number that could be an id"""
+    if not value.isdigit() or int(value) > MAX_ID:
+        raise GraphQLError(f'{value!r} is not an id, ids are whole numbers.')
+    return int(value)
+
+
+def single(model):
+    """Return a resolver of one row of a model by its id"""
+    def resolve(root, info, id):
+        rows = batch(list(model.objects.filter(pk=parse_id(id))))
+        return rows[0] if rows else None
+    return resolve
+
+
+CarType = GraphQLObjectType('Car', lambda: {
+    'id': GraphQLField(GraphQLNonNull(GraphQLID)),
+    'make': GraphQLField(GraphQLNonNull(GraphQLString)),
+    'model': GraphQLField(GraphQLNonNull(GraphQLString)),
+    'year_of_manufacture': GraphQLField(GraphQLNonNull(GraphQLInt)),
+    'branch': GraphQLField(BranchType, resolve=relation('branches', 'current_branch_id'),
+                           description='The branch the car is at'),
+    'driver': GraphQLField(DriverType, resolve=relation('drivers', 'current_driver_id'),
+                           description='The driver renting the car'),
+})
+
+BranchType = GraphQLObjectType('Branch', lambda: {
+    'id': GraphQLField(GraphQLNonNull(GraphQLID)),
+    'city': GraphQLField(GraphQLNonNull(GraphQLString)),
+    'postcode': GraphQLField(GraphQLNonNull(GraphQLString)),
+    'capacity': GraphQLField(GraphQLNonNull(GraphQLInt)),
+    'latitude': GraphQLField(GraphQLFloat),
+    'longitude': GraphQLField(GraphQLFloat),
+    'cars': GraphQLField(GraphQLNonNull(GraphQLList(GraphQLNonNull(CarType))), resolve=relation('branch_cars', 'id'),
+                         description='The cars at the branch'),
+})
+
+DriverType = GraphQLObjectType('Driver', lambda: {
+    'id': GraphQLField(GraphQLNonNull(GraphQLID)),
+    'first_name': GraphQLField(GraphQLNonNull(GraphQLString)),
+    'middle_names': GraphQLField(GraphQLString),
+    'last_name': GraphQLField(GraphQLNonNull(GraphQLString)),
+    'date_of_birth': GraphQLField(GraphQLNonNull(GraphQLString),
+                                  resolve=lambda driver, info: driver.date_of_birth.isoformat()),
+    'cars': GraphQLField(GraphQLNonNull(GraphQLList(GraphQLNonNull(CarType))), resolve=relation('driver_cars', 'id'),
+                         description='The cars the driver is renting'),
+})
+
+QueryType = GraphQLObjectType('Query', {
+    'cars': GraphQLField(
+        GraphQLNonNull(GraphQLList(GraphQLNonNull(CarType))),
+        args=page_arguments('Part of the make, model or year of manufacture'),
+        resolve=lambda root, info, **kwargs: page(
+            models.Car.objects.all(), ('make', 'model', 'year_of_manufacture'), **kwargs
+        )
+    ),
+    'car': GraphQLField(CarType, args={'id': GraphQLArgument(GraphQLNonNull(GraphQLID))}, resolve=single(models.Car)),
+    'branches': GraphQLField(
+        GraphQLNonNull(GraphQLList(GraphQLNonNull(BranchType))),
+        args=page_arguments('Part of the city or postcode'),
+        resolve=lambda root, info, **kwargs: page(models.Branch.objects.all(), ('city', 'postcode'), **kwargs)
+    ),
+    'branch': GraphQLField(
+        BranchType, args={'id': GraphQLArgument(GraphQLNonNull(GraphQLID))}, resolve=single(models.Branch)
+    ),
+    'drivers': GraphQLField(
+        GraphQLNonNull(GraphQLList(GraphQLNonNull(DriverType))),
+        args=page_arguments('Part of the first or last name'),
+        resolve=lambda root, info, **kwargs: page(models.Driver.objects.all(), ('first_name', 'last_name'), **kwargs)
+    ),
+    'driver': GraphQLField(
+        DriverType, args={'id': GraphQLArgument(GraphQLNonNull(GraphQLID))}, resolve=single(models.Driver)
+    ),
+})
+
+# Only reads are offered, so the schema has no mutations
+SCHEMA = GraphQLSchema(query=QueryType)
+
+
+def list_size(field_node, field, variables):
+    """Return the most rows a list field could return"""
+    if 'limit' not in field.args:
+        return settings.GRAPHQL_LIST_ESTIMATE
+
+    limit = field.args['limit'].default_value
+    for argument in field_node.arguments:
+        if argument.name.value == 'limit':
+            if isinstance(argument.value, IntValueNode):
+                limit = int(argument.value.value)
+            elif isinstance(argument.value, VariableNode):
+                limit = variables.get(argument.value.name.value, limit)
+
+    if limit is None:
+        return DEFAULT_LIMIT
+    return limit if isinstance(limit, int) else settings.GRAPHQL_MAX_LIMIT
+
+
+def estimate(selection_set, parent_type, fragments, variables, depth=1):
+    """Return the most rows a selection could load and how deeply it nests relations"""
+    cost, deepest = 0, depth - 1
+
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            # Scalars come with the row they belong to, and introspection does not touch the database
+            if selection.selection_set is None or selection.name.value.startswith('__'):
+                continue
+
+            field = parent_type.fields[selection.name.value]
+            field_type = get_nullable_type(field.type)
+            size = list_size(selection, field, variables) if isinstance(field_type, GraphQLList) else 1
+
+            child_cost, child_depth = estimate(
+                selection.selection_set, get_named_type(field_type), fragments, variables, depth + 1
+            )
+            cost += size * (1 + child_cost)
+            deepest = max(deepest, child_depth)
+        else:
+            if isinstance(selection, FragmentSpreadNode):
+                fragment = fragments[selection.name.value]
+            else:
+                fragment = selection
+
+            fragment_type = SCHEMA.get_type(fragment.type_condition.name.value) if fragment.type_condition else parent_type
+            child_cost, child_depth = estimate(fragment.selection_set, fragment_type, fragments, variables, depth)
+            cost += child_cost
+            deepest = max(deepest, child_depth)
+
+    return cost, deepest
+
+
+def check_limits(document, variables):
+    """Return errors for any operation that is not a query, nests too deeply or could load too many rows"""
+    fragments = {d.name.value: d for d in document.definitions if isinstance(d, FragmentDefinitionNode)}
+    errors = []
+
+    for operation in document.definitions:
+        if not isinstance(operation, OperationDefinitionNode):
+            continue
+
+        if operation.operation != OperationType.QUERY:
+            errors.append(GraphQLError('Only queries can be run, the fleet is changed through the REST API.', operation))
+            continue
+
+        cost, depth = estimate(operation.selection_set, QueryType, fragments, variables)
+        if depth > settings.GRAPHQL_MAX_DEPTH:
+            errors.append(GraphQLError(
+                f'The query nests {depth} levels deep, but at most {settings.GRAPHQL_MAX_DEPTH} are allowed.', operation
+            ))
+        if cost > settings.GRAPHQL_MAX_COST:
+            errors.append(GraphQLError(
+                f'The query could load {cost} rows, but at most {settings.GRAPHQL_MAX_COST} are allowed.', operation
+            ))
+
+    return errors
+
+
+def run_query(query, variables=None, operation_name=None):
+    """Run a query, returning its result as JSON and the status of the response"""
+    variables = variables or {}
+
+    try:
+        document = parse(query)
+    except GraphQLError as e:
+        return {'errors': [e.formatted]}, 400
+
+    errors = validate(SCHEMA, document) or check_limits(document, variables)
+    if errors:
+        return {'errors': [e.formatted for e in errors]}, 400
+
+    result = execute(
+        SCHEMA, document, context_value=Loaders(), variable_values=variables, operation_name=operation_name
+    )
+
+    response = {'data': result.data}
+    if result.errors:
+        response['errors'] = [e.formatted for e in result.errors]
+    return response, 200
@@ -0,0 +1,95 @@
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+from rest_framework import status
+
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+IN_PROGRESS = 'in-progress'
+
+
+def get_store():
+    """Return the cache used to hold idempotency keys and their stored responses"""
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE', 'default')]
+
+
+def fingerprint(request):
+    """Return a short hash of the request body so a reused key with a different payload can be rejected"""
+    data = request.data
+    # Form bodies can repeat a field, so every value of each field is included
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+
+
+def caller(request):
+    """Return who sent a request, which is the authenticated user or else the client address the rate limiter uses"""
+    if request.user and request.user.is_authenticated:
+        return f'user-{request.user.pk}'
+    return f'anon-{BaseThrottle().get_ident(request)}'
+
+
+def idempotent(view_method):
+    """Replay the stored response for a retried request that carries the same Idempotency-Key header"""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+
+        # Requests without a key are processed as normal
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        store = get_store()
+        ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+        wait = getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 5)
+        # Keys are chosen by clients, so each caller has their own keys and can never be replayed another's response
+        cache_key = f'idempotency:{caller(request)}:{request.path}:{key}'
+        request_hash = fingerprint(request)
+
+        # Claim the key atomically, only one request with a given key will succeed. The claim lasts as long as the key,
+        # so a slow request cannot lose it to a retry, and is released as soon as the request fails
+        if store.add(cache_key, (IN_PROGRESS, request_hash), ttl):
+            stored = False
+            try:
+                response = view_method(self, request, *args, **kwargs)
+
+                # Only store responses which the client should not retry with a different outcome
+                if response.status_code < 500:
+                    store.set(cache_key, (request_hash, response.status_code, response.data), ttl)
+                    stored = True
+            finally:
+                if not stored:
+                    store.delete(cache_key)
+
+            return response
+
+        # The key has already been claimed, wait for the original request to finish if it is still running
+        deadline = time.monotonic() + wait
+        stored = store.get(cache_key)
+        while stored is not None and stored[0] == IN_PROGRESS and time.monotonic() < deadline:
+            time.sleep(0.05)
+            stored = store.get(cache_key)
+
+        if stored is None:
+            # The original request failed and released the key, so process this one instead
+            return wrapper(self, request, *args, **kwargs)
+        elif stored[0] == IN_PROGRESS:
+            return Response({'error': 'A request with this Idempotency-Key is still being processed.'}, status.HTTP_409_CONFLICT)
+
+        stored_hash, status_code, data = stored
+        if stored_hash != request_hash:
+            return Response({'error': 'This Idempotency-Key has already been used with a different request.'}, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        response = Response(data, status_code)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    return wrapper
@@ -0,0 +1,37 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from carmanagement_api import rebalancing
+
+
+class Command(BaseCommand):
+    """Measure how long planning a rebalancing of a large number of branches takes"""
+    help = 'Benchmark planning transfers between randomly filled branches spread across Great Britain'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branches', type=int, default=5000)
+        parser.add_argument('--fill', type=float, default=0.8)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        branches = []
+
+        for i in range(options['branches']):
+            capacity = rng.randint(5, 40)
+            branches.append(rebalancing.BranchState(
+                i, rng.uniform(50.0, 58.5), rng.uniform(-5.5, 1.7), rng.randint(0, capacity), capacity
+            ))
+
+        started = time.perf_counter()
+        transfers = rebalancing.plan(branches, options['fill'])
+        elapsed = time.perf_counter() - started
+
+        cars = sum(t.count for t in transfers)
+        distance = sum(t.count * t.distance_km for t in transfers)
+        self.stdout.write(
+            f'Planned {len(transfers)} transfers of {cars} cars between {len(branches)} branches in {elapsed:.3f}s '
+            f'({distance / max(cars, 1):.1f}km per car on average)'
+        )
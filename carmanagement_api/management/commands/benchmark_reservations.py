@@ -0,0 +1,75 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from carmanagement_api import scheduling
+
+
+class Command(BaseCommand):
+    """Measure the reservation index with a large number of overlapping reservations"""
+    help = 'Benchmark adding, checking and searching reservations in the in-memory reservation index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reservations', type=int, default=100000)
+        parser.add_argument('--cars', type=int, default=5000)
+        parser.add_argument('--branches', type=int, default=100)
+        parser.add_argument('--queries', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        scheduler = scheduling.Scheduler()
+        cars = options['cars']
+        branches = options['branches']
+        day = 24 * 60 * 60
+
+        # Each car starts at a branch, and its reservations follow on from each other between branches
+        location = {car_id: rng.randrange(branches) for car_id in range(cars)}
+        next_free = {car_id: rng.randrange(day) for car_id in range(cars)}
+
+        bookings = []
+        for i in range(options['reservations']):
+            car_id = rng.randrange(cars)
+            start = next_free[car_id] + rng.randrange(day)
+            end = start + rng.randrange(3600, 3 * day)
+            return_branch_id = rng.randrange(branches)
+            bookings.append(scheduling.Booking(i, car_id, location[car_id], return_branch_id, start, end))
+            location[car_id] = return_branch_id
+            next_free[car_id] = end
+
+        horizon = max(b.end for b in bookings)
+
+        # Insert in a random order so that reservations are not simply appended
+        rng.shuffle(bookings)
+
+        started = time.perf_counter()
+        for booking in bookings:
+            scheduler.add(booking)
+        elapsed = time.perf_counter() - started
+        self.report('add', len(bookings), elapsed)
+
+        started = time.perf_counter()
+        for _ in range(options['queries']):
+            car_id = rng.randrange(cars)
+            start = rng.randrange(horizon)
+            scheduler.cars[car_id].conflict(start, start + day)
+        self.report('conflict check', options['queries'], time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(options['queries']):
+            tree = scheduler.occupancy[rng.randrange(branches)]
+            tree.peak(0, rng.randrange(horizon) // scheduling.SLOT_SECONDS)
+        self.report('capacity check', options['queries'], time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(options['queries'] // 10):
+            branch_id = rng.randrange(branches)
+            start = rng.randrange(horizon)
+            candidates = {car_id: None for car_id in scheduler.arrivals[branch_id]}
+            scheduler.free_cars(branch_id, start, start + day, candidates)
+        self.report('free cars search', options['queries'] // 10, time.perf_counter() - started)
+
+    def report(self, name, count, elapsed):
+        """Write the rate and the average time of an operation"""
+        self.stdout.write(f'{name}: {count} in {elapsed:.3f}s ({count / elapsed:,.0f}/s, {elapsed / count * 1e6:.1f}us each)')
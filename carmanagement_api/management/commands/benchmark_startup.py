@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Run in a fresh interpreter for each measurement so that nothing has been imported yet
+WORKER = '''
+import json, os, resource, sys, time
+started = time.perf_counter()
+os.environ["DJANGO_SETTINGS_MODULE"] = sys.argv[1]
+
+from carmanagement_project.wsgi import application
+booted = time.perf_counter()
+
+from wsgiref.util import setup_testing_defaults
+environ = {}
+setup_testing_defaults(environ)
+environ["PATH_INFO"] = sys.argv[2]
+statuses = []
+b"".join(application(environ, lambda status, headers: statuses.append(status)))
+responded = time.perf_counter()
+
+print(json.dumps({
+    "boot_ms": (booted - started) * 1000,
+    "first_request_ms": (responded - booted) * 1000,
+    "time_to_first_request_ms": (responded - started) * 1000,
+    "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "status": statuses[0],
+}))
+'''
+
+
+class Command(BaseCommand):
+    """Compare how quickly a worker boots and serves its first request under each settings module"""
+    help = 'Measure worker boot time, time to first request and peak memory for each settings module'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settings-modules',
+            nargs='+',
+            default=['carmanagement_project.settings', 'carmanagement_project.settings_api']
+        )
+        parser.add_argument('--path', default='/api/')
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        for module in options['settings_modules']:
+            results = [self.run_worker(module, options['path']) for _ in range(options['runs'])]
+
+            self.stdout.write(module)
+            for key in ('boot_ms', 'first_request_ms', 'time_to_first_request_ms', 'rss_kb'):
+                values = sorted(r[key] for r in results)
+                self.stdout.write(f'  {key}: median {values[len(values) // 2]:.1f}, min {values[0]:.1f}, max {values[-1]:.1f}')
+            self.stdout.write(f'  status: {results[-1]["status"]}')
+
+    def run_worker(self, module, path):
+        """Start a worker in a new process and return its measurements"""
+        env = dict(os.environ, PYTHONPATH=settings.BASE_DIR)
+        output = subprocess.run(
+            [sys.executable, '-c', WORKER, module, path],
+            stdout=subprocess.PIPE,
+            check=True,
+            cwd=settings.BASE_DIR,
+            env=env
+        ).stdout
+
+        return json.loads(output.decode().strip().splitlines()[-1])
@@ -0,0 +1,65 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from carmanagement_api import models
+from carmanagement_api import telemetry
+
+
+class Command(BaseCommand):
+    """Measure the sustained rate at which telemetry readings can be received and written"""
+    help = ('Benchmark sending batches of telemetry readings from a fleet of cars for a number of seconds, '
+            'using temporary cars that are deleted along with their readings afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cars', type=int, default=1000)
+        parser.add_argument('--seconds', type=float, default=10.0)
+        parser.add_argument('--batch', type=int, default=100, help='Number of readings sent in each request')
+        parser.add_argument('--flush-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        cars = models.Car.objects.bulk_create(
+            models.Car(make='Benchmark', model='Telemetry', year_of_manufacture=2020) for _ in range(options['cars'])
+        )
+        car_ids = list(models.Car.objects.filter(make='Benchmark', model='Telemetry').values_list('pk', flat=True))
+
+        odometer = {car_id: rng.uniform(0, 100000) for car_id in car_ids}
+        now = timezone.now().timestamp()
+        sent = 0
+
+        try:
+            # Without the background thread, writes happen in the request that fills the buffer so they are timed
+            with override_settings(TELEMETRY_FLUSH_INTERVAL=0, TELEMETRY_FLUSH_SIZE=options['flush_size']):
+                started = time.perf_counter()
+
+                while time.perf_counter() - started < options['seconds']:
+                    batch = []
+                    for _ in range(options['batch']):
+                        car_id = rng.choice(car_ids)
+                        odometer[car_id] += rng.uniform(0, 0.2)
+                        now += 0.001
+                        batch.append({
+                            'car': car_id,
+                            'time': now,
+                            'odometer_km': odometer[car_id],
+                            'fuel_level': rng.random(),
+                            'latitude': rng.uniform(50.0, 58.5),
+                            'longitude': rng.uniform(-5.5, 1.7),
+                        })
+
+                    accepted, errors = telemetry.ingest(batch)
+                    sent += accepted
+
+                telemetry.buffer.flush()
+                elapsed = time.perf_counter() - started
+        finally:
+            models.Car.objects.filter(pk__in=car_ids).delete()
+
+        self.stdout.write(
+            f'Wrote {sent} readings from {len(cars)} cars in {elapsed:.2f}s ({sent / elapsed:.0f} readings per second)'
+        )
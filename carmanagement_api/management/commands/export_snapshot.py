@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from carmanagement_api import snapshots
+
+
+class Command(BaseCommand):
+    """Export a columnar snapshot of the fleet for analytics"""
+    help = ('Export the branches, drivers and cars of the fleet to EXPORT_DIR as Parquet files, or gzipped columnar '
+            'JSON lines if pyarrow is not installed, writing only the rows changed since the previous export')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Write every row instead of the changes')
+        parser.add_argument('--format', choices=sorted(snapshots.WRITERS), default=None)
+
+    def handle(self, *args, **options):
+        try:
+            manifest = snapshots.export_snapshot(full=options['full'], fmt=options['format'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        kind = f'changes since {manifest["base"]}' if manifest['base'] else 'full'
+        self.stdout.write(f'Exported {manifest["id"]} ({kind}, {manifest["format"]}) to {snapshots.export_path(manifest["id"])}')
+        for name, counts in manifest['tables'].items():
+            self.stdout.write(f'  {name}: {counts["changed"]} of {counts["rows"]} rows written, {counts["deleted"]} deleted')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from carmanagement_api import models
+from carmanagement_api import geo
+
+
+class Command(BaseCommand):
+    """Look up the coordinates of branches that were created before they were stored"""
+    help = 'Resolve the latitude and longitude of every branch without coordinates from its postcode'
+
+    def handle(self, *args, **options):
+        resolved = 0
+        branches = models.Branch.objects.filter(geohash=None)
+
+        for branch in branches.iterator():
+            try:
+                coordinates = geo.lookup_postcode(branch.postcode)
+            except geo.PostcodeLookupError as e:
+                self.stderr.write(f'Could not look up {branch}: {e}')
+                continue
+
+            if coordinates is None:
+                self.stderr.write(f'{branch} has an invalid postcode')
+                continue
+
+            branch.latitude, branch.longitude = coordinates
+            branch.save(update_fields=['latitude', 'longitude', 'geohash'])
+            resolved += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Resolved the coordinates of {resolved} branches.'))
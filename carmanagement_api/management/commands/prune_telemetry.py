@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from carmanagement_api import telemetry
+
+
+class Command(BaseCommand):
+    """Drop telemetry readings that are older than the retention period"""
+    help = 'Drop the days of telemetry readings older than TELEMETRY_RETENTION_DAYS, keeping the latest reading of each car'
+
+    def handle(self, *args, **options):
+        count = telemetry.prune()
+        self.stdout.write(f'Dropped {count} readings older than {settings.TELEMETRY_RETENTION_DAYS} days.')
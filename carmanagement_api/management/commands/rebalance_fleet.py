@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from carmanagement_api import services
+
+
+class Command(BaseCommand):
+    """Plan, and optionally make, moves of cars that even out how full the branches are"""
+    help = 'Plan the transfers of cars that fill every branch to a fraction of its capacity, and make them with --execute'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fill', type=float, default=getattr(settings, 'REBALANCE_TARGET_FILL', 0.8))
+        parser.add_argument('--execute', action='store_true', help='Move the cars as planned')
+
+    def handle(self, *args, **options):
+        transfers = services.plan_rebalancing(options['fill'])
+
+        for t in transfers:
+            self.stdout.write(f'Move {t.count} from branch {t.from_branch_id} to branch {t.to_branch_id} ({t.distance_km}km)')
+
+        cars = sum(t.count for t in transfers)
+        distance = sum(t.count * t.distance_km for t in transfers)
+        self.stdout.write(f'{len(transfers)} transfers of {cars} cars over {distance:.1f}km in total.')
+
+        if options['execute']:
+            moves = services.rebalance_fleet(transfers)
+            self.stdout.write(self.style.SUCCESS(f'Moved {len(moves)} of {cars} cars.'))
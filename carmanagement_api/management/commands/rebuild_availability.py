@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from carmanagement_api import models
+from carmanagement_api import services
+
+
+class Command(BaseCommand):
+    """Rebuild the branch availability counts from the inventory tables"""
+    help = 'Recount the cars available at each branch, repairing any drift in the availability counts'
+
+    def handle(self, *args, **options):
+        services.rebuild_availability()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {models.BranchAvailability.objects.count()} availability counts.'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from carmanagement_api import models
+from carmanagement_api import services
+
+
+class Command(BaseCommand):
+    """Rebuild the car listing rows from the cars and their locations"""
+    help = 'Rewrite the listing row of every car, repairing any that have drifted from the cars, branches and drivers'
+
+    def handle(self, *args, **options):
+        services.rebuild_car_listings()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {models.CarListing.objects.count()} car listings.'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from carmanagement_api import models
+from carmanagement_api import services
+
+
+class Command(BaseCommand):
+    """Rebuild the driver search index from the drivers' names"""
+    help = 'Rewrite the name tokens used to search for drivers, repairing any that have drifted from their names'
+
+    def handle(self, *args, **options):
+        services.rebuild_driver_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {models.DriverNameToken.objects.count()} name tokens.'
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from carmanagement_api import models
+
+
+class Command(BaseCommand):
+    """Write a heartbeat to the primary database which replicas use to measure their lag"""
+    help = 'Update the replication heartbeat every interval seconds, used to check how far behind each replica is'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true', help='Write a single heartbeat and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            models.ReplicationHeartbeat.objects.update_or_create(pk=1, defaults={'updated_at': timezone.now()})
+
+            if options['once']:
+                break
+
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from carmanagement_api import authentication
+
+
+class Command(BaseCommand):
+    """Revoke every API token issued to a user"""
+    help = 'Revoke every token issued to a user so far, e.g. when their password may have been stolen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+
+        try:
+            user = User.objects.get_by_natural_key(options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'There is no user called {options["username"]}.')
+
+        authentication.revoke(user.pk)
+        self.stdout.write(f'Revoked every token of {user.get_username()}.')
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from carmanagement_api import services
+
+
+class Command(BaseCommand):
+    """Run the transfers of every car at a branch that were started in the background"""
+    help = 'Check for waiting branch transfers every interval seconds and run them one at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5.0)
+        parser.add_argument('--once', action='store_true', help='Run the waiting transfers and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            count = services.run_branch_transfers()
+            if count:
+                self.stdout.write(f'Ran {count} branch transfers.')
+
+            if options['once']:
+                break
+
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from carmanagement_api import services
+
+
+class Command(BaseCommand):
+    """Sample the occupancy of every branch into the hourly, daily and weekly rollups"""
+    help = 'Add a sample of each branch\'s occupancy to its rollups every interval seconds, dropping expired buckets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=60.0)
+        parser.add_argument('--once', action='store_true', help='Take a single sample and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            services.sample_occupancy()
+
+            if options['once']:
+                break
+
+            time.sleep(options['interval'])
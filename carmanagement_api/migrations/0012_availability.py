@@ -0,0 +1,66 @@
+# Generated by Django 2.2.4 on 2026-10-19 15:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_availability(apps, schema_editor):
+    """Count the cars currently at each branch by make, model and year"""
+    db = schema_editor.connection.alias
+    BranchInventory = apps.get_model('carmanagement_api', 'BranchInventory')
+    BranchAvailability = apps.get_model('carmanagement_api', 'BranchAvailability')
+
+    counts = BranchInventory.objects.using(db).values('branch', 'car__make', 'car__model', 'car__year_of_manufacture') \
+        .annotate(available=models.Count('id'))
+
+    BranchAvailability.objects.using(db).bulk_create([
+        BranchAvailability(
+            branch_id=c['branch'],
+            make=c['car__make'],
+            model=c['car__model'],
+            year_of_manufacture=c['car__year_of_manufacture'],
+            available=c['available']
+        ) for c in counts
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carmanagement_api', '0011_branch_capacity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchAvailability',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('make', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=50)),
+                ('year_of_manufacture', models.PositiveIntegerField()),
+                ('available', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='branch',
+            index=models.Index(fields=['city'], name='carmanageme_city_13a298_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['make', 'model', 'year_of_manufacture'], name='carmanageme_make_7e4f9b_idx'),
+        ),
+        migrations.AddField(
+            model_name='branchavailability',
+            name='branch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='carmanagement_api.Branch'),
+        ),
+        migrations.AddIndex(
+            model_name='branchavailability',
+            index=models.Index(fields=['make', 'model', 'year_of_manufacture'], name='carmanageme_make_4afc49_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='branchavailability',
+            unique_together={('branch', 'make', 'model', 'year_of_manufacture')},
+        ),
+        migrations.RunPython(populate_availability, migrations.RunPython.noop),
+    ]
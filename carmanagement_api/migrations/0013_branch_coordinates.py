@@ -0,0 +1,28 @@
+# Generated by Django 2.2.4 on 2026-10-19 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carmanagement_api', '0012_availability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='branch',
+            name='geohash',
+            field=models.CharField(db_index=True, max_length=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='branch',
+            name='latitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='branch',
+            name='longitude',
+            field=models.FloatField(null=True),
+        ),
+    ]
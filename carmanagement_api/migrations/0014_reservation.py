@@ -0,0 +1,34 @@
+# Generated by Django 2.2.4 on 2026-10-19 15:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carmanagement_api', '0013_branch_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='carmanagement_api.Car')),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='carmanagement_api.Driver')),
+                ('pickup_branch', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='pickups', to='carmanagement_api.Branch')),
+                ('return_branch', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='returns', to='carmanagement_api.Branch')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['car', 'start'], name='carmanageme_car_id_99c55c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['return_branch', 'end'], name='carmanageme_return__6c7df9_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 2.2.4 on 2026-10-19 15:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_location(apps, schema_editor):
+    """Copy the location of each car from its generic foreign key to the location type and typed foreign keys"""
+    db = schema_editor.connection.alias
+    Car = apps.get_model('carmanagement_api', 'Car')
+    Branch = apps.get_model('carmanagement_api', 'Branch')
+    Driver = apps.get_model('carmanagement_api', 'Driver')
+
+    # Locations pointing at a branch or driver that no longer exists are left unassigned
+    Car.objects.using(db).filter(
+        currently_with_type__app_label='carmanagement_api',
+        currently_with_type__model='branch',
+        currently_with_id__in=Branch.objects.using(db).values('id')
+    ).update(location_type=1, current_branch_id=models.F('currently_with_id'))
+
+    Car.objects.using(db).filter(
+        currently_with_type__app_label='carmanagement_api',
+        currently_with_type__model='driver',
+        currently_with_id__in=Driver.objects.using(db).values('id')
+    ).update(location_type=2, current_driver_id=models.F('currently_with_id'))
+
+
+def restore_generic_location(apps, schema_editor):
+    """Copy the location of each car back to its generic foreign key"""
+    db = schema_editor.connection.alias
+    Car = apps.get_model('carmanagement_api', 'Car')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+
+    branch_type, _ = ContentType.objects.using(db).get_or_create(app_label='carmanagement_api', model='branch')
+    driver_type, _ = ContentType.objects.using(db).get_or_create(app_label='carmanagement_api', model='driver')
+
+    Car.objects.using(db).filter(location_type=1).update(currently_with_type=branch_type, currently_with_id=models.F('current_branch_id'))
+    Car.objects.using(db).filter(location_type=2).update(currently_with_type=driver_type, currently_with_id=models.F('current_driver_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('carmanagement_api', '0015_replication_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='current_branch',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='carmanagement_api.Branch'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='current_driver',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='carmanagement_api.Driver'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='location_type',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'unassigned'), (1, 'branch'), (2, 'driver')], db_index=True, default=0),
+        ),
+        migrations.RunPython(populate_location, restore_generic_location),
+        migrations.RemoveField(
+            model_name='car',
+            name='currently_with_id',
+        ),
+        migrations.RemoveField(
+            model_name='car',
+            name='currently_with_type',
+        ),
+    ]
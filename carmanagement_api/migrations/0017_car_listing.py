@@ -0,0 +1,65 @@
+# Generated by Django 2.2.4 on 2026-10-19 15:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_listings(apps, schema_editor):
+    """Write a listing row for every existing car"""
+    db = schema_editor.connection.alias
+    Car = apps.get_model('carmanagement_api', 'Car')
+    CarListing = apps.get_model('carmanagement_api', 'CarListing')
+
+    listings = []
+    for car in Car.objects.using(db).select_related('current_branch', 'current_driver').iterator():
+        branch = car.current_branch if car.location_type == 1 else None
+        driver = car.current_driver if car.location_type == 2 else None
+
+        listings.append(CarListing(
+            car_id=car.id,
+            make=car.make,
+            model=car.model,
+            year_of_manufacture=car.year_of_manufacture,
+            location_type=car.location_type,
+            location_id=car.current_branch_id if branch else car.current_driver_id if driver else None,
+            city=branch and branch.city,
+            postcode=branch and branch.postcode,
+            first_name=driver and driver.first_name,
+            middle_names=driver and driver.middle_names,
+            last_name=driver and driver.last_name,
+            date_of_birth=driver and driver.date_of_birth
+        ))
+
+    CarListing.objects.using(db).bulk_create(listings, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carmanagement_api', '0016_car_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarListing',
+            fields=[
+                ('car', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='carmanagement_api.Car')),
+                ('make', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=50)),
+                ('year_of_manufacture', models.PositiveIntegerField()),
+                ('location_type', models.PositiveSmallIntegerField(choices=[(0, 'unassigned'), (1, 'branch'), (2, 'driver')], default=0)),
+                ('location_id', models.PositiveIntegerField(null=True)),
+                ('city', models.CharField(max_length=50, null=True)),
+                ('postcode', models.CharField(max_length=8, null=True)),
+                ('first_name', models.CharField(max_length=50, null=True)),
+                ('middle_names', models.CharField(max_length=255, null=True)),
+                ('last_name', models.CharField(max_length=50, null=True)),
+                ('date_of_birth', models.DateField(null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='carlisting',
+            index=models.Index(fields=['location_type', 'location_id'], name='carmanageme_locatio_c6876b_idx'),
+        ),
+        migrations.RunPython(populate_listings, migrations.RunPython.noop),
+    ]
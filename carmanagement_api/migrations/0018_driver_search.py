@@ -0,0 +1,80 @@
+# Generated by Django 2.2.4 on 2026-10-19 15:48
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The tokenisation of carmanagement_api.search as it was when this migration was written, copied so that later
+# changes to that module do not change what this migration does
+
+
+def tokenise(text):
+    """Split text into case-folded name tokens, with accents and apostrophes removed"""
+    if not text:
+        return []
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return re.findall(r'[^\W_]+', re.sub(r"['\u2019]", '', stripped.casefold()))
+
+
+def deletions(token):
+    """Return the token and every string made by deleting one character from it"""
+    return {token} | {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def populate_name_tokens(apps, schema_editor):
+    """Index the names of every existing driver"""
+    db = schema_editor.connection.alias
+    Driver = apps.get_model('carmanagement_api', 'Driver')
+    DriverNameToken = apps.get_model('carmanagement_api', 'DriverNameToken')
+    NameTokenVariant = apps.get_model('carmanagement_api', 'NameTokenVariant')
+
+    tokens = []
+    for driver in Driver.objects.using(db).iterator():
+        tokens.extend(
+            DriverNameToken(driver_id=driver.id, token=t)
+            for t in set(tokenise(driver.first_name) + tokenise(driver.middle_names) + tokenise(driver.last_name))
+        )
+
+    DriverNameToken.objects.using(db).bulk_create(tokens, batch_size=500)
+    NameTokenVariant.objects.using(db).bulk_create(
+        [NameTokenVariant(variant=v, token=t) for t in {t.token for t in tokens} for v in deletions(t)],
+        batch_size=500,
+        ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carmanagement_api', '0017_car_listing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NameTokenVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('variant', models.CharField(max_length=255)),
+                ('token', models.CharField(max_length=255)),
+            ],
+            options={
+                'unique_together': {('variant', 'token')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DriverNameToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=255)),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_tokens', to='carmanagement_api.Driver')),
+            ],
+            options={
+                'unique_together': {('token', 'driver')},
+            },
+        ),
+        migrations.RunPython(populate_name_tokens, migrations.RunPython.noop),
+    ]
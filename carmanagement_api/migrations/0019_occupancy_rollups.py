@@ -0,0 +1,36 @@
+# Generated by Django 2.2.4 on 2026-10-19 16:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carmanagement_api', '0018_driver_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'hour'), ('day', 'day'), ('week', 'week')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('occupancy_total', models.PositiveIntegerField(default=0)),
+                ('capacity_total', models.PositiveIntegerField(default=0)),
+                ('peak_occupancy', models.PositiveIntegerField(default=0)),
+                ('peak_fill', models.FloatField(default=0)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='carmanagement_api.Branch')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='occupancyrollup',
+            index=models.Index(fields=['resolution', 'start'], name='carmanageme_resolut_ae8eb2_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='occupancyrollup',
+            unique_together={('branch', 'resolution', 'start')},
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.4 on 2026-10-19 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carmanagement_api', '0019_occupancy_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='branch',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='driver',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
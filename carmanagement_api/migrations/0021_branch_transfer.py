@@ -0,0 +1,28 @@
+# Generated by Django 2.2.4 on 2026-10-19 16:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carmanagement_api', '0020_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchTransfer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destinations', models.TextField(blank=True, default='')),
+                ('close', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], db_index=True, default='pending', max_length=7)),
+                ('result', models.TextField(null=True)),
+                ('error', models.TextField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='carmanagement_api.Branch')),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.4 on 2026-10-19 16:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carmanagement_api', '0022_token_revocations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestTelemetry',
+            fields=[
+                ('recorded_at', models.DateTimeField()),
+                ('odometer_km', models.FloatField(null=True)),
+                ('fuel_level', models.FloatField(null=True)),
+                ('latitude', models.FloatField(null=True)),
+                ('longitude', models.FloatField(null=True)),
+                ('car', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='carmanagement_api.Car')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TelemetryReading',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField()),
+                ('odometer_km', models.FloatField(null=True)),
+                ('fuel_level', models.FloatField(null=True)),
+                ('latitude', models.FloatField(null=True)),
+                ('longitude', models.FloatField(null=True)),
+                ('day', models.PositiveIntegerField()),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='carmanagement_api.Car')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='telemetryreading',
+            index=models.Index(fields=['day', 'car'], name='carmanageme_day_6b49b4_idx'),
+        ),
+    ]
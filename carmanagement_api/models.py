@@ -1,23 +1,89 @@
-from django.db import models
+from django.db import models, transaction, router
 from django.core.validators import MaxValueValidator
 from django.conf import settings
-from django.contrib.contenttypes.models import ContentType
-from django.contrib.contenttypes.fields import GenericForeignKey
 from datetime import datetime
 
+from carmanagement_api import geo
+from carmanagement_api import search
+from carmanagement_api import rollups
+
+class VersionConflict(Exception):
+    """Raised when a row is saved over a version other than the one that was read"""
+
+
+class VersionedModel(models.Model):
+    """Abstract model whose rows are only updated if they still have the version that was read
+
+    Every save moves the row on to the next version in the same UPDATE that checks the version, so concurrent
+    writers never block each other and a lost update is detected without locking the row.
+    """
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        """Include the version in saves of only some fields, so that they move the row on to the next version too"""
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = list(kwargs['update_fields']) + ['version']
+        super().save(*args, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """Update the row WHERE version matches the version read, setting it to the next version"""
+        field = self._meta.get_field('version')
+        values = [v for v in values if v[0] is not field] + [(field, None, self.version + 1)]
+
+        if super()._do_update(base_qs.filter(version=self.version), using, pk_val, values, update_fields, forced_update):
+            self.version += 1
+            return True
+
+        # Nothing was updated, either because another writer got there first or because the row is new
+        if base_qs.filter(pk=pk_val).exists():
+            raise VersionConflict(f'{self._meta.verbose_name.capitalize()} {pk_val} has changed since version {self.version}.')
+        return False
+
+
 # Create your models here.
-class Branch(models.Model):
+class Branch(VersionedModel):
     """Database model for branches in the system"""
     city = models.CharField(max_length=50)
     postcode = models.CharField(max_length=8)
     capacity = models.PositiveIntegerField(default=10)
 
+    # Coordinates are resolved from the postcode when the branch is created or its postcode is changed
+    latitude = models.FloatField(null=True)
+    longitude = models.FloatField(null=True)
+    geohash = models.CharField(max_length=geo.GEOHASH_PRECISION, null=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['city']),
+        ]
+
     def __str__(self):
         """Return a String representation of the branch"""
         return self.city + ", " + self.postcode
 
+    def save(self, *args, **kwargs):
+        """Keep the geohash used by the nearest branch search in step with the coordinates"""
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = None
+
+        adding = self._state.adding
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
 
-class Driver(models.Model):
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+            # Keep the copy of the branch's details in the listing of each car at it in step
+            if not adding:
+                CarListing.objects.filter(location_type=Car.AT_BRANCH, location_id=self.id) \
+                    .update(city=self.city, postcode=self.postcode)
+
+
+class Driver(VersionedModel):
     """Database model for drivers in the system"""
     first_name = models.CharField(max_length=50)
     middle_names = models.CharField(max_length=255, null=True)
@@ -31,8 +97,72 @@ class Driver(models.Model):
         else:
          return f'{self.first_name} {self.middle_names} {self.last_name}'
 
+    def save(self, *args, **kwargs):
+        """Save the driver, updating their search tokens and the copy of their details in the listing of each car they have"""
+        adding = self._state.adding
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+            DriverNameToken.index(self, adding)
+
+            if not adding:
+                CarListing.objects.filter(location_type=Car.WITH_DRIVER, location_id=self.id).update(
+                    first_name=self.first_name,
+                    middle_names=self.middle_names,
+                    last_name=self.last_name,
+                    date_of_birth=self.date_of_birth
+                )
+
+
+class DriverNameToken(models.Model):
+    """Database model for a normalised token of a driver's names, used to look drivers up by name"""
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, related_name='name_tokens')
+    token = models.CharField(max_length=255)
+
+    class Meta:
+        # Leading with the token lets exact and prefix searches use this index
+        unique_together = ('token', 'driver')
+
+    def __str__(self):
+        """Return a String representation of the token"""
+        return f'{self.token} ({self.driver})'
+
+    @classmethod
+    def index(cls, driver, adding=False):
+        """Replace the tokens of a driver with the tokens of their current names"""
+        tokens = search.name_tokens(driver.first_name, driver.middle_names, driver.last_name)
+
+        if not adding:
+            cls.objects.filter(driver=driver).delete()
+
+        cls.objects.bulk_create([cls(driver=driver, token=t) for t in tokens])
+        NameTokenVariant.add(tokens)
+
 
-class Car(models.Model):
+class NameTokenVariant(models.Model):
+    """Database model for a name token with up to one character deleted, used to find names with a typo"""
+    variant = models.CharField(max_length=255)
+    token = models.CharField(max_length=255)
+
+    class Meta:
+        unique_together = ('variant', 'token')
+
+    def __str__(self):
+        """Return a String representation of the variant"""
+        return f'{self.variant} -> {self.token}'
+
+    @classmethod
+    def add(cls, tokens):
+        """Add the variants of each token, ignoring any that are already known"""
+        cls.objects.bulk_create(
+            [cls(variant=v, token=t) for t in tokens for v in search.deletions(t)],
+            batch_size=500,
+            ignore_conflicts=True
+        )
+
+
+class Car(VersionedModel):
     """Database model for cars in the system"""
     make = models.CharField(max_length=50)
     model = models.CharField(max_length=50)
@@ -41,17 +171,160 @@ class Car(models.Model):
         validators=[MaxValueValidator(datetime.now().year),]
     )
 
-    # Generic foreign key can take type Branch or Driver
-    limit = models.Q(app_label='carmanagement_api', model='branch') | \
-        models.Q(app_label='carmanagement_api', model='driver')
-    currently_with_type = models.ForeignKey(ContentType, limit_choices_to=limit, on_delete=models.CASCADE, null=True)
-    currently_with_id = models.PositiveIntegerField(null=True)
-    currently_with = GenericForeignKey('currently_with_type', 'currently_with_id')
+    # A car is either unassigned, at a branch or with a driver, stored as a small integer so it can be
+    # read without looking up a content type
+    UNASSIGNED = 0
+    AT_BRANCH = 1
+    WITH_DRIVER = 2
+    LOCATION_TYPES = (
+        (UNASSIGNED, 'unassigned'),
+        (AT_BRANCH, 'branch'),
+        (WITH_DRIVER, 'driver'),
+    )
+    LOCATION_FIELDS = ['location_type', 'current_branch', 'current_driver']
+
+    location_type = models.PositiveSmallIntegerField(choices=LOCATION_TYPES, default=UNASSIGNED, db_index=True)
+    current_branch = models.ForeignKey(Branch, on_delete=models.PROTECT, null=True, related_name='+')
+    current_driver = models.ForeignKey(Driver, on_delete=models.PROTECT, null=True, related_name='+')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['make', 'model', 'year_of_manufacture']),
+        ]
 
     def __str__(self):
         """Return a String representation of the car"""
         return f'ID: {self.id} ({self.make} {self.model}, {self.year_of_manufacture})'
 
+    def save(self, *args, **kwargs):
+        """Save the car and its row in the car listing in the same transaction"""
+        adding = self._state.adding
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+            CarListing.refresh(self, adding)
+
+    @property
+    def currently_with(self):
+        """Return the Branch or Driver the car is currently with, or None if it is unassigned"""
+        if self.location_type == self.AT_BRANCH:
+            return self.current_branch
+        elif self.location_type == self.WITH_DRIVER:
+            return self.current_driver
+        return None
+
+    @currently_with.setter
+    def currently_with(self, value):
+        """Set the location of the car to a Branch, a Driver or None"""
+        self.current_branch = value if isinstance(value, Branch) else None
+        self.current_driver = value if isinstance(value, Driver) else None
+
+        if self.current_branch is not None:
+            self.location_type = self.AT_BRANCH
+        elif self.current_driver is not None:
+            self.location_type = self.WITH_DRIVER
+        else:
+            self.location_type = self.UNASSIGNED
+
+
+class CarListing(models.Model):
+    """Database model for the display-ready row of each car, with the details of its location copied in
+
+    Rows are written whenever a car, or the branch or driver it is with, is saved. Updates made with
+    QuerySet.update() or bulk_create() bypass this, and are repaired by the rebuild_car_listings command.
+    """
+    car = models.OneToOneField(Car, on_delete=models.CASCADE, primary_key=True, related_name='listing')
+    make = models.CharField(max_length=50)
+    model = models.CharField(max_length=50)
+    year_of_manufacture = models.PositiveIntegerField()
+    location_type = models.PositiveSmallIntegerField(choices=Car.LOCATION_TYPES, default=Car.UNASSIGNED)
+    location_id = models.PositiveIntegerField(null=True)
+
+    # Copied from the branch the car is at
+    city = models.CharField(max_length=50, null=True)
+    postcode = models.CharField(max_length=8, null=True)
+
+    # Copied from the driver the car is with
+    first_name = models.CharField(max_length=50, null=True)
+    middle_names = models.CharField(max_length=255, null=True)
+    last_name = models.CharField(max_length=50, null=True)
+    date_of_birth = models.DateField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['location_type', 'location_id']),
+        ]
+
+    def __str__(self):
+        """Return a String representation of the listing"""
+        return f'Listing of car {self.car_id} ({self.make} {self.model}, {self.year_of_manufacture})'
+
+    @classmethod
+    def from_car(cls, car):
+        """Return the listing row for a car, without saving it"""
+        listing = cls(
+            car_id=car.id,
+            make=car.make,
+            model=car.model,
+            year_of_manufacture=car.year_of_manufacture,
+            location_type=car.location_type
+        )
+
+        if car.location_type == Car.AT_BRANCH:
+            listing.location_id = car.current_branch_id
+            listing.city = car.current_branch.city
+            listing.postcode = car.current_branch.postcode
+        elif car.location_type == Car.WITH_DRIVER:
+            listing.location_id = car.current_driver_id
+            listing.first_name = car.current_driver.first_name
+            listing.middle_names = car.current_driver.middle_names
+            listing.last_name = car.current_driver.last_name
+            listing.date_of_birth = car.current_driver.date_of_birth
+
+        return listing
+
+    @classmethod
+    def refresh(cls, car, adding=False):
+        """Write the listing row of a car, inserting it if the car has just been added"""
+        listing = cls.from_car(car)
+
+        if adding:
+            listing.save(force_insert=True)
+        else:
+            fields = [f.attname for f in cls._meta.concrete_fields if not f.primary_key]
+            if cls.objects.filter(car_id=car.id).update(**{f: getattr(listing, f) for f in fields}) == 0:
+                listing.save(force_insert=True)
+
+    def as_json(self):
+        """Creates a dict used to show the car as JSON, which is how the Car viewset shows every car"""
+        if self.location_type == Car.AT_BRANCH:
+            currently_with = {
+                'id': self.location_id,
+                'city': self.city,
+                'postcode': self.postcode,
+            }
+        elif self.location_type == Car.WITH_DRIVER:
+            currently_with = {
+                'id': self.location_id,
+                'first_name': self.first_name,
+                'middle_names': self.middle_names,
+                'last_name': self.last_name,
+                'date_of_birth': self.date_of_birth
+            }
+        else:
+            currently_with = {
+                'message': 'Currently unassigned. Please assign this car to a Branch or Driver'
+            }
+
+        return {
+            'id': self.car_id,
+            'make': self.make,
+            'model': self.model,
+            'year_of_manufacture': self.year_of_manufacture,
+            'currently_with': currently_with
+        }
+
 class BranchInventory(models.Model):
     """Database model for associations between a car and the branch it is located at"""
     car = models.ForeignKey(Car, on_delete=models.CASCADE)
@@ -69,3 +342,190 @@ class DriverInventory(models.Model):
     def __str__(self):
         """Return a String representation of the car/driver association"""
         return f'{self.car} is with {self.driver}'
+
+class BranchAvailability(models.Model):
+    """Database model for the number of cars of each make, model and year available at a branch"""
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE)
+    make = models.CharField(max_length=50)
+    model = models.CharField(max_length=50)
+    year_of_manufacture = models.PositiveIntegerField()
+    available = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('branch', 'make', 'model', 'year_of_manufacture')
+        indexes = [
+            models.Index(fields=['make', 'model', 'year_of_manufacture']),
+        ]
+
+    def __str__(self):
+        """Return a String representation of the availability count"""
+        return f'{self.available} x {self.make} {self.model} ({self.year_of_manufacture}) available at {self.branch}'
+
+
+class OccupancyRollup(models.Model):
+    """Database model for the samples of a branch's occupancy taken during an hour, day or week"""
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=4, choices=[(r, r) for r in rollups.RESOLUTIONS])
+    start = models.DateTimeField()
+
+    # Averages are worked out from the totals of the samples, so a bucket is updated without reading the samples
+    samples = models.PositiveIntegerField(default=0)
+    occupancy_total = models.PositiveIntegerField(default=0)
+    capacity_total = models.PositiveIntegerField(default=0)
+    peak_occupancy = models.PositiveIntegerField(default=0)
+    peak_fill = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('branch', 'resolution', 'start')
+        indexes = [
+            models.Index(fields=['resolution', 'start']),
+        ]
+
+    def __str__(self):
+        """Return a String representation of the rollup"""
+        return f'Occupancy of {self.branch} in the {self.resolution} from {self.start}'
+
+    def add_sample(self, occupancy, capacity):
+        """Add a sample of the number of cars at the branch and its capacity at the time"""
+        self.samples += 1
+        self.occupancy_total += occupancy
+        self.capacity_total += capacity
+        self.peak_occupancy = max(self.peak_occupancy, occupancy)
+        self.peak_fill = max(self.peak_fill, occupancy / capacity if capacity else 0)
+
+    def as_json(self):
+        """Return the averages and peaks of the bucket"""
+        return {
+            'branch': self.branch_id,
+            'start': self.start.isoformat().replace('+00:00', 'Z'),
+            'samples': self.samples,
+            'average_occupancy': round(self.occupancy_total / self.samples, 3) if self.samples else None,
+            'peak_occupancy': self.peak_occupancy,
+            'average_fill': round(self.occupancy_total / self.capacity_total, 4) if self.capacity_total else None,
+            'peak_fill': round(self.peak_fill, 4),
+        }
+
+
+class BranchTransfer(models.Model):
+    """Database model for a transfer of every car at a branch to other branches, run in the background"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(s, s) for s in (PENDING, RUNNING, DONE, FAILED)]
+
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='+')
+    # The ids of the branches to move the cars to in order, or empty to use the nearest branches with room
+    destinations = models.TextField(blank=True, default='')
+    close = models.BooleanField(default=False)
+    status = models.CharField(max_length=7, choices=STATUSES, default=PENDING, db_index=True)
+    result = models.TextField(null=True)
+    error = models.TextField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        """Return a String representation of the transfer"""
+        return f'Transfer of the cars at {self.branch} ({self.status})'
+
+    @property
+    def destination_ids(self):
+        """Return the ids of the destination branches in order"""
+        return [int(i) for i in self.destinations.split(',') if i]
+
+    @destination_ids.setter
+    def destination_ids(self, value):
+        """Store the ids of the destination branches"""
+        self.destinations = ','.join(str(i) for i in value)
+
+
+class Reservation(models.Model):
+    """Database model for a future booking of a car by a driver between a pickup and a return branch"""
+    car = models.ForeignKey(Car, on_delete=models.CASCADE)
+    driver = models.ForeignKey(Driver, on_delete=models.PROTECT)
+    pickup_branch = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name='pickups')
+    return_branch = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name='returns')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['car', 'start']),
+            models.Index(fields=['return_branch', 'end']),
+        ]
+
+    def __str__(self):
+        """Return a String representation of the reservation"""
+        return f'{self.car} reserved by {self.driver} from {self.start} to {self.end}'
+
+
+class Telemetry(models.Model):
+    """The values reported by a car in a telemetry reading, any of which may be missing"""
+    recorded_at = models.DateTimeField()
+    odometer_km = models.FloatField(null=True)
+    fuel_level = models.FloatField(null=True)
+    latitude = models.FloatField(null=True)
+    longitude = models.FloatField(null=True)
+
+    class Meta:
+        abstract = True
+
+    def as_json(self):
+        """Return the values of the reading"""
+        return {
+            'car': self.car_id,
+            'time': self.recorded_at.isoformat().replace('+00:00', 'Z'),
+            'odometer_km': self.odometer_km,
+            'fuel_level': self.fuel_level,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+        }
+
+
+class TelemetryReading(Telemetry):
+    """Database model for a telemetry reading reported by a car"""
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='+')
+    # Days since the epoch, which partitions the readings so a day of them can be found or dropped at once
+    day = models.PositiveIntegerField()
+
+    class Meta:
+        # A single index keeps inserts cheap, and serves both dropping old days and reading a car's recent days
+        indexes = [
+            models.Index(fields=['day', 'car']),
+        ]
+
+    def __str__(self):
+        """Return a String representation of the reading"""
+        return f'Reading of {self.car_id} at {self.recorded_at}'
+
+
+class LatestTelemetry(Telemetry):
+    """Database model for the most recent telemetry reading of each car"""
+    car = models.OneToOneField(Car, on_delete=models.CASCADE, primary_key=True, related_name='+')
+
+    def __str__(self):
+        """Return a String representation of the reading"""
+        return f'Latest reading of {self.car_id} at {self.recorded_at}'
+
+
+class TokenRevocation(models.Model):
+    """Database model for a revoked API token, or for every token issued to a user before it was revoked"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    # Empty when every token of the user was revoked
+    token_id = models.CharField(max_length=32, blank=True)
+    revoked_at = models.DateTimeField()
+    # Revocations are only needed until the tokens they revoke would have expired anyway
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        """Return a String representation of the revocation"""
+        return f'Token {self.token_id} revoked' if self.token_id else f'Tokens of user {self.user_id} revoked'
+
+
+class ReplicationHeartbeat(models.Model):
+    """Database model for a timestamp written to the primary database and used to measure the lag of each replica"""
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        """Return a String representation of the heartbeat"""
+        return f'Heartbeat at {self.updated_at}'
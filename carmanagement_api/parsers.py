@@ -0,0 +1,47 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+# MessagePack is smaller and faster to decode than JSON but is optional, so it is only accepted when installed
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class NDJSONParser(BaseParser):
+    """Parse newline delimited JSON, with one object on each line, into a list of the objects"""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Parse each line of the body, skipping blank lines"""
+        rows = []
+
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                raise ParseError(f'Line {number} is not valid JSON.')
+
+        return rows
+
+
+class MessagePackParser(BaseParser):
+    """Parse a MessagePack array of objects, or a stream of MessagePack objects one after another, into a list"""
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Unpack every object in the body"""
+        if msgpack is None:
+            raise ParseError('MessagePack needs the msgpack package.')
+
+        try:
+            rows = list(msgpack.Unpacker(stream, raw=False))
+        except (msgpack.UnpackException, ValueError):
+            raise ParseError('The body is not valid MessagePack.')
+
+        return rows[0] if len(rows) == 1 and isinstance(rows[0], list) else rows
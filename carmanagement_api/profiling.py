@@ -0,0 +1,224 @@
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+# Profile ids are used as file names, so only ids of this form are ever read
+PROFILE_ID = re.compile(r'^\d{16}-[0-9a-f]{8}$')
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@lru_cache(maxsize=None)
+def short_filename(filename):
+    """Return a file name relative to the entry of sys.path it was imported from"""
+    roots = [p for p in sys.path if p and filename.startswith(os.path.join(p, ''))]
+    return os.path.relpath(filename, max(roots, key=len)) if roots else filename
+
+
+def frame_label(frame):
+    """Return the name of a frame in a collapsed stack, e.g. list (carmanagement_api/views.py:35)"""
+    code = frame.f_code
+    return f'{code.co_name} ({short_filename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def app_frame(frame, stop=None):
+    """Return the label of the innermost frame of this app, outside this module, from a frame up to a stop frame"""
+    while frame is not None and frame is not stop:
+        if frame.f_code.co_filename.startswith(API_DIR) and frame.f_code.co_filename != __file__:
+            return frame_label(frame)
+        frame = frame.f_back
+    return None
+
+
+def summarise_sql(sql):
+    """Return an SQL statement on one line, short enough to be the name of a frame"""
+    # Semicolons separate the frames of a collapsed stack
+    sql = ' '.join(sql.split()).replace(';', ',')
+    return sql if len(sql) <= 120 else sql[:117] + '...'
+
+
+class Profiler:
+    """Sample the stack of the current thread from another thread while a request is handled
+
+    Each sample is the stack between the frame that started the profiler and the frame running at the time, and
+    samples taken while a query runs end with a frame for the query. Every query is also recorded with its duration
+    and the innermost frame of this app that issued it, as short queries are often missed by the samples.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.queries = []
+        self.current_sql = None
+        self.stopped = threading.Event()
+
+    def __enter__(self):
+        self.root = sys._getframe(1)
+        self.wrappers = ExitStack()
+        for connection in connections.all():
+            self.wrappers.enter_context(connection.execute_wrapper(self.record_query))
+
+        self.started = time.perf_counter()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self.started
+        self.stopped.set()
+        self.sampler.join()
+        self.wrappers.close()
+
+    def stack(self, frame):
+        """Return the labels of the frames from the root down to a frame, or None if it is not below the root"""
+        labels = []
+        outermost = None
+        while frame is not None and frame is not self.root:
+            labels.append(frame_label(frame))
+            outermost, frame = frame, frame.f_back
+
+        # Samples taken while the profiler itself is stopping are not part of the request
+        if frame is None or outermost is None or outermost.f_code is Profiler.__exit__.__code__:
+            return None
+        return labels[::-1]
+
+    def sample(self):
+        """Count the stack of the profiled thread every interval until the profiler is stopped"""
+        while not self.stopped.wait(self.interval):
+            stack = self.stack(sys._current_frames().get(self.thread_id))
+            if not stack:
+                continue
+
+            sql = self.current_sql
+            if sql is not None:
+                stack.append(f'SQL {summarise_sql(sql)}')
+
+            self.stacks[';'.join(stack)] += 1
+
+    def record_query(self, execute, sql, params, many, context):
+        """Mark a query as running for the sampler, and record how long it took"""
+        self.current_sql = sql
+        started = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.current_sql = None
+            self.queries.append({
+                'sql': sql,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                'frame': app_frame(sys._getframe(1), self.root),
+            })
+
+    def folded(self):
+        """Return the samples as collapsed stacks, one 'frame;frame;frame count' line per stack"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def save_profile(profiler, request, response):
+    """Write a profile to PROFILE_DIR as a collapsed stack file and a summary, returning its id"""
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    profile_id = f'{int(time.time() * 1000000)}-{secrets.token_hex(4)}'
+
+    with open(os.path.join(settings.PROFILE_DIR, f'{profile_id}.folded'), 'w') as f:
+        f.write(profiler.folded())
+
+    with open(os.path.join(settings.PROFILE_DIR, f'{profile_id}.json'), 'w') as f:
+        json.dump({
+            'id': profile_id,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration_ms': round(profiler.duration * 1000, 3),
+            'samples': sum(profiler.stacks.values()),
+            'query_count': len(profiler.queries),
+            'query_ms': round(sum(q['duration_ms'] for q in profiler.queries), 3),
+            'queries': profiler.queries,
+        }, f)
+
+    # Only the most recent profiles are kept
+    for old in profile_ids()[settings.PROFILE_KEEP:]:
+        for extension in ('folded', 'json'):
+            try:
+                os.remove(os.path.join(settings.PROFILE_DIR, f'{old}.{extension}'))
+            except FileNotFoundError:
+                pass
+
+    return profile_id
+
+
+def profile_ids():
+    """Return the ids of the stored profiles, most recent first"""
+    try:
+        names = os.listdir(settings.PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+
+    return sorted((n[:-5] for n in names if n.endswith('.json') and PROFILE_ID.match(n[:-5])), reverse=True)
+
+
+def read_profile(profile_id, extension='json'):
+    """Return the contents of a stored profile's file, or None if there is no such profile"""
+    if not PROFILE_ID.match(profile_id):
+        return None
+
+    try:
+        with open(os.path.join(settings.PROFILE_DIR, f'{profile_id}.{extension}')) as f:
+            return json.load(f) if extension == 'json' else f.read()
+    except FileNotFoundError:
+        return None
+
+
+def wants_profile(request):
+    """Return whether a request asks to be profiled"""
+    return request.META.get(PROFILE_HEADER) == '1' or request.GET.get(PROFILE_PARAM) == '1'
+
+
+def is_admin(request):
+    """Return whether a request is authenticated as an admin user, in any of the ways the API accepts"""
+    try:
+        user = Request(request, authenticators=[a() for a in api_settings.DEFAULT_AUTHENTICATION_CLASSES]).user
+    except APIException:
+        return False
+
+    return bool(user and user.is_staff)
+
+
+class ProfilingMiddleware:
+    """Profile requests from admin users that ask for it with an X-Profile: 1 header or ?profile=1
+
+    Other requests are passed straight through, so profiling costs nothing unless it is asked for. The id of the
+    profile is given in the X-Profile-Id header of the response.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not wants_profile(request) or not is_admin(request):
+            return self.get_response(request)
+
+        with Profiler(settings.PROFILE_INTERVAL) as profiler:
+            response = self.get_response(request)
+
+        response[PROFILE_ID_HEADER] = save_profile(profiler, request, response)
+        return response
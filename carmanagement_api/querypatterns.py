@@ -0,0 +1,129 @@
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from carmanagement_api.profiling import app_frame
+
+
+logger = logging.getLogger(__name__)
+
+REPEATED_QUERIES_HEADER = 'X-Repeated-Queries'
+
+# Replacements that turn an SQL statement into its shape, so queries that only differ in their values are grouped
+SHAPE_REPLACEMENTS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    # IN lists of any length have the same shape
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+def query_shape(sql):
+    """Return an SQL statement with its values replaced by placeholders"""
+    for pattern, replacement in SHAPE_REPLACEMENTS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+class QueryPatterns:
+    """Count the queries made on every database connection of this thread by their shape
+
+    A shape that is run many times in one request is usually a query made once for each row of a result,
+    which should be replaced by a join, select_related or prefetch_related.
+    """
+
+    def __init__(self, stop=None):
+        self.stop = stop
+        self.shapes = Counter()
+        self.frames = {}
+
+    def __enter__(self):
+        self.wrappers = ExitStack()
+        for connection in connections.all():
+            self.wrappers.enter_context(connection.execute_wrapper(self.record_query))
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wrappers.close()
+
+    def record_query(self, execute, sql, params, many, context):
+        """Count the shape of a query, remembering the frame of this app that first made it"""
+        shape = query_shape(sql)
+        self.shapes[shape] += 1
+        if shape not in self.frames:
+            self.frames[shape] = app_frame(sys._getframe(1), self.stop)
+
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        """Return the number of queries made"""
+        return sum(self.shapes.values())
+
+    def repeated(self, threshold):
+        """Return the shapes made at least threshold times, with how many times and where from, most made first"""
+        return [(shape, n, self.frames[shape]) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+def describe(shapes):
+    """Return a line for each of a list of repeated shapes"""
+    return '\n'.join(f'  {n} x {shape} (from {frame})' for shape, n, frame in shapes)
+
+
+class RepeatedQueryMiddleware:
+    """Warn about queries that are repeated for each row of a response while DEBUG is on
+
+    Any shape of query made at least QUERY_REPEAT_THRESHOLD times in a request is logged, and the number of such
+    shapes is given in the X-Repeated-Queries header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = getattr(settings, 'QUERY_REPEAT_THRESHOLD', None)
+        if not settings.DEBUG or threshold is None:
+            return self.get_response(request)
+
+        with QueryPatterns(stop=sys._getframe()) as patterns:
+            response = self.get_response(request)
+
+        repeated = patterns.repeated(threshold)
+        if repeated:
+            logger.warning('%s %s repeated queries:\n%s', request.method, request.get_full_path(), describe(repeated))
+            response[REPEATED_QUERIES_HEADER] = len(repeated)
+
+        return response
+
+
+class QueryScalingTestMixin:
+    """Assertions for TestCases that an endpoint's number of queries does not grow with the number of rows"""
+
+    def count_queries(self, method, path, **kwargs):
+        """Make a request with the test client, returning the queries it made by shape"""
+        with QueryPatterns() as patterns:
+            response = getattr(self.client, method)(path, **kwargs)
+
+        self.assertLess(response.status_code, 400, f'{method.upper()} {path} failed, so its queries cannot be counted')
+        return patterns
+
+    def assertQueriesDoNotScale(self, add_rows, path, method='get', **kwargs):
+        """Check a request makes as many queries after add_rows() is called again as after it is first called"""
+        add_rows()
+        fewer = self.count_queries(method, path, **kwargs)
+        add_rows()
+        more = self.count_queries(method, path, **kwargs)
+
+        if more.count > fewer.count:
+            grown = [(s, n, more.frames[s]) for s, n in more.shapes.most_common() if n > fewer.shapes[s]]
+            self.fail(
+                f'{method.upper()} {path} made {fewer.count} queries and then {more.count} with more rows. '
+                f'These queries were made more often:\n{describe(grown)}'
+            )
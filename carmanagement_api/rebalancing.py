@@ -0,0 +1,142 @@
+import heapq
+import math
+from collections import namedtuple, defaultdict
+
+from carmanagement_api import geo
+
+
+# The state of a branch when planning, and a number of cars to move from one branch to another
+BranchState = namedtuple('BranchState', ('id', 'latitude', 'longitude', 'occupancy', 'capacity'))
+Transfer = namedtuple('Transfer', ('from_branch_id', 'to_branch_id', 'count', 'distance_km'))
+
+# Number of nearest branches short of cars considered for each branch with too many in each round
+NEIGHBOURS = 8
+
+# Kilometres in a degree of latitude, used to place branches on a flat grid when searching for neighbours
+KM_PER_DEGREE = 111.2
+
+
+def target(branch, fill):
+    """Return the number of cars a branch should hold when filled to the given fraction of its capacity"""
+    return min(branch.capacity, int(round(branch.capacity * fill)))
+
+
+def position(branch):
+    """Return the (x, y) position of a branch in kilometres on an equirectangular projection"""
+    return (
+        branch.longitude * KM_PER_DEGREE * math.cos(math.radians(branch.latitude)),
+        branch.latitude * KM_PER_DEGREE
+    )
+
+
+class Grid:
+    """Square cells of branches, for finding the branches nearest to a point without measuring to all of them"""
+
+    def __init__(self, branches, cell_km):
+        self.cell_km = cell_km
+        self.cells = defaultdict(list)
+
+        # Positions are stored with the branches so they are only worked out once
+        for branch in branches:
+            x, y = position(branch)
+            self.cells[self.cell((x, y))].append((x, y, branch))
+
+        xs = [key[0] for key in self.cells]
+        ys = [key[1] for key in self.cells]
+        self.bounds = (min(xs), max(xs), min(ys), max(ys)) if self.cells else (0, 0, 0, 0)
+
+    def cell(self, point):
+        """Return the key of the cell containing a point"""
+        return (int(math.floor(point[0] / self.cell_km)), int(math.floor(point[1] / self.cell_km)))
+
+    def nearest(self, branch, count):
+        """Return up to count (distance, branch) pairs of the branches nearest to a branch
+
+        Rings of cells are searched outwards until count branches are found and the ring is further away than the
+        furthest of them, so that no nearer branch can be in a cell that has not been searched.
+        """
+        point = position(branch)
+        cx, cy = self.cell(point)
+        min_x, max_x, min_y, max_y = self.bounds
+        found = []
+
+        # Only rings that overlap the occupied cells are searched, and only the part of each ring within them
+        first_ring = max(min_x - cx, cx - max_x, min_y - cy, cy - max_y, 0)
+        last_ring = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy)
+
+        for ring in range(first_ring, last_ring + 1):
+            keys = []
+            for y in {cy - ring, cy + ring}:
+                if min_y <= y <= max_y:
+                    keys += [(x, y) for x in range(max(cx - ring, min_x), min(cx + ring, max_x) + 1)]
+            for x in {cx - ring, cx + ring}:
+                if min_x <= x <= max_x:
+                    keys += [(x, y) for y in range(max(cy - ring + 1, min_y), min(cy + ring - 1, max_y) + 1)]
+
+            for key in keys:
+                for x, y, other in self.cells.get(key, ()):
+                    found.append((math.hypot(x - point[0], y - point[1]), other))
+
+            if len(found) >= count:
+                found = heapq.nsmallest(count, found, key=lambda f: f[0])
+                if found[-1][0] <= ring * self.cell_km:
+                    break
+
+        return sorted(found, key=lambda f: f[0])[:count]
+
+
+def plan(branches, fill, neighbours=NEIGHBOURS):
+    """Return the transfers that bring every branch as close to its target fill as the cars allow
+
+    Branches with more cars than their target give cars to those with fewer. Each round, every branch with too many
+    cars is paired with its nearest branches that are short of cars, and the pairs are filled shortest first. This
+    greedy plan keeps each car's journey short without solving the full transport problem, which takes too long
+    for thousands of branches.
+    """
+    surplus = {}
+    shortfall = {}
+
+    for branch in branches:
+        difference = branch.occupancy - target(branch, fill)
+        if difference > 0:
+            surplus[branch.id] = difference
+        elif difference < 0:
+            shortfall[branch.id] = -difference
+
+    states = {b.id: b for b in branches}
+    moved = defaultdict(int)
+
+    while surplus and shortfall:
+        receivers = [states[i] for i in shortfall]
+
+        # Cells are sized so that each holds about one branch that is short of cars
+        xs, ys = zip(*(position(b) for b in receivers))
+        area = max(max(xs) - min(xs), 1.0) * max(max(ys) - min(ys), 1.0)
+        grid = Grid(receivers, max(math.sqrt(area / len(receivers)), 1.0))
+
+        pairs = []
+        for giver_id in surplus:
+            for distance, receiver in grid.nearest(states[giver_id], neighbours):
+                pairs.append((distance, giver_id, receiver.id))
+
+        pairs.sort()
+        # Branches left with too many cars after a round have been beaten to their nearest branches, so look further
+        neighbours *= 2
+
+        for distance, giver_id, receiver_id in pairs:
+            if giver_id in surplus and receiver_id in shortfall:
+                count = min(surplus[giver_id], shortfall[receiver_id])
+                moved[(giver_id, receiver_id)] += count
+
+                for remaining, branch_id in ((surplus, giver_id), (shortfall, receiver_id)):
+                    remaining[branch_id] -= count
+                    if not remaining[branch_id]:
+                        del remaining[branch_id]
+
+    transfers = []
+    for (giver_id, receiver_id), count in moved.items():
+        giver, receiver = states[giver_id], states[receiver_id]
+        distance = geo.distance_km(giver.latitude, giver.longitude, receiver.latitude, receiver.longitude)
+        transfers.append(Transfer(giver_id, receiver_id, count, round(distance, 3)))
+
+    return sorted(transfers, key=lambda t: (t.from_branch_id, t.distance_km, t.to_branch_id))
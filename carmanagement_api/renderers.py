@@ -0,0 +1,49 @@
+from rest_framework.renderers import JSONRenderer
+
+
+def flatten(row, prefix=''):
+    """Flatten nested objects into a single object with dotted keys, such as currently_with.id"""
+    flat = {}
+
+    for key, value in row.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[f'{prefix}{key}'] = value
+
+    return flat
+
+
+def to_columns(rows):
+    """Convert a list of objects to a count and an array of values for each field, with null where a field is missing"""
+    rows = [flatten(r) for r in rows]
+    fields = list(dict.fromkeys(k for r in rows for k in r))
+
+    return {
+        'count': len(rows),
+        'columns': {f: [r.get(f) for r in rows] for f in fields}
+    }
+
+
+def is_table(value):
+    """Return whether a value is a list of objects that can be written as columns"""
+    return isinstance(value, list) and all(isinstance(v, dict) for v in value)
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """Render lists of objects with each field name given once, followed by an array of its values
+
+    Lists are found either as the whole response or as the values of the response's fields, such as
+    the cars of the car list. Any other response is rendered as plain JSON.
+    """
+    media_type = 'application/vnd.carmanagement.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Convert any lists of objects to columns before rendering the response as JSON"""
+        if is_table(data):
+            data = to_columns(data)
+        elif isinstance(data, dict):
+            data = {k: to_columns(v) if is_table(v) else v for k, v in data.items()}
+
+        return super().render(data, accepted_media_type, renderer_context)
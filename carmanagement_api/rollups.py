@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta, timezone
+
+
+# Length in seconds of the buckets occupancy samples are rolled up into at each resolution
+RESOLUTIONS = {
+    'hour': 60 * 60,
+    'day': 24 * 60 * 60,
+    'week': 7 * 24 * 60 * 60,
+}
+
+# Weeks start on a Monday, four days after the Thursday the epoch fell on
+WEEK_OFFSET = 4 * 24 * 60 * 60
+
+# The longest range read at each resolution when a query does not choose one, so that a range returns a few
+# hundred buckets at most for each branch
+AUTOMATIC_RANGES = (
+    ('hour', timedelta(days=7)),
+    ('day', timedelta(days=180)),
+)
+
+
+def bucket_start(moment, resolution):
+    """Return the start of the bucket of the given resolution that contains a moment, in UTC"""
+    seconds = RESOLUTIONS[resolution]
+    offset = WEEK_OFFSET if resolution == 'week' else 0
+    timestamp = int(moment.timestamp()) - offset
+    return datetime.fromtimestamp(timestamp - timestamp % seconds + offset, timezone.utc)
+
+
+def oldest_kept(now, resolution, buckets):
+    """Return the start of the oldest bucket kept when the given number of buckets are kept up to now"""
+    return bucket_start(now, resolution) - timedelta(seconds=RESOLUTIONS[resolution] * (buckets - 1))
+
+
+def choose_resolution(start, end):
+    """Return the finest resolution that answers a range without reading too many buckets"""
+    for resolution, longest in AUTOMATIC_RANGES:
+        if end - start <= longest:
+            return resolution
+    return 'week'
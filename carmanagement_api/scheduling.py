@@ -0,0 +1,206 @@
+from bisect import bisect_left, bisect_right
+from collections import namedtuple, defaultdict
+
+
+# Reservations are held in memory with their times as integer seconds since the epoch
+Booking = namedtuple('Booking', ('id', 'car_id', 'pickup_branch_id', 'return_branch_id', 'start', 'end'))
+
+# Branch occupancy is tracked in slots of this many seconds, events are rounded so occupancy is never underestimated
+SLOT_SECONDS = 15 * 60
+
+# Number of levels in each occupancy tree, 2 ** 22 slots of 15 minutes reaches well past the year 2080
+TREE_DEPTH = 22
+
+
+class ReservationError(Exception):
+    """Raised when a reservation conflicts with another reservation or a branch's capacity"""
+
+
+class OccupancyTree:
+    """Sparse segment tree of the change in a branch's occupancy in each time slot
+
+    Each node holds the sum of the changes in its range and the largest running total within
+    it, so the peak occupancy from any point onwards is found in O(log n).
+    """
+
+    def __init__(self, depth=TREE_DEPTH):
+        self.size = 2 ** depth
+        # Nodes are stored by heap index as [sum, max prefix], missing nodes have no changes
+        self.nodes = {}
+
+    def add(self, slot, delta):
+        """Add delta to the change in occupancy at a slot"""
+        index = slot + self.size
+        node = self.nodes.setdefault(index, [0, 0])
+        node[0] += delta
+        node[1] = max(0, node[0])
+
+        # Recalculate each parent from its two children
+        index //= 2
+        while index >= 1:
+            left = self.nodes.get(2 * index, (0, 0))
+            right = self.nodes.get(2 * index + 1, (0, 0))
+            total = left[0] + right[0]
+
+            if total == 0 and left[1] == 0 and right[1] == 0:
+                self.nodes.pop(index, None)
+            else:
+                self.nodes[index] = [total, max(left[1], left[0] + right[1])]
+
+            index //= 2
+
+        if self.nodes.get(slot + self.size) == [0, 0]:
+            del self.nodes[slot + self.size]
+
+    def peak(self, from_slot, after_slot):
+        """Return the largest change in occupancy since from_slot reached at or after after_slot"""
+        before = self._query(from_slot, after_slot)[0]
+        return before + self._query(after_slot, self.size)[1]
+
+    def _query(self, lo, hi):
+        """Return the [sum, max prefix] of the changes in slots lo to hi"""
+        result = [0, 0]
+        rights = []
+        lo += self.size
+        hi += self.size
+
+        # Combine nodes from the left and right edges of the range towards the middle
+        while lo < hi:
+            if lo & 1:
+                result = self._combine(result, self.nodes.get(lo, (0, 0)))
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                rights.append(self.nodes.get(hi, (0, 0)))
+            lo //= 2
+            hi //= 2
+
+        for node in reversed(rights):
+            result = self._combine(result, node)
+
+        return result
+
+    def _combine(self, left, right):
+        """Join the [sum, max prefix] of two adjacent ranges"""
+        return [left[0] + right[0], max(left[1], left[0] + right[1])]
+
+
+class CarSchedule:
+    """The reservations of one car, sorted by start time
+
+    Reservations of a car never overlap, so they are sorted by their end times too and any
+    conflict can be found by looking at the reservation that starts last before a given time.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.bookings = []
+
+    def add(self, booking):
+        """Insert a reservation in start time order"""
+        index = bisect_right(self.starts, booking.start)
+        self.starts.insert(index, booking.start)
+        self.bookings.insert(index, booking)
+
+    def remove(self, booking):
+        """Remove a reservation"""
+        index = bisect_left(self.starts, booking.start)
+        while self.bookings[index].id != booking.id:
+            index += 1
+        del self.starts[index]
+        del self.bookings[index]
+
+    def conflict(self, start, end):
+        """Return a reservation overlapping the period from start to end, or None"""
+        index = bisect_left(self.starts, end) - 1
+        if index >= 0 and self.bookings[index].end > start:
+            return self.bookings[index]
+        return None
+
+    def previous(self, time):
+        """Return the last reservation that ends at or before the given time, or None"""
+        index = bisect_right(self.starts, time) - 1
+        if index >= 0 and self.bookings[index].end > time:
+            index -= 1
+        return self.bookings[index] if index >= 0 else None
+
+    def next(self, time):
+        """Return the first reservation that starts at or after the given time, or None"""
+        index = bisect_left(self.starts, time)
+        return self.bookings[index] if index < len(self.bookings) else None
+
+
+class Scheduler:
+    """Index of future reservations by car and by branch"""
+
+    def __init__(self):
+        self.cars = defaultdict(CarSchedule)
+        self.occupancy = defaultdict(OccupancyTree)
+        # The cars that will be returned to each branch by a reservation
+        self.arrivals = defaultdict(lambda: defaultdict(int))
+
+    def add(self, booking):
+        """Add a reservation to the index"""
+        self.cars[booking.car_id].add(booking)
+        self.occupancy[booking.pickup_branch_id].add(booking.start // SLOT_SECONDS + 1, -1)
+        self.occupancy[booking.return_branch_id].add(booking.end // SLOT_SECONDS, 1)
+        self.arrivals[booking.return_branch_id][booking.car_id] += 1
+
+    def remove(self, booking):
+        """Remove a reservation from the index"""
+        self.cars[booking.car_id].remove(booking)
+        self.occupancy[booking.pickup_branch_id].add(booking.start // SLOT_SECONDS + 1, 1)
+        self.occupancy[booking.return_branch_id].add(booking.end // SLOT_SECONDS, -1)
+
+        self.arrivals[booking.return_branch_id][booking.car_id] -= 1
+        if self.arrivals[booking.return_branch_id][booking.car_id] == 0:
+            del self.arrivals[booking.return_branch_id][booking.car_id]
+
+    def location(self, car_id, time, current_branch_id):
+        """Return the branch a car will be at, at the given time"""
+        previous = self.cars[car_id].previous(time) if car_id in self.cars else None
+        return previous.return_branch_id if previous is not None else current_branch_id
+
+    def check(self, booking, current_branch_id, now, occupancy, capacity):
+        """Raise a ReservationError if a reservation cannot be added
+
+        current_branch_id is the branch the car is at now, and occupancy and capacity are those of
+        the branch the car will be returned to.
+        """
+        schedule = self.cars[booking.car_id] if booking.car_id in self.cars else CarSchedule()
+
+        conflict = schedule.conflict(booking.start, booking.end)
+        if conflict is not None:
+            raise ReservationError(f'The car is already reserved during this period (reservation {conflict.id}).')
+
+        if self.location(booking.car_id, booking.start, current_branch_id) != booking.pickup_branch_id:
+            raise ReservationError('The car will not be at the pickup branch at the start of this reservation.')
+
+        following = schedule.next(booking.end)
+        if following is not None and following.pickup_branch_id != booking.return_branch_id:
+            raise ReservationError(f'The car must be returned to the pickup branch of its next reservation ({following.id}).')
+
+        # A round trip never increases the occupancy of the branch after the car is returned
+        if booking.pickup_branch_id != booking.return_branch_id:
+            tree = self.occupancy[booking.return_branch_id] if booking.return_branch_id in self.occupancy else OccupancyTree()
+            peak = occupancy + tree.peak(now // SLOT_SECONDS, booking.end // SLOT_SECONDS)
+
+            if peak >= capacity:
+                raise ReservationError('The return branch will be at full capacity after this reservation ends.')
+
+    def free_cars(self, branch_id, start, end, current_branches):
+        """Return the ids of the cars that will be at a branch and not reserved from start to end
+
+        current_branches maps the id of each car at the branch now, or returned there by a
+        reservation, to the branch it is at now.
+        """
+        free = []
+
+        for car_id, current_branch_id in current_branches.items():
+            if self.location(car_id, start, current_branch_id) != branch_id:
+                continue
+            if car_id in self.cars and self.cars[car_id].conflict(start, end) is not None:
+                continue
+            free.append(car_id)
+
+        return free
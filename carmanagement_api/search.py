@@ -0,0 +1,57 @@
+import re
+import unicodedata
+
+
+# Typos are only tolerated in search terms at least this long, as shorter terms would match too many names
+MIN_FUZZY_LENGTH = 4
+MAX_EDIT_DISTANCE = 1
+
+# Sorts after every token, so that a prefix match can be written as a range over the token index
+PREFIX_END = '\U0010ffff'
+
+
+def normalise(text):
+    """Return text case-folded with accents and apostrophes removed, so that O'Brien, obrien and ÓBrien are equal"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return re.sub(r"['’]", '', stripped.casefold())
+
+
+def tokenise(text):
+    """Split text into normalised name tokens, treating spaces, hyphens and other punctuation as separators"""
+    if not text:
+        return []
+    return re.findall(r'[^\W_]+', normalise(text))
+
+
+def name_tokens(first_name, middle_names, last_name):
+    """Return the set of normalised tokens in a driver's names"""
+    return set(tokenise(first_name) + tokenise(middle_names) + tokenise(last_name))
+
+
+def deletions(token):
+    """Return the token and every string made by deleting one character from it
+
+    Two tokens are within one edit of each other only if these sets overlap, which lets typo-tolerant
+    matches be looked up in an index rather than by comparing against every token.
+    """
+    return {token} | {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def edit_distance(a, b):
+    """Return the number of insertions, deletions, substitutions and adjacent transpositions to turn a into b"""
+    previous2 = None
+    previous = list(range(len(b) + 1))
+
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+
+        previous2, previous = previous, current
+
+    return previous[len(b)]
@@ -1,19 +1,59 @@
+import json
+from datetime import datetime, timedelta
+
 from rest_framework import serializers
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+from django.conf import settings
 
 from carmanagement_api import models
+from carmanagement_api import rollups
+
+# The content type ids of Branch and Driver reported as the type of a car's location, by location type. They are
+# looked up once, by warm_up when a worker starts or else by the first car serialized
+LOCATION_CONTENT_TYPE_IDS = {}
+
+
+def load_location_content_types():
+    """Look up the content type ids of Branch and Driver, which never change once the database is migrated"""
+    types = ContentType.objects.get_for_models(models.Branch, models.Driver)
+    LOCATION_CONTENT_TYPE_IDS.update({
+        models.Car.AT_BRANCH: types[models.Branch].id,
+        models.Car.WITH_DRIVER: types[models.Driver].id,
+    })
+
+
+def forget_location_content_types(**kwargs):
+    """Forget the content type ids of Branch and Driver, as they are created again when the database is migrated"""
+    LOCATION_CONTENT_TYPE_IDS.clear()
+
 
 class CarSerializer(serializers.ModelSerializer):
     """Serializes a car object"""
+    # The location is reported with the same keys and values as when it was stored as a generic foreign key, where the
+    # type was the id of the content type of Branch or Driver
+    currently_with_type = serializers.SerializerMethodField()
+    currently_with_id = serializers.SerializerMethodField()
 
     class Meta:
         model = models.Car
         fields = ('id', 'make', 'model', 'year_of_manufacture', 'currently_with_type', 'currently_with_id')
         extra_kwargs = {
-            'id': {'read_only': True},
-            'currently_with_type': {'read_only': True},
-            'currently_with_id': {'read_only': True}
+            'id': {'read_only': True}
         }
 
+    def get_currently_with_type(self, obj):
+        """Return the content type id of Branch or Driver for the car's location, or None if it is unassigned"""
+        if obj.location_type == models.Car.UNASSIGNED:
+            return None
+        if not LOCATION_CONTENT_TYPE_IDS:
+            load_location_content_types()
+        return LOCATION_CONTENT_TYPE_IDS[obj.location_type]
+
+    def get_currently_with_id(self, obj):
+        """Return the id of the branch or driver the car is with"""
+        return obj.current_branch_id or obj.current_driver_id
+
 
 class BranchSerializer(serializers.ModelSerializer):
     """Serializes a branch object"""
@@ -40,6 +80,14 @@ class DriverSerializer(serializers.ModelSerializer):
             }
         }
 
+
+class DriverSearchQuerySerializer(serializers.Serializer):
+    """Validates the query parameters of a driver search"""
+    name = serializers.CharField(required=False, max_length=255)
+    date_of_birth = serializers.DateField(required=False)
+    limit = serializers.IntegerField(required=False, default=50, min_value=1, max_value=200)
+
+
 class BranchInventorySerializer(serializers.ModelSerializer):
     """"Serializes an association between a Car and a Branch"""
 
@@ -63,3 +111,248 @@ class DriverInventorySerializer(serializers.ModelSerializer):
                 'read_only': True
             }
         }
+
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    """Validates the filters and grouping given to the availability endpoint"""
+    GROUP_BY_CHOICES = ('make', 'model', 'year', 'city')
+
+    make = serializers.CharField(required=False)
+    model = serializers.CharField(required=False)
+    year = serializers.IntegerField(required=False)
+    year_min = serializers.IntegerField(required=False)
+    year_max = serializers.IntegerField(required=False)
+    city = serializers.CharField(required=False)
+    location = serializers.ChoiceField(choices=('branch', 'driver', 'none'), default='branch')
+    group_by = serializers.CharField(required=False)
+
+    def validate_group_by(self, value):
+        """Split the comma separated list of fields to group by"""
+        fields = [f.strip() for f in value.split(',') if f.strip()]
+
+        for f in fields:
+            if f not in self.GROUP_BY_CHOICES:
+                raise serializers.ValidationError(f'Cannot group by {f}. Choose from {", ".join(self.GROUP_BY_CHOICES)}.')
+
+        return fields
+
+    def validate(self, data):
+        """Only cars at a branch have a city to filter or group by"""
+        if data['location'] != 'branch' and ('city' in data or 'city' in data.get('group_by', [])):
+            raise serializers.ValidationError({'city': 'Only cars at a branch can be filtered or grouped by city.'})
+
+        return data
+
+
+class NearestBranchQuerySerializer(serializers.Serializer):
+    """Validates the location given to the nearest branch search"""
+    postcode = serializers.CharField(required=False, max_length=8)
+    latitude = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    longitude = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    count = serializers.IntegerField(required=False, default=5, min_value=1, max_value=50)
+
+    def validate(self, data):
+        """Either a postcode or both a latitude and longitude must be given"""
+        if 'postcode' not in data and ('latitude' not in data or 'longitude' not in data):
+            raise serializers.ValidationError('Either a postcode or a latitude and longitude must be given.')
+
+        return data
+
+
+class ReservationSerializer(serializers.ModelSerializer):
+    """Serializes a reservation of a car"""
+
+    class Meta:
+        model = models.Reservation
+        fields = ('id', 'car', 'driver', 'pickup_branch', 'return_branch', 'start', 'end')
+        extra_kwargs = {
+            'id': {
+                'read_only': True
+            },
+            'return_branch': {
+                'required': False
+            }
+        }
+
+    def validate(self, data):
+        """Check the reservation is in the future and ends after it starts"""
+        if data['end'] <= data['start']:
+            raise serializers.ValidationError({'end': 'A reservation must end after it starts.'})
+        if data['end'] <= timezone.now():
+            raise serializers.ValidationError({'end': 'A reservation must end in the future.'})
+
+        # Cars are returned to the branch they were picked up from unless told otherwise
+        data.setdefault('return_branch', data['pickup_branch'])
+        return data
+
+
+class FreeCarsQuerySerializer(serializers.Serializer):
+    """Validates the branch and period given to the free cars search"""
+    branch = serializers.PrimaryKeyRelatedField(queryset=models.Branch.objects.all())
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+
+    def validate(self, data):
+        """Check the period ends after it starts"""
+        if data['end'] <= data['start']:
+            raise serializers.ValidationError({'end': 'The period must end after it starts.'})
+        return data
+
+
+class SubRequestSerializer(serializers.Serializer):
+    """Validates a single request within a batch"""
+    name = serializers.CharField(required=False, max_length=50)
+    method = serializers.ChoiceField(choices=('GET', 'POST', 'PUT', 'PATCH', 'DELETE'))
+    path = serializers.CharField(max_length=2000)
+    body = serializers.JSONField(required=False)
+    headers = serializers.DictField(child=serializers.CharField(), required=False)
+
+    def validate_name(self, value):
+        """Names are used in references, so they cannot contain dots or be numbers"""
+        if '.' in value or value.isdigit():
+            raise serializers.ValidationError('Names cannot contain dots or be numbers.')
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    """Validates a batch of requests"""
+    requests = SubRequestSerializer(many=True)
+    transaction = serializers.BooleanField(required=False, default=False)
+
+    def validate_requests(self, value):
+        """Check the number of requests is within the limit and their names are unique"""
+        limit = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+
+        if not value:
+            raise serializers.ValidationError('At least one request must be given.')
+        if len(value) > limit:
+            raise serializers.ValidationError(f'A batch can contain at most {limit} requests.')
+
+        names = [r['name'] for r in value if 'name' in r]
+        if len(names) != len(set(names)):
+            raise serializers.ValidationError('Each request must have a different name.')
+
+        return value
+
+    def validate(self, data):
+        """Stored responses would outlive a rolled back transaction, so sub-requests of one cannot be idempotent"""
+        if data['transaction'] and any(
+            k.lower() == 'idempotency-key' for r in data['requests'] for k in r.get('headers', {})
+        ):
+            raise serializers.ValidationError(
+                {'requests': 'Use an Idempotency-Key on the batch rather than its requests when it is run in a transaction.'}
+            )
+        return data
+
+
+class RebalanceSerializer(serializers.Serializer):
+    """Validates the target fill level of a rebalancing plan"""
+    fill = serializers.FloatField(required=False, min_value=0, max_value=1)
+
+    def validate(self, data):
+        """Fill branches to the configured level when no other level is given"""
+        data.setdefault('fill', getattr(settings, 'REBALANCE_TARGET_FILL', 0.8))
+        return data
+
+
+class OccupancyQuerySerializer(serializers.Serializer):
+    """Validates the branch, range and resolution of an occupancy query"""
+    branch = serializers.PrimaryKeyRelatedField(queryset=models.Branch.objects.all(), required=False)
+    resolution = serializers.ChoiceField(choices=list(rollups.RESOLUTIONS), required=False)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    limit = serializers.IntegerField(min_value=1, required=False)
+    after = serializers.CharField(required=False)
+
+    def validate_after(self, value):
+        """Return the branch id and bucket start of a cursor given as the next value of an earlier page"""
+        try:
+            branch_id, start = value.split(':')
+            return int(branch_id), datetime.fromtimestamp(int(start), timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            raise serializers.ValidationError('after must be the next value of an earlier page.')
+
+    def validate(self, data):
+        """Default to the last week, read at a resolution suited to the length of the range, a full page at a time"""
+        data.setdefault('end', timezone.now())
+        data.setdefault('start', data['end'] - timedelta(days=7))
+
+        if data['start'] >= data['end']:
+            raise serializers.ValidationError('The start must be before the end.')
+
+        data.setdefault('resolution', rollups.choose_resolution(data['start'], data['end']))
+        data['limit'] = min(data.get('limit', settings.OCCUPANCY_PAGE_SIZE), settings.OCCUPANCY_PAGE_SIZE)
+        return data
+
+
+class BranchTransferRequestSerializer(serializers.Serializer):
+    """Validates a request to move every car at a branch to other branches"""
+    destinations = serializers.PrimaryKeyRelatedField(queryset=models.Branch.objects.all(), many=True, required=False)
+    close = serializers.BooleanField(required=False, default=False)
+    dry_run = serializers.BooleanField(required=False, default=False)
+    background = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, data):
+        """A dry run is answered straight away, so it cannot also run in the background"""
+        if data['dry_run'] and data['background']:
+            raise serializers.ValidationError('A dry run cannot be run in the background.')
+        return data
+
+
+class BranchTransferSerializer(serializers.ModelSerializer):
+    """Serializes a background transfer of every car at a branch"""
+    destinations = serializers.ListField(source='destination_ids', child=serializers.IntegerField())
+    result = serializers.SerializerMethodField()
+
+    class Meta:
+        model = models.BranchTransfer
+        fields = ('id', 'branch', 'destinations', 'close', 'status', 'result', 'error', 'created_at', 'finished_at')
+        read_only_fields = fields
+
+    def get_result(self, obj):
+        """Return the cars moved to each branch once the transfer has finished"""
+        return json.loads(obj.result) if obj.result else None
+
+
+class TokenRequestSerializer(serializers.Serializer):
+    """Validates the credentials a token is asked for with"""
+    username = serializers.CharField()
+    password = serializers.CharField(style={'input_type': 'password'})
+
+
+class GraphQLRequestSerializer(serializers.Serializer):
+    """Validates a GraphQL request, sent as JSON or in the query string"""
+    query = serializers.CharField(trim_whitespace=False)
+    variables = serializers.JSONField(required=False)
+    operationName = serializers.CharField(required=False, allow_null=True)
+
+    def validate_variables(self, value):
+        """Variables in the query string are given as a JSON object"""
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise serializers.ValidationError('variables must be a JSON object.')
+
+        if value is not None and not isinstance(value, dict):
+            raise serializers.ValidationError('variables must be a JSON object.')
+
+        return value
+
+
+class TelemetryQuerySerializer(serializers.Serializer):
+    """Validates the period of a car's telemetry readings to return, by default the last hour"""
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    limit = serializers.IntegerField(required=False, default=1000, min_value=1, max_value=10000)
+
+    def validate(self, data):
+        """Fill in the end as now and the start as an hour before the end"""
+        data.setdefault('end', timezone.now())
+        data.setdefault('start', data['end'] - timedelta(hours=1))
+
+        if data['start'] >= data['end']:
+            raise serializers.ValidationError({'end': 'The end must be after the start.'})
+
+        return data
+
@@ -0,0 +1,696 @@
+import functools
+import json
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction, IntegrityError, OperationalError
+from django.utils import timezone
+from django.db.models import Q, F, Count, Sum
+
+from carmanagement_api import models
+from carmanagement_api import geo
+from carmanagement_api import search
+from carmanagement_api import scheduling
+from carmanagement_api import rebalancing
+from carmanagement_api import rollups
+from carmanagement_api.dbrouters import use_primary, fleet_database
+
+
+# Number of cars moved by each statement of a branch transfer
+TRANSFER_CHUNK_SIZE = 500
+
+# Number of times a transaction is run again when the database is locked by other requests, and the longest time
+# in seconds to wait before the first retry, which doubles with each retry
+LOCK_RETRIES = 5
+LOCK_RETRY_WAIT = 0.05
+
+
+class InventoryError(Exception):
+    """Raised when a car cannot be assigned to the requested branch or driver"""
+
+
+class FleetBusy(Exception):
+    """Raised when the rows a change needs stay locked by other requests, so it can be tried again later"""
+
+
+def lock_row(model, pk):
+    """Lock a row until the end of the current transaction and return it freshly read"""
+    alias = fleet_database()
+
+    if not connections[alias].features.has_select_for_update:
+        # SQLite has no row locks and only starts a transaction on the first write, so write to the row
+        # first to take the database write lock, rather than reading and later failing to upgrade the lock
+        try:
+            model.objects.using(alias).filter(pk=pk).update(**{model._meta.pk.name: F('pk')})
+        except OperationalError as e:
+            # SQLite refuses the lock straight away, rather than waiting for it, when a transaction that has read
+            # the database asks for it while another holds it, so it can only be had by starting again
+            if 'locked' not in str(e):
+                raise
+            raise FleetBusy(f'The {model._meta.verbose_name} is being changed by another request.') from e
+
+    return model.objects.using(alias).select_for_update().get(pk=pk)
+
+
+def retry_when_busy(func):
+    """Run a function that makes its changes in one transaction again, after a random wait, if it is busy
+
+    A function called inside a transaction that is already open is not retried, as the locks it could not take
+    would still be held by that transaction, so FleetBusy is left to whoever opened it.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if connections[fleet_database()].in_atomic_block:
+            return func(*args, **kwargs)
+
+        for attempt in range(LOCK_RETRIES):
+            try:
+                return func(*args, **kwargs)
+            except FleetBusy:
+                time.sleep(random.uniform(0, LOCK_RETRY_WAIT * 2 ** attempt))
+
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+@retry_when_busy
+def rent_car(car, driver):
+    """Remove a Car from its Branch and assign it to a Driver in a single transaction"""
+    with transaction.atomic(using=fleet_database()):
+        # Lock the car so that it is rented and returned by one request at a time, reading its current location
+        car = lock_row(models.Car, car.pk)
+
+        # Check for an existing rental and fetch the driver for the error message in one query
+        current = models.DriverInventory.objects.select_for_update().select_related('driver').filter(car=car).first()
+        if current is not None:
+            raise InventoryError(f'Car {car} is already assigned to {current.driver}')
+
+        # The car's location columns are kept in step with the inventory tables, so use them to find its branch
+        if car.location_type == models.Car.AT_BRANCH:
+            adjust_availability(car.current_branch_id, car, -1)
+
+        models.BranchInventory.objects.filter(car=car).delete()
+        models.DriverInventory.objects.create(car=car, driver=driver)
+
+        # Only write the location columns rather than the whole row
+        car.currently_with = driver
+        car.save(update_fields=models.Car.LOCATION_FIELDS)
+
+    return driver
+
+
+@retry_when_busy
+def return_car(car, branch):
+    """Assign a Car to a Branch in a single transaction, returns the Branch the car was moved from if any"""
+    with transaction.atomic(using=fleet_database()):
+        car = lock_row(models.Car, car.pk)
+
+        # Check for an existing branch and fetch it for the response message in one query
+        current = models.BranchInventory.objects.select_for_update().select_related('branch').filter(car=car).first()
+        previous_branch = current.branch if current is not None else None
+
+        if previous_branch is None or previous_branch.id != branch.id:
+            # Lock the branch so that cars are moved into it one at a time and cannot take it over capacity
+            branch = lock_row(models.Branch, branch.pk)
+            if branch.capacity <= models.BranchInventory.objects.filter(branch=branch).count():
+                raise InventoryError(f'The branch {branch} is currently at full capacity.')
+
+        if current is not None:
+            # Moving between branches only needs the existing association to be repointed
+            if previous_branch.id != branch.id:
+                current.branch = branch
+                current.save(update_fields=['branch'])
+                adjust_availability(previous_branch.id, car, -1)
+                adjust_availability(branch.id, car, 1)
+        else:
+            models.DriverInventory.objects.filter(car=car).delete()
+            models.BranchInventory.objects.create(car=car, branch=branch)
+            adjust_availability(branch.id, car, 1)
+
+        car.currently_with = branch
+        car.save(update_fields=models.Car.LOCATION_FIELDS)
+
+    return previous_branch
+
+
+def update_car(serializer):
+    """Save changes to a Car, moving it between availability counts if it is at a branch"""
+    car = serializer.instance
+
+    with transaction.atomic(using=fleet_database()):
+        branch_id = models.BranchInventory.objects.filter(car=car).values_list('branch_id', flat=True).first()
+
+        # The instance still holds the old make, model and year until the serializer is saved
+        if branch_id is not None:
+            adjust_availability(branch_id, car, -1)
+
+        car = serializer.save()
+
+        if branch_id is not None:
+            adjust_availability(branch_id, car, 1)
+
+    return car
+
+
+def delete_car(car):
+    """Delete a Car, removing it from the availability count of its branch"""
+    with transaction.atomic(using=fleet_database()):
+        branch_id = models.BranchInventory.objects.filter(car=car).values_list('branch_id', flat=True).first()
+
+        if branch_id is not None:
+            adjust_availability(branch_id, car, -1)
+
+        car.delete()
+
+
+def adjust_availability(branch_id, car, delta):
+    """Add delta to the number of cars like the given car available at a branch"""
+    counts = models.BranchAvailability.objects.filter(
+        branch_id=branch_id,
+        make=car.make,
+        model=car.model,
+        year_of_manufacture=car.year_of_manufacture
+    )
+
+    if counts.update(available=F('available') + delta) == 0:
+        try:
+            # The savepoint allows the update to be retried if another request created the row first
+            with transaction.atomic(using=fleet_database()):
+                models.BranchAvailability.objects.create(
+                    branch_id=branch_id,
+                    make=car.make,
+                    model=car.model,
+                    year_of_manufacture=car.year_of_manufacture,
+                    available=delta
+                )
+        except IntegrityError:
+            counts.update(available=F('available') + delta)
+
+
+def rebuild_availability(branch_ids=None):
+    """Recount the cars available at every branch, or only the given branches, from the inventory tables"""
+    counts = models.BranchInventory.objects.values('branch', 'car__make', 'car__model', 'car__year_of_manufacture') \
+        .annotate(available=Count('id'))
+    existing = models.BranchAvailability.objects.all()
+
+    if branch_ids is not None:
+        counts = counts.filter(branch__in=branch_ids)
+        existing = existing.filter(branch__in=branch_ids)
+
+    with transaction.atomic(using=fleet_database()):
+        existing.delete()
+        models.BranchAvailability.objects.bulk_create([
+            models.BranchAvailability(
+                branch_id=c['branch'],
+                make=c['car__make'],
+                model=c['car__model'],
+                year_of_manufacture=c['car__year_of_manufacture'],
+                available=c['available']
+            ) for c in counts
+        ], batch_size=1000)
+
+
+def rebuild_car_listings():
+    """Rewrite the listing row of every car from the cars and the branches and drivers they are with"""
+    cars = models.Car.objects.select_related('current_branch', 'current_driver').order_by('id')
+
+    with transaction.atomic(using=fleet_database()):
+        models.CarListing.objects.all().delete()
+        models.CarListing.objects.bulk_create(
+            (models.CarListing.from_car(c) for c in cars.iterator()),
+            batch_size=500
+        )
+
+
+def fuzzy_tokens(term):
+    """Return the known name tokens within the allowed number of typos of a search term"""
+    candidates = models.NameTokenVariant.objects.filter(variant__in=search.deletions(term)) \
+        .values_list('token', flat=True).distinct()
+    return [t for t in candidates if search.edit_distance(term, t) <= search.MAX_EDIT_DISTANCE]
+
+
+def search_drivers(name=None, date_of_birth=None, limit=50):
+    """Return the drivers with a name token matching every term of name, best matches first
+
+    A term matches a token that it equals, that it is a prefix of, or that it is within one typo of.
+    Drivers matching more of the terms exactly are listed first.
+    """
+    terms = search.tokenise(name)
+    drivers = models.Driver.objects.all()
+
+    if date_of_birth is not None:
+        drivers = drivers.filter(date_of_birth=date_of_birth)
+
+    for term in terms:
+        # Exact and prefix matches are a single range over the token index
+        matches = Q(token__gte=term, token__lt=term + search.PREFIX_END)
+        if len(term) >= search.MIN_FUZZY_LENGTH:
+            matches |= Q(token__in=fuzzy_tokens(term))
+
+        drivers = drivers.filter(id__in=models.DriverNameToken.objects.filter(matches).values('driver_id'))
+
+    if terms:
+        drivers = drivers.annotate(exact=Count('name_tokens', filter=Q(name_tokens__token__in=terms))) \
+            .order_by('-exact', 'last_name', 'first_name', 'id')
+    else:
+        drivers = drivers.order_by('last_name', 'first_name', 'id')
+
+    return drivers[:limit]
+
+
+def rebuild_driver_index():
+    """Rewrite the name tokens of every driver, and the variants used to find names with a typo"""
+    with transaction.atomic(using=fleet_database()):
+        models.DriverNameToken.objects.all().delete()
+        models.NameTokenVariant.objects.all().delete()
+
+        tokens = []
+        for driver in models.Driver.objects.order_by('id').iterator():
+            tokens.extend(
+                models.DriverNameToken(driver_id=driver.id, token=t)
+                for t in search.name_tokens(driver.first_name, driver.middle_names, driver.last_name)
+            )
+
+        models.DriverNameToken.objects.bulk_create(tokens, batch_size=500)
+        models.NameTokenVariant.add({t.token for t in tokens})
+
+
+def fleet_summary():
+    """Return counts of the branches, drivers and cars in the current region, and where the cars are"""
+    summary = models.Branch.objects.aggregate(branches=Count('id'), capacity=Sum('capacity'))
+    summary['capacity'] = summary['capacity'] or 0
+    summary['drivers'] = models.Driver.objects.count()
+
+    locations = dict(models.Car.objects.values_list('location_type').annotate(count=Count('id')).order_by())
+    summary['cars'] = sum(locations.values())
+    summary['cars_at_branches'] = locations.get(models.Car.AT_BRANCH, 0)
+    summary['cars_with_drivers'] = locations.get(models.Car.WITH_DRIVER, 0)
+    summary['cars_unassigned'] = locations.get(models.Car.UNASSIGNED, 0)
+
+    return summary
+
+
+def nearest_branches(latitude, longitude, count=5):
+    """Return up to count branches with free capacity nearest to a point, as (branch, distance) pairs"""
+    branches = models.Branch.objects.exclude(geohash=None) \
+        .annotate(occupancy=Count('branchinventory')) \
+        .filter(occupancy__lt=F('capacity'))
+
+    # Search ever larger cells around the point until enough branches are found within the area that was covered
+    for precision in range(geo.SEARCH_PRECISION, 0, -1):
+        # Prefix matches are written as ranges so that every database can use the index on geohash
+        cells = Q()
+        for cell in geo.neighbourhood(latitude, longitude, precision):
+            cells |= Q(geohash__gte=cell, geohash__lt=cell + '~')
+
+        radius = geo.covered_radius_km(latitude, precision)
+        results = [(b, geo.distance_km(latitude, longitude, b.latitude, b.longitude)) for b in branches.filter(cells)]
+        results = sorted([r for r in results if r[1] <= radius], key=lambda r: r[1])
+
+        if len(results) >= count:
+            return results[:count]
+
+    # Fall back to checking every branch when there are too few branches to fill the result
+    results = [(b, geo.distance_km(latitude, longitude, b.latitude, b.longitude)) for b in branches]
+    return sorted(results, key=lambda r: r[1])[:count]
+
+
+def sample_occupancy(now=None):
+    """Add a sample of every branch's occupancy to its current hour, day and week, and drop buckets that have expired"""
+    now = now or timezone.now()
+    retention = getattr(settings, 'OCCUPANCY_ROLLUP_RETENTION', {})
+    starts = {resolution: rollups.bucket_start(now, resolution) for resolution in rollups.RESOLUTIONS}
+    current = Q()
+    for resolution, start in starts.items():
+        current |= Q(resolution=resolution, start=start)
+
+    branches = models.Branch.objects.annotate(occupancy=Count('branchinventory')).order_by()
+
+    with use_primary(), transaction.atomic(using=fleet_database()):
+        buckets = {(b.branch_id, b.resolution): b for b in models.OccupancyRollup.objects.filter(current)}
+        added = []
+
+        for branch_id, occupancy, capacity in branches.values_list('id', 'occupancy', 'capacity'):
+            for resolution, start in starts.items():
+                bucket = buckets.get((branch_id, resolution))
+                if bucket is None:
+                    bucket = models.OccupancyRollup(branch_id=branch_id, resolution=resolution, start=start)
+                    added.append(bucket)
+                bucket.add_sample(occupancy, capacity)
+
+        models.OccupancyRollup.objects.bulk_create(added, batch_size=500)
+        models.OccupancyRollup.objects.bulk_update(
+            list(buckets.values()),
+            ['samples', 'occupancy_total', 'capacity_total', 'peak_occupancy', 'peak_fill'],
+            batch_size=500
+        )
+
+        # Only a fixed number of buckets are kept at each resolution, so storage stays bounded
+        for resolution, keep in retention.items():
+            if keep is not None:
+                models.OccupancyRollup.objects.filter(
+                    resolution=resolution,
+                    start__lt=rollups.oldest_kept(now, resolution, keep)
+                ).delete()
+
+
+def occupancy_rollups(resolution, start, end, branch=None, after=None):
+    """Return the buckets of a resolution that overlap a range, optionally for one branch, ordered by branch and start
+
+    Pages after the first start after the (branch id, start) of the last bucket of the page before, so each page is
+    read from the index rather than skipping the buckets of every earlier page.
+    """
+    buckets = models.OccupancyRollup.objects.filter(
+        resolution=resolution,
+        start__gte=rollups.bucket_start(start, resolution),
+        start__lt=end
+    )
+    if branch is not None:
+        buckets = buckets.filter(branch=branch)
+    if after is not None:
+        branch_id, bucket = after
+        buckets = buckets.filter(Q(branch_id__gt=branch_id) | Q(branch_id=branch_id, start__gt=bucket))
+
+    return buckets.order_by('branch', 'start')
+
+
+def transfer_destinations(branch):
+    """Return the other branches with free capacity, nearest first if the branch has coordinates"""
+    candidates = list(
+        models.Branch.objects.exclude(pk=branch.pk)
+        .annotate(occupancy=Count('branchinventory'))
+        .filter(occupancy__lt=F('capacity'))
+        .order_by('id')
+    )
+
+    if branch.geohash is not None:
+        candidates.sort(key=lambda b: (
+            b.geohash is None,
+            geo.distance_km(branch.latitude, branch.longitude, b.latitude, b.longitude) if b.geohash else 0
+        ))
+
+    return candidates
+
+
+@retry_when_busy
+def transfer_branch(branch, destinations=None, close=False, dry_run=False):
+    """Move every car at a branch to other branches in one transaction, filling each destination in turn
+
+    The destinations are the given branches in order, or the nearest branches with free capacity. Nothing is moved
+    unless they have room for every car. Closing the branch sets its capacity to 0 so no cars are returned to it.
+    Returns the cars sent to each destination and the future reservations that pick up or return cars at the branch.
+    """
+    with use_primary(), transaction.atomic(using=fleet_database()):
+        # A dry run only reads, so it takes no locks
+        lock = (lambda model, pk: model.objects.get(pk=pk)) if dry_run else lock_row
+        branch = lock(models.Branch, branch.pk)
+        car_ids = list(models.BranchInventory.objects.filter(branch=branch).order_by('car_id').values_list('car_id', flat=True))
+
+        plan = []
+        remaining = car_ids
+        for destination in (destinations if destinations is not None else transfer_destinations(branch)):
+            if not remaining:
+                break
+            if destination.pk == branch.pk:
+                raise InventoryError(f'The cars at {branch} cannot be transferred to the same branch.')
+
+            # Each destination is locked before it is counted, so no cars can be returned to it in the meantime
+            destination = lock(models.Branch, destination.pk)
+            free = destination.capacity - models.BranchInventory.objects.filter(branch=destination).count()
+
+            if free > 0:
+                plan.append((destination, remaining[:free]))
+                remaining = remaining[free:]
+
+        if remaining:
+            raise InventoryError(
+                f'The destinations only have room for {len(car_ids) - len(remaining)} of the {len(car_ids)} cars at {branch}.'
+            )
+
+        if not dry_run:
+            for destination, moved in plan:
+                # Large branches are moved in chunks so that each statement stays within the database's parameter limit
+                for start in range(0, len(moved), TRANSFER_CHUNK_SIZE):
+                    chunk = moved[start:start + TRANSFER_CHUNK_SIZE]
+                    models.BranchInventory.objects.filter(car_id__in=chunk).update(branch=destination)
+                    models.Car.objects.filter(id__in=chunk).update(current_branch=destination, version=F('version') + 1)
+                    models.CarListing.objects.filter(car_id__in=chunk) \
+                        .update(location_id=destination.id, city=destination.city, postcode=destination.postcode)
+
+            rebuild_availability([branch.id] + [d.id for d, _ in plan])
+
+            if close:
+                branch.capacity = 0
+                branch.save(update_fields=['capacity'])
+
+        reservations = models.Reservation.objects.filter(Q(pickup_branch=branch) | Q(return_branch=branch), end__gt=timezone.now())
+
+        return {
+            'branch': branch.id,
+            'cars': len(car_ids),
+            'transfers': [{'branch': d.id, 'cars': moved} for d, moved in plan],
+            'reservations': list(reservations.order_by('start').values_list('id', flat=True)),
+            'closed': close and not dry_run,
+            'dry_run': dry_run
+        }
+
+
+def run_branch_transfers():
+    """Run every waiting background branch transfer in turn, returning the number run"""
+    count = 0
+
+    for job in models.BranchTransfer.objects.filter(status=models.BranchTransfer.PENDING).order_by('id'):
+        # Claim the job so that it is only run once when several workers are running
+        if not models.BranchTransfer.objects.filter(pk=job.pk, status=job.PENDING).update(status=job.RUNNING):
+            continue
+
+        try:
+            destinations = None
+            if job.destination_ids:
+                branches = models.Branch.objects.in_bulk(job.destination_ids)
+                missing = [i for i in job.destination_ids if i not in branches]
+                if missing:
+                    raise InventoryError(f'Branch {missing[0]} no longer exists.')
+                destinations = [branches[i] for i in job.destination_ids]
+
+            job.result = json.dumps(transfer_branch(job.branch, destinations, close=job.close))
+            job.status = job.DONE
+        except FleetBusy:
+            # Leave the job for the next run rather than failing it
+            models.BranchTransfer.objects.filter(pk=job.pk).update(status=job.PENDING)
+            continue
+        except InventoryError as e:
+            job.error = str(e)
+            job.status = job.FAILED
+        except Exception as e:
+            # Record unexpected errors on the job before letting them stop the worker
+            models.BranchTransfer.objects.filter(pk=job.pk).update(
+                status=job.FAILED, error=repr(e), finished_at=timezone.now()
+            )
+            raise
+
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+        count += 1
+
+    return count
+
+
+def branch_states():
+    """Return the occupancy and capacity of every branch with coordinates, for planning moves between them"""
+    branches = models.Branch.objects.exclude(geohash=None).annotate(occupancy=Count('branchinventory')).order_by('id')
+    return [
+        rebalancing.BranchState(*b)
+        for b in branches.values_list('id', 'latitude', 'longitude', 'occupancy', 'capacity')
+    ]
+
+
+def plan_rebalancing(fill):
+    """Return the transfers of cars that bring every branch close to the given fraction of its capacity"""
+    return rebalancing.plan(branch_states(), fill)
+
+
+def rebalance_fleet(transfers):
+    """Move cars between branches as planned, one at a time through the same path as returning a car
+
+    Cars with future reservations are left where they are so that they can still be picked up. A transfer stops
+    early if its branch runs out of cars or the branch it is moving them to fills up, and the moves made are returned.
+    """
+    scheduler = get_scheduler()
+    moves = []
+
+    with use_primary(), transaction.atomic(using=fleet_database()):
+        branches = models.Branch.objects.in_bulk({t.to_branch_id for t in transfers})
+
+        # The cars that can be moved from each branch, taken in order as they are moved
+        movable = {}
+        inventory = models.BranchInventory.objects.filter(branch_id__in={t.from_branch_id for t in transfers})
+        for branch_id, car_id in inventory.order_by('car_id').values_list('branch_id', 'car_id'):
+            if car_id not in scheduler.cars or not scheduler.cars[car_id].bookings:
+                movable.setdefault(branch_id, []).append(car_id)
+
+        cars = models.Car.objects.in_bulk([c for car_ids in movable.values() for c in car_ids])
+
+        for transfer in transfers:
+            available = movable.get(transfer.from_branch_id, [])
+
+            for _ in range(transfer.count):
+                if not available:
+                    break
+
+                try:
+                    return_car(cars[available[0]], branches[transfer.to_branch_id])
+                except InventoryError:
+                    break
+
+                moves.append({
+                    'car': available.pop(0),
+                    'from_branch': transfer.from_branch_id,
+                    'to_branch': transfer.to_branch_id
+                })
+
+    return moves
+
+
+# The reservation index of this process for each database, and the generation of the reservations it was built from
+_schedulers = {}
+_scheduler_generations = {}
+
+
+def get_reservation_generation(alias):
+    """Return the number of times the reservations in a database have been changed by any process"""
+    cache = caches[getattr(settings, 'RESERVATION_CACHE', 'default')]
+    return cache.get_or_set(f'reservations:generation:{alias}', 0, None)
+
+
+def bump_reservation_generation(alias, expected):
+    """Tell every other process that its reservation index for a database needs to be rebuilt
+
+    expected is the generation this process's index was built from before it was changed.
+    """
+    cache = caches[getattr(settings, 'RESERVATION_CACHE', 'default')]
+    key = f'reservations:generation:{alias}'
+    try:
+        generation = cache.incr(key)
+    except ValueError:
+        generation = 1
+        cache.set(key, generation, None)
+
+    # This process's index already includes the change, so it only needs rebuilding if it was already out of date
+    if expected == generation - 1:
+        _scheduler_generations[alias] = generation
+
+
+def changed_scheduler(alias):
+    """Mark this process's index as changed, keeping it once the transaction that changed it is committed"""
+    # The index is rebuilt if it is used again before the change is committed, or if the change is rolled back
+    expected = _scheduler_generations.pop(alias, None)
+    transaction.on_commit(lambda: bump_reservation_generation(alias, expected), using=alias)
+
+
+def as_booking(reservation):
+    """Return the in-memory form of a reservation"""
+    return scheduling.Booking(
+        reservation.id,
+        reservation.car_id,
+        reservation.pickup_branch_id,
+        reservation.return_branch_id,
+        int(reservation.start.timestamp()),
+        int(reservation.end.timestamp())
+    )
+
+
+def get_scheduler():
+    """Return the reservation index of the current region, rebuilding it if its reservations have been changed by another process"""
+    alias = fleet_database()
+    generation = get_reservation_generation(alias)
+
+    if alias not in _schedulers or _scheduler_generations.get(alias) != generation:
+        scheduler = scheduling.Scheduler()
+
+        # Reservations that have already ended can no longer conflict with anything, and the index is
+        # built from the primary so it is never behind the generation it is stored with
+        with use_primary():
+            reservations = models.Reservation.objects.filter(end__gt=timezone.now()).order_by('id')
+            for r in reservations.iterator():
+                scheduler.add(as_booking(r))
+
+        _schedulers[alias] = scheduler
+        _scheduler_generations[alias] = generation
+
+    return _schedulers[alias]
+
+
+def current_branch_id(car):
+    """Return the id of the branch a car is at now, or None"""
+    return models.BranchInventory.objects.filter(car=car).values_list('branch_id', flat=True).first()
+
+
+def create_reservation(car, driver, pickup_branch, return_branch, start, end):
+    """Reserve a car for a driver, checking it is free and that the return branch has room for it"""
+    with transaction.atomic(using=fleet_database()):
+        # Lock the car and return branch so that reservations that could conflict are made one at a time
+        models.Car.objects.select_for_update().filter(pk=car.pk).first()
+        return_branch = models.Branch.objects.select_for_update().get(pk=return_branch.pk)
+
+        scheduler = get_scheduler()
+        booking = scheduling.Booking(None, car.id, pickup_branch.id, return_branch.id, int(start.timestamp()), int(end.timestamp()))
+
+        scheduler.check(
+            booking,
+            current_branch_id(car),
+            int(timezone.now().timestamp()),
+            models.BranchInventory.objects.filter(branch=return_branch).count(),
+            return_branch.capacity
+        )
+
+        reservation = models.Reservation.objects.create(
+            car=car,
+            driver=driver,
+            pickup_branch=pickup_branch,
+            return_branch=return_branch,
+            start=start,
+            end=end
+        )
+
+        scheduler.add(as_booking(reservation))
+        changed_scheduler(fleet_database())
+
+    return reservation
+
+
+def cancel_reservation(reservation):
+    """Cancel a reservation, unless a later reservation of the car relies on it to be at its pickup branch"""
+    if reservation.end <= timezone.now():
+        raise scheduling.ReservationError('Reservations that have ended cannot be cancelled.')
+
+    with transaction.atomic(using=fleet_database()):
+        models.Car.objects.select_for_update().filter(pk=reservation.car_id).first()
+
+        scheduler = get_scheduler()
+        booking = as_booking(reservation)
+        following = scheduler.cars[booking.car_id].next(booking.end)
+
+        if following is not None and following.pickup_branch_id != booking.pickup_branch_id:
+            raise scheduling.ReservationError(f'Reservation {following.id} relies on the car being returned by this reservation.')
+
+        reservation.delete()
+        scheduler.remove(booking)
+        changed_scheduler(fleet_database())
+
+
+def free_cars(branch, start, end):
+    """Return the cars that will be at a branch and are not reserved from start to end"""
+    scheduler = get_scheduler()
+
+    # Candidates are the cars at the branch now and the cars that reservations will return there
+    candidates = dict(models.BranchInventory.objects.filter(branch=branch).values_list('car_id', 'branch_id'))
+    arriving = [c for c in scheduler.arrivals.get(branch.id, {}) if c not in candidates]
+    candidates.update({c: None for c in arriving})
+    candidates.update(dict(models.BranchInventory.objects.filter(car_id__in=arriving).values_list('car_id', 'branch_id')))
+
+    car_ids = scheduler.free_cars(branch.id, int(start.timestamp()), int(end.timestamp()), candidates)
+    return models.Car.objects.filter(id__in=car_ids).order_by('id')
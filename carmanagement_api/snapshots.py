@@ -0,0 +1,389 @@
+import gzip
+import json
+import os
+import shutil
+from collections import namedtuple
+from datetime import date
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from carmanagement_api import models
+from carmanagement_api.dbrouters import current_region
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+Column = namedtuple('Column', ('name', 'type', 'convert'), defaults=(None,))
+Table = namedtuple('Table', ('model', 'columns'))
+
+# The tables of a snapshot, each read from a model in id order. The first two columns of every table must be the id
+# and version, which are what the next export compares to find the rows that changed
+TABLES = {
+    'branches': Table(models.Branch, (
+        Column('id', 'int'),
+        Column('version', 'int'),
+        Column('city', 'string'),
+        Column('postcode', 'string'),
+        Column('capacity', 'int'),
+        Column('latitude', 'float'),
+        Column('longitude', 'float'),
+    )),
+    'drivers': Table(models.Driver, (
+        Column('id', 'int'),
+        Column('version', 'int'),
+        Column('first_name', 'string'),
+        Column('middle_names', 'string'),
+        Column('last_name', 'string'),
+        Column('date_of_birth', 'date'),
+    )),
+    # The current location of a car is part of its row, so moving a car moves it on to a new version
+    'cars': Table(models.Car, (
+        Column('id', 'int'),
+        Column('version', 'int'),
+        Column('make', 'string'),
+        Column('model', 'string'),
+        Column('year_of_manufacture', 'int'),
+        Column('location_type', 'string', dict(models.Car.LOCATION_TYPES).get),
+        Column('current_branch_id', 'int'),
+        Column('current_driver_id', 'int'),
+    )),
+}
+
+DELETED_COLUMNS = (Column('id', 'int'),)
+
+PARQUET = 'parquet'
+COLUMNAR = 'columnar'
+EXTENSIONS = {
+    PARQUET: 'parquet',
+    COLUMNAR: 'columnar.jsonl.gz',
+}
+
+MANIFEST = 'manifest.json'
+PARTIAL = '.partial'
+
+
+class TableWriter:
+    """Write rows to a table file in row groups of EXPORT_CHUNK_SIZE rows, so only one row group is held at a time"""
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self.rows = []
+        self.count = 0
+
+    def append(self, row):
+        """Add a row, writing the row group once it is full"""
+        self.rows.append(row)
+        if len(self.rows) >= settings.EXPORT_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write the rows waiting as a row group, converting them to columns first"""
+        if not self.rows:
+            return
+
+        values = list(zip(*self.rows))
+        columns = [list(v) if c.convert is None else list(map(c.convert, v)) for c, v in zip(self.columns, values)]
+        self.write_group(columns)
+
+        self.count += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        """Write the last row group and finish the file"""
+        self.flush()
+        self.finish()
+
+
+class ParquetWriter(TableWriter):
+    """Write a table as a Parquet file, with one Parquet row group for each row group"""
+
+    ARROW_TYPES = {
+        'int': 'int64',
+        'float': 'float64',
+        'string': 'string',
+        'date': 'date32',
+    }
+
+    def __init__(self, path, columns):
+        super().__init__(path, columns)
+        self.schema = pyarrow.schema([(c.name, getattr(pyarrow, self.ARROW_TYPES[c.type])()) for c in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write_group(self, columns):
+        self.writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)], schema=self.schema
+        ))
+
+    def finish(self):
+        self.writer.close()
+
+
+class ColumnarWriter(TableWriter):
+    """Write a table as gzipped JSON lines, used when pyarrow is not installed
+
+    The first line describes the columns, and each line after it is a row group of {"count": n, "columns": {...}}
+    with a list of values for each column, so it can be read a row group at a time like a Parquet file.
+    """
+
+    def __init__(self, path, columns):
+        super().__init__(path, columns)
+        self.file = gzip.open(path, 'wt')
+        self.write_line({'columns': [{'name': c.name, 'type': c.type} for c in columns]})
+
+    def write_line(self, data):
+        self.file.write(json.dumps(data, separators=(',', ':')))
+        self.file.write('\n')
+
+    def write_group(self, columns):
+        for i, column in enumerate(self.columns):
+            if column.type == 'date':
+                columns[i] = [None if d is None else d.isoformat() for d in columns[i]]
+
+        self.write_line({
+            'count': len(columns[0]),
+            'columns': {c.name: values for c, values in zip(self.columns, columns)},
+        })
+
+    def finish(self):
+        self.file.close()
+
+
+WRITERS = {
+    PARQUET: ParquetWriter,
+    COLUMNAR: ColumnarWriter,
+}
+
+
+def default_format():
+    """Return the format tables are written in, which is Parquet if pyarrow is installed"""
+    return PARQUET if pyarrow is not None else COLUMNAR
+
+
+def export_root():
+    """Return the directory holding the exports of the current region"""
+    return os.path.join(settings.EXPORT_DIR, current_region() or 'default')
+
+
+def export_path(export_id):
+    """Return the directory of an export of the current region"""
+    return os.path.join(export_root(), export_id)
+
+
+def export_ids():
+    """Return the ids of the finished exports of the current region, most recent first"""
+    try:
+        names = os.listdir(export_root())
+    except FileNotFoundError:
+        return []
+
+    # Exports being written are in directories ending in .partial until they are finished
+    return sorted((n for n in names if '.' not in n and os.path.exists(os.path.join(export_root(), n, MANIFEST))),
+                  reverse=True)
+
+
+def read_manifest(export_id):
+    """Return the description of an export, with the number of rows written for each table"""
+    with open(os.path.join(export_path(export_id), MANIFEST)) as f:
+        return json.load(f)
+
+
+def table_path(export_id, name, deleted=False, manifest=None):
+    """Return the file of a table of an export, or of the ids deleted from it since the export it is based on"""
+    manifest = manifest or read_manifest(export_id)
+    suffix = '.deleted' if deleted else ''
+    return os.path.join(export_path(export_id), f'{name}{suffix}.{EXTENSIONS[manifest["format"]]}')
+
+
+def read_index(path):
+    """Yield the (id, version) of every row in an index file, in id order"""
+    with gzip.open(path, 'rt') as f:
+        for line in f:
+            row_id, version = line.split()
+            yield int(row_id), int(version)
+
+
+def begin_snapshot(alias):
+    """Take the snapshot a transaction reads from now, rather than when it first reads a table as SQLite does"""
+    connection = connections[alias]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM sqlite_master')
+
+
+def export_table(name, table, directory, fmt, base=None, using=None):
+    """Write the rows of a table that are new or changed since the export in base, returning how many were written
+
+    Rows are read in id order through a server-side cursor and merged against the ids and versions in the index of
+    the base export, which is read a line at a time, so neither the table nor the index is ever held in memory.
+    """
+    extension = EXTENSIONS[fmt]
+    rows = WRITERS[fmt](os.path.join(directory, f'{name}.{extension}'), table.columns)
+    deleted = WRITERS[fmt](os.path.join(directory, f'{name}.deleted.{extension}'), DELETED_COLUMNS)
+
+    previous = read_index(os.path.join(base, f'{name}.index.gz')) if base else iter(())
+    old = next(previous, None)
+    total = 0
+
+    queryset = table.model.objects.using(using).order_by('id').values_list(*(c.name for c in table.columns))
+    with gzip.open(os.path.join(directory, f'{name}.index.gz'), 'wt') as index:
+        for row in queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            row_id, version = row[0], row[1]
+            index.write(f'{row_id} {version}\n')
+            total += 1
+
+            # Ids in the base export that come before this row have been deleted since
+            while old is not None and old[0] < row_id:
+                deleted.append((old[0],))
+                old = next(previous, None)
+
+            if old is not None and old[0] == row_id:
+                unchanged = old[1] == version
+                old = next(previous, None)
+                if unchanged:
+                    continue
+
+            rows.append(row)
+
+        while old is not None:
+            deleted.append((old[0],))
+            old = next(previous, None)
+
+    rows.close()
+    deleted.close()
+    return {'rows': total, 'changed': rows.count, 'deleted': deleted.count}
+
+
+def export_snapshot(full=False, fmt=None):
+    """Export the fleet of the current region, returning the manifest of the export
+
+    Only the rows added or changed since the previous export are written, along with the ids deleted since it,
+    unless full is set or there is no previous export. The export is written to a directory ending in .partial and
+    renamed once it is finished, so an export that fails part way through is never used as the base of the next.
+    """
+    fmt = fmt or default_format()
+    if fmt == PARQUET and pyarrow is None:
+        raise ValueError('pyarrow must be installed to export Parquet files.')
+
+    previous = export_ids()
+    base = None if full or not previous else previous[0]
+
+    created_at = timezone.now()
+    export_id = created_at.strftime('%Y%m%dT%H%M%S%fZ')
+    directory = export_path(export_id) + PARTIAL
+    os.makedirs(directory)
+
+    manifest = {
+        'id': export_id,
+        'created_at': created_at.isoformat(),
+        'region': current_region(),
+        'base': base,
+        'format': fmt,
+        'tables': {},
+    }
+
+    # Every table is read in one transaction, so that a car rented or returned part way through the export is
+    # written in the same place in every table. Reads may still be served by a replica
+    alias = router.db_for_read(models.Car)
+
+    try:
+        with transaction.atomic(using=alias):
+            begin_snapshot(alias)
+            for name, table in TABLES.items():
+                manifest['tables'][name] = export_table(name, table, directory, fmt, base and export_path(base), alias)
+
+        with open(os.path.join(directory, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    os.rename(directory, export_path(export_id))
+    return manifest
+
+
+def decode(column_type, values):
+    """Return the values of a column read from the fallback format as the types a Parquet file gives"""
+    if column_type == 'date':
+        return [None if v is None else date.fromisoformat(v) for v in values]
+    return values
+
+
+def row_groups(path, columns=None):
+    """Yield the row groups of a table file as a dict of lists of values by column, reading only the given columns"""
+    if path.endswith(EXTENSIONS[PARQUET]):
+        if pyarrow is None:
+            raise ValueError('pyarrow must be installed to read Parquet files.')
+
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(settings.EXPORT_CHUNK_SIZE, columns=columns):
+            yield batch.to_pydict()
+        return
+
+    with gzip.open(path, 'rt') as f:
+        types = {c['name']: c['type'] for c in json.loads(next(f))['columns']}
+        for line in f:
+            group = json.loads(line)['columns']
+            yield {n: decode(types[n], group[n]) for n in (columns or types)}
+
+
+def summarise(groups, by, column):
+    """Return the rows, and the count, sum, min and max of a column, within each group of one row group by group key"""
+    if pyarrow is not None:
+        # Arrow groups and sums the row group in its own compiled loops
+        table = pyarrow.table({**{f'k{i}': groups[b] for i, b in enumerate(by)}, 'v': groups[column]})
+        summary = table.group_by([f'k{i}' for i in range(len(by))]).aggregate(
+            [([], 'count_all'), ('v', 'count'), ('v', 'sum'), ('v', 'min'), ('v', 'max')]
+        )
+        return {
+            tuple(s[f'k{i}'] for i in range(len(by))): (s['count_all'], s['v_count'], s['v_sum'], s['v_min'], s['v_max'])
+            for s in summary.to_pylist()
+        }
+
+    keys = zip(*(groups[b] for b in by)) if by else [()] * len(groups[column])
+    summary = {}
+    for key, value in zip(keys, groups[column]):
+        rows, count, total, low, high = summary.get(key, (0, 0, None, None, None))
+        if value is not None:
+            count += 1
+            total = value if total is None else total + value
+            low = value if low is None or value < low else low
+            high = value if high is None or value > high else high
+        summary[key] = (rows + 1, count, total, low, high)
+    return summary
+
+
+def aggregate(export_id, name, by=(), column='id'):
+    """Return the rows in each group of a table of an export, and the count, sum, min, max and mean of a numeric column
+
+    Groups are keyed by a tuple of the values of the by columns, and the table is read one row group at a time, so
+    only the totals of each group are ever held. Only the rows written to the export are included, which for an
+    incremental export are those changed since the export it is based on.
+    """
+    by = tuple(by)
+    totals = {}
+
+    for groups in row_groups(table_path(export_id, name), list(dict.fromkeys(by + (column,)))):
+        if not groups[column]:
+            continue
+
+        for key, (rows, count, total, low, high) in summarise(groups, by, column).items():
+            if key not in totals:
+                totals[key] = {'rows': 0, 'count': 0, 'sum': None, 'min': None, 'max': None}
+            t = totals[key]
+            t['rows'] += rows
+            t['count'] += count
+            if count:
+                t['sum'] = total if t['sum'] is None else t['sum'] + total
+                t['min'] = low if t['min'] is None else min(t['min'], low)
+                t['max'] = high if t['max'] is None else max(t['max'], high)
+
+    for t in totals.values():
+        t['mean'] = t['sum'] / t['count'] if t['count'] else None
+
+    return totals
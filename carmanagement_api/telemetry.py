@@ -0,0 +1,272 @@
+import atexit
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction, close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from carmanagement_api import models
+from carmanagement_api.dbrouters import fleet_database
+
+
+logger = logging.getLogger(__name__)
+
+
+# The values a reading can have, and the range each must be in
+VALUES = ('odometer_km', 'fuel_level', 'latitude', 'longitude')
+LIMITS = {
+    'odometer_km': (0, None),
+    'fuel_level': (0, 1),
+    'latitude': (-90, 90),
+    'longitude': (-180, 180),
+}
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Readings are stored by their number of days since the epoch, which cannot be negative, and readings from further
+# ahead than a car's clock could plausibly drift are rejected
+EARLIEST = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MAX_CLOCK_SKEW = timedelta(days=1)
+
+Reading = namedtuple('Reading', ('car_id', 'recorded_at') + VALUES)
+
+
+class InvalidReading(ValueError):
+    """Raised when a reading is missing its car or time, or has a value of the wrong type or out of range"""
+
+
+def parse_time(value):
+    """Return the time of a reading given in seconds since the epoch or as an ISO 8601 string"""
+    try:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.fromtimestamp(value, timezone.utc)
+
+        recorded_at = parse_datetime(value) if isinstance(value, str) else None
+    except (ValueError, OverflowError, OSError):
+        # Times in the right form can still be out of range, such as month 13 or a year past 9999
+        recorded_at = None
+
+    if recorded_at is None:
+        raise InvalidReading(f'{value!r} is not a time.')
+
+    return recorded_at if timezone.is_aware(recorded_at) else timezone.make_aware(recorded_at, timezone.utc)
+
+
+def parse_reading(data):
+    """Return a reading from the object sent by a car"""
+    if not isinstance(data, dict):
+        raise InvalidReading('A reading must be an object.')
+
+    car_id = data.get('car')
+    if not isinstance(car_id, int) or isinstance(car_id, bool):
+        raise InvalidReading('car must be the id of a car.')
+
+    if 'time' not in data:
+        raise InvalidReading('time is required.')
+
+    values = []
+    for name in VALUES:
+        value = data.get(name)
+
+        if value is not None:
+            # NaN is neither below nor above any limit, so it must be rejected before the values are compared
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or not math.isfinite(value):
+                raise InvalidReading(f'{name} must be a number.')
+
+            low, high = LIMITS[name]
+            if (low is not None and value < low) or (high is not None and value > high):
+                raise InvalidReading(f'{name} must be between {low} and {high}.' if high is not None else f'{name} must be at least {low}.')
+
+            value = float(value)
+
+        values.append(value)
+
+    recorded_at = parse_time(data['time'])
+    if not EARLIEST <= recorded_at <= timezone.now() + MAX_CLOCK_SKEW:
+        raise InvalidReading('time must be after 1970 and no more than a day from now.')
+
+    return Reading(car_id, recorded_at, *values)
+
+
+def day_of(recorded_at):
+    """Return the partition of a time, which is its number of days since the epoch"""
+    return int(recorded_at.timestamp() // SECONDS_PER_DAY)
+
+
+def write(alias, readings):
+    """Store readings in a database, and move each car's latest reading on to the newest of them"""
+    latest = {}
+    for r in readings:
+        if r.car_id not in latest or r.recorded_at > latest[r.car_id].recorded_at:
+            latest[r.car_id] = r
+
+    with transaction.atomic(using=alias):
+        # Inserting the readings first also takes SQLite's write lock, so flushes from other workers wait for this one
+        models.TelemetryReading.objects.using(alias).bulk_create(
+            [models.TelemetryReading(day=day_of(r.recorded_at), **r._asdict()) for r in readings],
+            batch_size=settings.TELEMETRY_BATCH_SIZE
+        )
+
+        existing = models.LatestTelemetry.objects.using(alias).select_for_update().in_bulk(list(latest))
+
+        newer = [r for car_id, r in latest.items() if car_id not in existing or r.recorded_at > existing[car_id].recorded_at]
+
+        # Replacing the rows is two statements, where bulk_update would build a CASE for every row and field
+        models.LatestTelemetry.objects.using(alias).filter(car_id__in=[r.car_id for r in newer if r.car_id in existing]).delete()
+        models.LatestTelemetry.objects.using(alias).bulk_create(
+            [models.LatestTelemetry(**r._asdict()) for r in newer],
+            batch_size=settings.TELEMETRY_BATCH_SIZE,
+            ignore_conflicts=True
+        )
+
+
+class TelemetryBuffer:
+    """Readings waiting to be written to each database, so they are written in a few large batches
+
+    Readings are written once TELEMETRY_FLUSH_SIZE are waiting for a database, and every TELEMETRY_FLUSH_INTERVAL
+    seconds by a background thread unless it is 0. Readings still waiting when a worker stops are lost if it cannot
+    flush them.
+    """
+
+    def __init__(self):
+        self.pending = defaultdict(list)
+        self.lock = threading.Lock()
+        self.flusher = None
+
+    def add(self, alias, readings):
+        """Queue readings for a database, writing them straight away if enough are waiting"""
+        with self.lock:
+            self.pending[alias].extend(readings)
+            full = len(self.pending[alias]) >= settings.TELEMETRY_FLUSH_SIZE
+
+        if settings.TELEMETRY_FLUSH_INTERVAL is None or full:
+            self.flush(alias)
+        elif settings.TELEMETRY_FLUSH_INTERVAL:
+            self.start_flusher()
+
+    def take(self, alias=None):
+        """Remove the waiting readings of a database, or of every database, returning them by database"""
+        with self.lock:
+            if alias is None:
+                taken, self.pending = dict(self.pending), defaultdict(list)
+            else:
+                taken = {alias: self.pending.pop(alias, [])}
+
+        return {a: readings for a, readings in taken.items() if readings}
+
+    def flush(self, alias=None):
+        """Write the waiting readings of a database, or of every database, returning the number written
+
+        A batch that cannot be written does not fail the request that happened to fill the buffer. Readings that
+        break a constraint, such as those of a car deleted since they were accepted, are dropped and the rest are
+        written, while readings that could not be written because the database is unavailable wait for the next flush.
+        """
+        count = 0
+        for a, readings in self.take(alias).items():
+            try:
+                try:
+                    write(a, readings)
+                except IntegrityError:
+                    readings = self.drop_invalid(a, readings)
+                    write(a, readings)
+            except IntegrityError:
+                logger.exception('Dropped %d telemetry readings that could not be written', len(readings))
+                continue
+            except DatabaseError:
+                logger.exception('Could not write %d telemetry readings, they will be retried', len(readings))
+                self.requeue(a, readings)
+                continue
+
+            count += len(readings)
+        return count
+
+    def drop_invalid(self, alias, readings):
+        """Return the readings that can be stored, logging those of cars that no longer exist or with negative days"""
+        known = set(
+            models.Car.objects.using(alias).filter(pk__in={r.car_id for r in readings}).values_list('pk', flat=True)
+        )
+        valid = [r for r in readings if r.car_id in known and r.recorded_at >= EARLIEST]
+
+        logger.warning('Dropped %d telemetry readings of deleted cars or from before 1970', len(readings) - len(valid))
+        return valid
+
+    def requeue(self, alias, readings):
+        """Put readings back at the front of a database's waiting readings"""
+        with self.lock:
+            self.pending[alias][:0] = readings
+
+    def start_flusher(self):
+        """Start the thread that writes waiting readings every TELEMETRY_FLUSH_INTERVAL seconds if it is not running"""
+        with self.lock:
+            if self.flusher is not None:
+                return
+            self.flusher = threading.Thread(target=self.flush_periodically, daemon=True)
+
+        self.flusher.start()
+        atexit.register(self.flush)
+
+    def flush_periodically(self):
+        """Write the waiting readings every interval"""
+        while True:
+            time.sleep(settings.TELEMETRY_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                # The thread keeps running so later readings are still written
+                logger.exception('Could not write telemetry readings')
+            finally:
+                close_old_connections()
+
+
+# The readings of this process waiting to be written, shared by every request it serves
+buffer = TelemetryBuffer()
+
+
+def ingest(data):
+    """Parse the readings sent by cars and queue them to be written, returning the number accepted and any errors
+
+    Readings that are invalid or for unknown cars are left out, without stopping the rest from being accepted.
+    """
+    alias = fleet_database()
+    readings, errors = [], []
+
+    for index, reading in enumerate(data):
+        try:
+            readings.append((index, parse_reading(reading)))
+        except InvalidReading as e:
+            errors.append({'index': index, 'error': str(e)})
+
+    if not readings:
+        return 0, errors
+
+    car_ids = {r.car_id for _, r in readings}
+    known = set(models.Car.objects.using(alias).filter(pk__in=car_ids).values_list('pk', flat=True))
+
+    accepted = []
+    for index, reading in readings:
+        if reading.car_id in known:
+            accepted.append(reading)
+        else:
+            errors.append({'index': index, 'error': f'There is no car {reading.car_id}.'})
+
+    buffer.add(alias, accepted)
+    return len(accepted), sorted(errors, key=lambda e: e['index'])
+
+
+def readings(car_id, start, end, limit):
+    """Return a car's readings between two times, oldest first"""
+    return models.TelemetryReading.objects.filter(
+        day__range=(day_of(start), day_of(end)), car_id=car_id, recorded_at__gte=start, recorded_at__lt=end
+    ).order_by('recorded_at')[:limit]
+
+
+def prune(now=None):
+    """Drop the days of readings older than TELEMETRY_RETENTION_DAYS, returning the number of readings dropped"""
+    oldest = day_of((now or timezone.now()) - timedelta(days=settings.TELEMETRY_RETENTION_DAYS))
+    return models.TelemetryReading.objects.filter(day__lt=oldest).delete()[0]
@@ -0,0 +1,119 @@
+import time
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.test import Client
+
+from rest_framework import status
+
+from carmanagement_api.models import Car, TokenRevocation
+from carmanagement_api import authentication
+
+
+class SignedTokenTestCase(TestCase):
+    """Tests for authenticating with signed tokens"""
+
+    def setUp(self):
+        """Set up an admin and a car, with nothing cached from earlier tests"""
+        authentication.principals.clear()
+        authentication.deny_list.loaded_at = None
+        User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.car = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+
+    def token(self, username="admin", password="password"):
+        """Return a token issued for a username and password"""
+        response = Client().post("/api/tokens/", {"username": username, "password": password}, content_type="application/json")
+        return response.json()["token"]
+
+    def test_token_authenticates_admin(self):
+        """Test that a token of an admin passes the admin only views"""
+        response = Client().get("/api/regions/", HTTP_AUTHORIZATION=f"Bearer {self.token()}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_wrong_password(self):
+        """Test that no token is issued for a wrong password"""
+        response = Client().post("/api/tokens/", {"username": "admin", "password": "wrong"}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tampered_token_is_rejected(self):
+        """Test that a token which was changed after it was signed is rejected"""
+        response = Client().get("/api/regions/", HTTP_AUTHORIZATION=f"Bearer {self.token()}x")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_expired_token_is_rejected(self):
+        """Test that a token cannot be used once it has expired"""
+        with self.settings(TOKEN_MAX_AGE=-1):
+            token = self.token()
+
+        response = Client().get("/api/regions/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        # Session authentication comes first, so failures are reported as 403 rather than asking for a token
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.json()["detail"], "Token has expired.")
+
+    def test_revoked_token_is_rejected(self):
+        """Test that a token cannot be used once it has been revoked, while other tokens still can"""
+        token, other = self.token(), self.token()
+
+        response = Client().delete("/api/tokens/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = Client().get("/api/regions/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = Client().get("/api/regions/", HTTP_AUTHORIZATION=f"Bearer {other}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_revoking_every_token_of_a_user(self):
+        """Test that the revoke_tokens command revokes every token issued to the user so far"""
+        token = self.token()
+
+        call_command("revoke_tokens", "admin", stdout=mock.Mock())
+
+        response = Client().get("/api/regions/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(TokenRevocation.objects.get().token_id, "")
+
+    def test_token_issued_after_revoking_every_token(self):
+        """Test that a token issued straight after every token of its user was revoked, in the same second, is accepted"""
+        user = User.objects.get()
+        revoked_at = int(time.time()) + 0.5
+        with mock.patch("django.utils.timezone.now", return_value=datetime.fromtimestamp(revoked_at, timezone.utc)):
+            authentication.revoke(user.pk)
+
+        with mock.patch("time.time", return_value=revoked_at - 0.25):
+            before, _ = authentication.issue_token(user)
+        with mock.patch("time.time", return_value=revoked_at + 0.25):
+            after, _ = authentication.issue_token(user)
+
+        self.assertTrue(authentication.deny_list.denies(authentication.principals.get(before)))
+        self.assertFalse(authentication.deny_list.denies(authentication.principals.get(after)))
+
+    def test_deny_list_is_refreshed_periodically(self):
+        """Test that a revocation made by another worker is only read once the deny-list is due to be reloaded"""
+        token = self.token()
+        authentication.deny_list.load()
+        TokenRevocation.objects.create(
+            user=User.objects.get(), token_id=authentication.principals.get(token).token_id,
+            revoked_at="2030-01-01T00:00Z", expires_at="2030-01-01T00:00Z"
+        )
+
+        response = Client().get("/api/regions/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.settings(TOKEN_DENY_LIST_REFRESH=-1):
+            response = Client().get("/api/regions/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_authentication_adds_no_queries(self):
+        """Test that retrieving a car with a token makes no more queries than retrieving it anonymously"""
+        token = self.token()
+        authentication.deny_list.load()
+
+        with self.assertNumQueries(1):
+            Client().get(f"/api/cars/{self.car.id}/")
+        with self.assertNumQueries(1):
+            response = Client().get(f"/api/cars/{self.car.id}/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -0,0 +1,96 @@
+from django.test import TestCase
+from django.test import Client
+from django.core.management import call_command
+from io import StringIO
+
+from rest_framework import status
+
+from carmanagement_api.models import Branch, Driver, Car, BranchAvailability
+from carmanagement_api import services
+
+
+class AvailabilityViewTestCase(TestCase):
+    """Tests for the availability endpoint and the counts behind it"""
+    def setUp(self):
+        """Set up a small fleet spread across branches and drivers"""
+        leeds = Branch.objects.create(city="Leeds", postcode="LS1 4DY")
+        london = Branch.objects.create(city="London", postcode="WC2B 6ST")
+        driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+
+        for branch, make, model, year in [
+            (leeds, "Ford", "Fiesta", 2018),
+            (leeds, "Ford", "Fiesta", 2018),
+            (leeds, "Ford", "Fiesta", 2016),
+            (london, "Ford", "Fiesta", 2018),
+            (london, "Tesla", "Model S", 2016),
+        ]:
+            services.return_car(Car.objects.create(make=make, model=model, year_of_manufacture=year), branch)
+
+        services.rent_car(Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018), driver)
+        Car.objects.create(make="Ford", model="Focus", year_of_manufacture=2017)
+
+    def test_count_with_filters(self):
+        """Test that the number of matching cars available at branches in a city is returned"""
+        c = Client()
+        response = c.get("/api/availability/", {"make": "Ford", "model": "Fiesta", "year": 2018, "city": "Leeds"})
+
+        self.assertEqual(response.json(), {"count": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_count_with_year_range(self):
+        """Test that cars can be filtered by a range of years"""
+        c = Client()
+        response = c.get("/api/availability/", {"make": "Ford", "year_max": 2017})
+
+        self.assertEqual(response.json(), {"count": 1})
+
+    def test_grouped_counts(self):
+        """Test that counts are returned for each group"""
+        c = Client()
+        response = c.get("/api/availability/", {"make": "Ford", "group_by": "city,year"})
+
+        self.assertEqual(response.json(), {
+            "count": 4,
+            "results": [
+                {"city": "Leeds", "year": 2016, "count": 1},
+                {"city": "Leeds", "year": 2018, "count": 2},
+                {"city": "London", "year": 2018, "count": 1},
+            ]
+        })
+
+    def test_counts_for_other_locations(self):
+        """Test that cars with drivers and unassigned cars can be counted"""
+        c = Client()
+
+        self.assertEqual(c.get("/api/availability/", {"location": "driver"}).json(), {"count": 1})
+        self.assertEqual(c.get("/api/availability/", {"location": "none", "group_by": "model"}).json(), {
+            "count": 1,
+            "results": [{"model": "Focus", "count": 1}]
+        })
+
+    def test_invalid_group_by_returns_400(self):
+        """Test that grouping by an unknown field returns an error"""
+        c = Client()
+        response = c.get("/api/availability/", {"group_by": "colour"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_counts_follow_rent_and_car_changes(self):
+        """Test that renting a car or changing its details updates the counts"""
+        car = Car.objects.get(make="Tesla")
+        c = Client()
+        c.patch(f"/api/cars/{car.id}/", {"model": "Model 3"}, content_type="application/json")
+
+        self.assertEqual(c.get("/api/availability/", {"model": "Model 3"}).json(), {"count": 1})
+
+        services.rent_car(Car.objects.get(pk=car.pk), Driver.objects.get())
+
+        self.assertEqual(c.get("/api/availability/", {"model": "Model 3"}).json(), {"count": 0})
+
+    def test_rebuild_command_repairs_counts(self):
+        """Test that the rebuild command recounts the cars at each branch"""
+        BranchAvailability.objects.update(available=0)
+        call_command("rebuild_availability", stdout=StringIO())
+
+        c = Client()
+        self.assertEqual(c.get("/api/availability/").json(), {"count": 5})
@@ -0,0 +1,87 @@
+import json
+
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test import Client
+
+from rest_framework import status
+
+from carmanagement_api.models import Branch, Driver, Car, BranchInventory, DriverInventory
+from carmanagement_api import batch
+
+
+class BatchTestCase(TestCase):
+    """Tests for running several requests with the batch endpoint"""
+    def setUp(self):
+        """Set up objects to be used in testing the batch endpoint"""
+        self.car = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+        self.driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+        self.branch = Branch.objects.create(city="London", postcode="WC2B 6ST")
+        BranchInventory.objects.create(car=self.car, branch=self.branch)
+
+    def post_batch(self, batch):
+        """Send a batch and return the response"""
+        return Client().post("/api/batch/", json.dumps(batch), content_type="application/json")
+
+    def test_later_requests_use_earlier_results(self):
+        """Test that a driver found by one request can be used to rent a car in the next"""
+        response = self.post_batch({"requests": [
+            {"name": "driver", "method": "GET", "path": "/api/drivers/?name=traynor"},
+            {"name": "car", "method": "GET", "path": f"/api/cars/{self.car.id}/"},
+            {"method": "POST", "path": "/api/rent-car/", "body": {"car": "{{car.body.id}}", "driver": "{{driver.body.0.id}}"}}
+        ]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r["status"] for r in response.json()["responses"]], [200, 200, 201])
+        self.assertEqual(DriverInventory.objects.get(car=self.car).driver, self.driver)
+
+    def test_transaction_is_rolled_back_on_error(self):
+        """Test that a failing request undoes the earlier requests of a transactional batch and stops it"""
+        response = self.post_batch({"transaction": True, "requests": [
+            {"method": "POST", "path": "/api/rent-car/", "body": {"car": self.car.id, "driver": self.driver.id}},
+            {"method": "POST", "path": "/api/rent-car/", "body": {"car": self.car.id, "driver": self.driver.id}},
+            {"method": "GET", "path": "/api/cars/"}
+        ]})
+
+        self.assertFalse(response.json()["committed"])
+        self.assertEqual([r["status"] for r in response.json()["responses"]], [201, 400])
+        self.assertFalse(DriverInventory.objects.filter(car=self.car).exists())
+
+    def test_invalid_reference_returns_424(self):
+        """Test that a reference to a response that does not exist fails only that request"""
+        response = self.post_batch({"requests": [
+            {"method": "GET", "path": "/api/cars/{{missing.body.id}}/"},
+            {"method": "GET", "path": "/api/branches/"}
+        ]})
+
+        self.assertEqual([r["status"] for r in response.json()["responses"]], [424, 200])
+
+    def test_only_api_routes_can_be_called(self):
+        """Test that batches cannot call routes outside the API or contain other batches"""
+        response = self.post_batch({"requests": [
+            {"method": "GET", "path": "/admin/"},
+            {"method": "POST", "path": "/api/batch/", "body": {"requests": []}}
+        ]})
+
+        self.assertEqual([r["status"] for r in response.json()["responses"]], [404, 400])
+
+    def test_failing_request_does_not_stop_the_batch(self):
+        """Test that an error raised by one request is its response, and the requests after it still run"""
+        with self.assertLogs("carmanagement_api.batch", "ERROR"):
+            response = self.post_batch({"requests": [
+                {"method": "GET", "path": "/api/cars/99999/"},
+                {"method": "GET", "path": f"/api/cars/{self.car.id}/"}
+            ]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r["status"] for r in response.json()["responses"]], [500, 200])
+
+    def test_responses_that_are_not_json(self):
+        """Test that the body of a response that is not JSON is returned as text"""
+        self.assertEqual(batch.parse_content(HttpResponse("a;b 1\n", content_type="text/plain")), "a;b 1\n")
+        self.assertEqual(batch.parse_content(HttpResponse('{"a": 1}', content_type="application/json")), {"a": 1})
+
+    def test_too_many_requests_returns_400(self):
+        """Test that a batch with more requests than the limit is rejected"""
+        response = self.post_batch({"requests": [{"method": "GET", "path": "/api/cars/"}] * 21})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,70 @@
+import gzip
+import json
+
+from django.test import TestCase
+from django.test import Client
+from django.http import StreamingHttpResponse
+from django.test.client import RequestFactory
+
+from carmanagement_api.models import Car
+from carmanagement_api.compression import choose_encoding, CompressionMiddleware
+from carmanagement_api import services
+
+
+class CompressionTestCase(TestCase):
+    """Tests for compressing responses and rendering lists as columns"""
+    def setUp(self):
+        """Set up a fleet of cars large enough to be worth compressing"""
+        Car.objects.bulk_create([
+            Car(make="Ford", model=f"Fiesta {i % 7}", year_of_manufacture=2010 + i % 9) for i in range(300)
+        ])
+        services.rebuild_car_listings()
+
+    def test_encoding_negotiation(self):
+        """Test that the client's preferences are respected and gzip is used when it is the only shared encoding"""
+        self.assertEqual(choose_encoding("gzip, deflate"), "gzip")
+        self.assertEqual(choose_encoding("identity"), None)
+        self.assertEqual(choose_encoding("gzip;q=0, deflate"), None)
+        self.assertEqual(choose_encoding("*"), choose_encoding("zstd, br, gzip"))
+
+    def test_large_list_is_compressed(self):
+        """Test that the car list is gzipped to a fraction of its size when the client accepts it"""
+        c = Client()
+        plain = c.get("/api/cars/", HTTP_ACCEPT="application/json")
+        compressed = c.get("/api/cars/", HTTP_ACCEPT="application/json", HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertLess(len(compressed.content) * 10, len(plain.content))
+
+    def test_small_response_is_not_compressed(self):
+        """Test that responses too small to benefit are sent as they are"""
+        response = Client().get(f"/api/cars/{Car.objects.first().id}/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_streamed_response_is_compressed_in_chunks(self):
+        """Test that each chunk of a streamed response is flushed so it can be decoded on arrival"""
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip")
+        middleware = CompressionMiddleware(
+            lambda r: StreamingHttpResponse(iter([b'{"a": 1', b', "b": 2}']), content_type="application/json")
+        )
+        chunks = list(middleware(request).streaming_content)
+
+        self.assertGreaterEqual(len(chunks), 3)
+        self.assertEqual(gzip.decompress(b"".join(chunks)), b'{"a": 1, "b": 2}')
+
+    def test_columnar_format(self):
+        """Test that the columnar format gives each field once with an array of its values"""
+        c = Client()
+        rows = c.get("/api/cars/", HTTP_ACCEPT="application/json").json()["cars"]
+        columns = json.loads(c.get("/api/cars/?format=columnar").content)["cars"]
+
+        self.assertEqual(columns["count"], 300)
+        self.assertEqual(columns["columns"]["id"], [r["id"] for r in rows])
+        self.assertEqual(columns["columns"]["currently_with.message"][0], rows[0]["currently_with"]["message"])
+
+    def test_columnar_format_by_accept_header(self):
+        """Test that the columnar format can be requested with the Accept header"""
+        response = Client().get("/api/drivers/", HTTP_ACCEPT="application/vnd.carmanagement.columnar+json")
+        self.assertEqual(json.loads(response.content), {"count": 0, "columns": {}})
@@ -0,0 +1,82 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, RequestFactory, override_settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from carmanagement_api.models import Car, ReplicationHeartbeat
+from carmanagement_api import dbrouters
+from carmanagement_api.throttling import TokenBucketThrottle
+
+
+@override_settings(DATABASE_REPLICAS=["replica"], REPLICA_LAG_CHECK_INTERVAL=0)
+class ReplicaRouterTestCase(TestCase):
+    """Tests for routing reads to replicas and writes to the primary"""
+    def setUp(self):
+        """Reset the cached replica health and sticky clients"""
+        cache.clear()
+        dbrouters._replica_health.clear()
+        self.router = dbrouters.ReplicaRouter()
+
+    def read_alias(self):
+        """Return the database a read would be sent to outside of the test's transaction"""
+        with mock.patch.object(dbrouters.connections["default"], "in_atomic_block", False):
+            return self.router.db_for_read(Car)
+
+    @mock.patch("carmanagement_api.dbrouters.replica_lag", return_value=0)
+    def test_reads_go_to_replica(self, replica_lag):
+        """Test that reads are sent to a healthy replica and writes to the primary"""
+        self.assertEqual(self.read_alias(), "replica")
+        self.assertEqual(self.router.db_for_write(Car), "default")
+
+    @mock.patch("carmanagement_api.dbrouters.replica_lag", return_value=60)
+    def test_lagging_replica_is_skipped(self, replica_lag):
+        """Test that reads go to the primary when the replica is too far behind"""
+        self.assertEqual(self.read_alias(), "default")
+
+    @mock.patch("carmanagement_api.dbrouters.replica_lag", return_value=0)
+    def test_reads_in_transaction_go_to_primary(self, replica_lag):
+        """Test that reads made inside a transaction see the transaction's writes"""
+        self.assertEqual(self.router.db_for_read(Car), "default")
+
+    @mock.patch("carmanagement_api.dbrouters.replica_lag", return_value=0)
+    def test_client_reads_its_own_writes(self, replica_lag):
+        """Test that a client's reads go to the primary for a while after it writes"""
+        factory = RequestFactory()
+        aliases = []
+        middleware = dbrouters.ReplicaRoutingMiddleware(lambda request: aliases.append(self.read_alias()))
+
+        middleware(factory.get("/api/cars/", REMOTE_ADDR="10.0.0.1"))
+        middleware(factory.post("/api/rent-car/", REMOTE_ADDR="10.0.0.1"))
+        middleware(factory.get("/api/cars/", REMOTE_ADDR="10.0.0.1"))
+        middleware(factory.get("/api/cars/", REMOTE_ADDR="10.0.0.2"))
+
+        self.assertEqual(aliases, ["replica", "default", "default", "replica"])
+
+    @override_settings(REST_FRAMEWORK={"NUM_PROXIES": 1})
+    def test_clients_are_identified_like_the_rate_limiter(self):
+        """Test that clients behind a proxy are identified by the same address as the rate limiter uses"""
+        request = RequestFactory().get("/api/cars/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="1.2.3.4, 5.6.7.8")
+
+        self.assertEqual(dbrouters.client_ident(request), "5.6.7.8")
+        self.assertEqual(dbrouters.client_ident(request), TokenBucketThrottle().get_ident(request))
+
+    def test_replicas_are_not_migrated(self):
+        """Test that the schema is only migrated on the primary"""
+        self.assertFalse(self.router.allow_migrate("replica", "carmanagement_api"))
+        self.assertTrue(self.router.allow_migrate("default", "carmanagement_api"))
+
+
+class ReplicaLagTestCase(TestCase):
+    """Tests for measuring the lag of a replica"""
+
+    def test_lag_from_heartbeat(self):
+        """Test that the lag is the age of the last heartbeat the database received"""
+        ReplicationHeartbeat.objects.create(pk=1, updated_at=timezone.now() - timedelta(seconds=30))
+
+        self.assertAlmostEqual(dbrouters.replica_lag("default"), 30, delta=1)
+
+    def test_missing_heartbeat_is_unhealthy(self):
+        """Test that a database without a heartbeat is treated as infinitely far behind"""
+        self.assertEqual(dbrouters.replica_lag("default"), float("inf"))
@@ -0,0 +1,110 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.test import Client
+
+from rest_framework import status
+
+from carmanagement_api.models import Branch, Car, BranchInventory
+from carmanagement_api import geo
+from carmanagement_api import services
+
+
+class GeohashTestCase(TestCase):
+    """Tests for the geohash helpers used by the nearest branch search"""
+
+    def test_encode_geohash(self):
+        """Test that a coordinate is encoded to its known geohash"""
+        self.assertEqual(geo.encode_geohash(57.64911, 10.40744), "u4pruydqq")
+
+    def test_neighbourhood_contains_adjacent_cells(self):
+        """Test that the neighbourhood of a point includes the cell containing it and the cells around it"""
+        cells = geo.neighbourhood(51.5, -0.12, 5)
+
+        self.assertEqual(len(cells), 9)
+        self.assertIn(geo.encode_geohash(51.5, -0.12, 5), cells)
+
+    def test_distance(self):
+        """Test that the distance between London and Leeds is calculated correctly"""
+        self.assertAlmostEqual(geo.distance_km(51.5074, -0.1278, 53.8008, -1.5491), 272, delta=2)
+
+
+class NearestBranchTestCase(TestCase):
+    """Tests for finding the nearest branches with free capacity"""
+    def setUp(self):
+        """Set up branches around London and an offline postcode dataset"""
+        self.london = Branch.objects.create(city="London", postcode="WC2B 6ST", latitude=51.5151, longitude=-0.1211)
+        self.welling = Branch.objects.create(city="Welling", postcode="DA16 3RR", latitude=51.4636, longitude=0.1088, capacity=1)
+        self.leeds = Branch.objects.create(city="Leeds", postcode="LS1 4DY", latitude=53.7960, longitude=-1.5476)
+        Branch.objects.create(city="Nowhere", postcode="AB1 2CD")
+
+        dataset = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+        dataset.write("postcode,latitude,longitude\nSE1 7PB,51.5033,-0.1196\nM1 1AE,53.4808,-2.2426\n")
+        dataset.close()
+        self.dataset = dataset.name
+        geo._offline_postcodes = None
+
+    def tearDown(self):
+        """Remove the offline postcode dataset"""
+        os.remove(self.dataset)
+        geo._offline_postcodes = None
+
+    def test_branches_are_ordered_by_distance(self):
+        """Test that the nearest branches are returned nearest first"""
+        results = services.nearest_branches(51.5033, -0.1196, count=3)
+
+        self.assertEqual([b for b, d in results], [self.london, self.welling, self.leeds])
+
+    def test_full_branches_are_skipped(self):
+        """Test that branches without free capacity are not returned"""
+        BranchInventory.objects.create(car=Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018), branch=self.welling)
+        results = services.nearest_branches(51.4636, 0.1088, count=2)
+
+        self.assertEqual([b for b, d in results], [self.london, self.leeds])
+
+    def test_nearest_endpoint_with_postcode(self):
+        """Test that the nearest endpoint looks up a postcode in the offline dataset"""
+        with override_settings(POSTCODE_DATASET=self.dataset):
+            c = Client()
+            response = c.get("/api/branches/nearest/", {"postcode": "M1 1AE", "count": 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]["id"], self.leeds.id)
+        self.assertEqual(response.json()[0]["free_capacity"], 10)
+
+    def test_changing_postcode_moves_branch(self):
+        """Test that changing a branch's postcode looks up its coordinates again, and an unknown postcode is refused"""
+        with override_settings(POSTCODE_DATASET=self.dataset):
+            c = Client()
+            response = c.patch(f"/api/branches/{self.leeds.id}/", {"postcode": "M1 1AE"}, content_type="application/json")
+            with mock.patch.object(geo, "lookup_postcode", return_value=None):
+                unknown = c.patch(f"/api/branches/{self.leeds.id}/", {"postcode": "ZZ9 9ZZ"}, content_type="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.leeds.refresh_from_db()
+        self.assertEqual((self.leeds.latitude, self.leeds.longitude), (53.4808, -2.2426))
+        self.assertEqual(self.leeds.geohash, geo.encode_geohash(53.4808, -2.2426))
+
+        self.assertEqual(unknown.status_code, status.HTTP_400_BAD_REQUEST)
+        self.leeds.refresh_from_db()
+        self.assertEqual(self.leeds.postcode, "M1 1AE")
+
+    def test_nearest_endpoint_requires_a_location(self):
+        """Test that the nearest endpoint returns an error if no location is given"""
+        c = Client()
+        response = c.get("/api/branches/nearest/", {"latitude": 51.5})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_creating_branch_stores_coordinates(self):
+        """Test that creating a branch resolves and stores the coordinates of its postcode"""
+        with override_settings(POSTCODE_DATASET=self.dataset):
+            c = Client()
+            response = c.post("/api/branches/", {"city": "London", "postcode": "SE1 7PB"})
+
+        branch = Branch.objects.get(postcode="SE1 7PB")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((branch.latitude, branch.longitude), (51.5033, -0.1196))
+        self.assertEqual(branch.geohash, geo.encode_geohash(51.5033, -0.1196))
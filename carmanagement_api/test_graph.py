@@ -0,0 +1,127 @@
+from datetime import date
+
+from django.test import TestCase
+from django.test import Client
+
+from rest_framework import status
+
+from carmanagement_api.models import Branch, Driver, Car
+from carmanagement_api.querypatterns import QueryScalingTestMixin
+from carmanagement_api import services
+
+
+NESTED_QUERY = """
+{
+    cars {
+        make
+        branch { city cars { id } }
+        driver { first_name cars { id model } }
+    }
+}
+"""
+
+
+class GraphQLTestCase(QueryScalingTestMixin, TestCase):
+    """Tests for reading the fleet through GraphQL"""
+
+    def setUp(self):
+        """Set up a branch with a car at it and a driver renting another car"""
+        self.add_rows()
+
+    def add_rows(self):
+        """Add a branch with a car at it and a driver renting another car"""
+        self.branch = Branch.objects.create(city="London", postcode="WC2B 6ST")
+        self.driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth=date(1997, 11, 7))
+        self.at_branch = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+        self.rented = Car.objects.create(make="Tesla", model="Model S", year_of_manufacture=2016)
+        services.return_car(self.at_branch, self.branch)
+        services.rent_car(self.rented, self.driver)
+
+    def query(self, query, **variables):
+        """Post a query, returning the response"""
+        return Client().post("/api/graphql/", {"query": query, "variables": variables}, content_type="application/json")
+
+    def test_nested_query(self):
+        """Test that each car is given with its branch or driver and their cars"""
+        response = self.query(NESTED_QUERY)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {"data": {"cars": [
+            {"make": "Ford", "branch": {"city": "London", "cars": [{"id": str(self.at_branch.id)}]}, "driver": None},
+            {"make": "Tesla", "branch": None,
+             "driver": {"first_name": "Aaron", "cars": [{"id": str(self.rented.id), "model": "Model S"}]}},
+        ]}})
+
+    def test_one_query_per_level(self):
+        """Test that a nested query makes one query for each level of each relation however many rows there are"""
+        # The cars, their branches and drivers, and the cars of those branches and drivers
+        with self.assertNumQueries(5):
+            self.query(NESTED_QUERY)
+
+        self.assertQueriesDoNotScale(
+            self.add_rows, "/api/graphql/", method="post", data={"query": NESTED_QUERY}, content_type="application/json"
+        )
+
+    def test_single_row_and_variables(self):
+        """Test that a row can be looked up by an id given as a variable"""
+        response = self.query("query($id: ID!) { branch(id: $id) { postcode cars { make } } }", id=self.branch.id)
+
+        self.assertEqual(response.json(), {"data": {"branch": {"postcode": "WC2B 6ST", "cars": [{"make": "Ford"}]}}})
+
+    def test_query_string(self):
+        """Test that a query can be sent in the query string"""
+        response = Client().get("/api/graphql/", {"query": "{ drivers(search: \"tray\") { date_of_birth } }"})
+
+        self.assertEqual(response.json(), {"data": {"drivers": [{"date_of_birth": "1997-11-07"}]}})
+
+    def test_invalid_query(self):
+        """Test that queries which do not match the schema, including writes, are rejected before running"""
+        for query in ("{ cars { colour } }", "mutation { cars { id } }", "{ cars {"):
+            response = self.query(query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertNotIn("data", response.json())
+
+    def test_depth_limit(self):
+        """Test that a query nesting too many levels of relations is rejected"""
+        response = self.query("{ cars { branch { cars { driver { cars { branch { city } } } } } } }")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("nests 6 levels deep", response.json()["errors"][0]["message"])
+
+    def test_cost_limit(self):
+        """Test that a query which could load too many rows is rejected, counting limits given as variables"""
+        query = "query($n: Int) { branches(limit: $n) { cars { driver { first_name } } } }"
+
+        response = self.query(query, n=300)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("could load 6300 rows", response.json()["errors"][0]["message"])
+        self.assertEqual(self.query(query, n=10).status_code, status.HTTP_200_OK)
+
+    def test_fragments_are_counted(self):
+        """Test that fields selected through fragments count towards the limits"""
+        query = """
+            { branches(limit: 500) { ...Cars } }
+            fragment Cars on Branch { cars { ... on Car { driver { id } } } }
+        """
+        self.assertIn("could load 10500 rows", self.query(query).json()["errors"][0]["message"])
+
+    def test_limit_is_capped(self):
+        """Test that a list cannot be asked for more rows than allowed"""
+        response = self.query("{ cars(limit: 1000) { id } }")
+
+        self.assertEqual(response.json()["errors"][0]["message"], "limit must be between 1 and 500.")
+
+    def test_null_limit_is_the_default(self):
+        """Test that a limit given as null returns the default number of rows rather than an error"""
+        response = self.query("query($n: Int) { cars(limit: $n) { id } branches(limit: null) { id } }", n=None)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("errors", response.json())
+        self.assertEqual(len(response.json()["data"]["cars"]), 2)
+
+    def test_invalid_id(self):
+        """Test that an id which is not a number is reported clearly"""
+        response = self.query('{ car(id: "abc") { id } }')
+
+        self.assertEqual(response.json()["errors"][0]["message"], "'abc' is not an id, ids are whole numbers.")
+        self.assertEqual(response.json()["data"], {"car": None})
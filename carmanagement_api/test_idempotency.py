@@ -0,0 +1,116 @@
+from django.contrib.auth.models import User
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.test import Client
+from django.core.cache import cache
+from django.test.client import RequestFactory
+
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+
+from rest_framework import status
+
+from carmanagement_api.models import Branch, Driver, Car, BranchInventory, DriverInventory
+from carmanagement_api.idempotency import IN_PROGRESS, fingerprint
+from carmanagement_api import services
+
+
+class IdempotencyTestCase(TestCase):
+    """Tests for Idempotency-Key support on the rent and return endpoints"""
+    def setUp(self):
+        """Set up objects to be used in testing idempotent requests"""
+        cache.clear()
+        self.car = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+        self.driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+        self.branch = Branch.objects.create(city="London", postcode="WC2B 6ST")
+
+    def test_retried_rent_replays_response(self):
+        """Test that retrying a rent request with the same key returns the original response without repeating it"""
+        c = Client()
+        first = c.post("/api/rent-car/", {"car": self.car.id, "driver": self.driver.id}, HTTP_IDEMPOTENCY_KEY="abc")
+        second = c.post("/api/rent-car/", {"car": self.car.id, "driver": self.driver.id}, HTTP_IDEMPOTENCY_KEY="abc")
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(DriverInventory.objects.filter(car=self.car).count(), 1)
+
+    def test_retried_return_does_not_touch_inventory(self):
+        """Test that a replayed return request does not query the inventory tables"""
+        c = Client()
+        c.post("/api/return-car/", {"car": self.car.id, "branch": self.branch.id}, HTTP_IDEMPOTENCY_KEY="def")
+
+        with self.assertNumQueries(0):
+            response = c.post("/api/return-car/", {"car": self.car.id, "branch": self.branch.id}, HTTP_IDEMPOTENCY_KEY="def")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(BranchInventory.objects.filter(car=self.car).count(), 1)
+
+    def test_request_without_key_is_not_replayed(self):
+        """Test that requests without a key are processed every time"""
+        c = Client()
+        c.post("/api/rent-car/", {"car": self.car.id, "driver": self.driver.id})
+        response = c.post("/api/rent-car/", {"car": self.car.id, "driver": self.driver.id})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reusing_key_with_different_request_returns_422(self):
+        """Test that reusing a key for a different request returns an error"""
+        other_car = Car.objects.create(make="Tesla", model="Model S", year_of_manufacture=2016)
+
+        c = Client()
+        c.post("/api/rent-car/", {"car": self.car.id, "driver": self.driver.id}, HTTP_IDEMPOTENCY_KEY="ghi")
+        response = c.post("/api/rent-car/", {"car": other_car.id, "driver": self.driver.id}, HTTP_IDEMPOTENCY_KEY="ghi")
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertFalse(DriverInventory.objects.filter(car=other_car).exists())
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0.1)
+    def test_concurrent_duplicate_returns_409(self):
+        """Test that a duplicate of a request that is still being processed returns a conflict once the wait times out"""
+        cache.add("idempotency:anon-127.0.0.1:/api/rent-car/:jkl", (IN_PROGRESS, ""), 60)
+
+        c = Client()
+        response = c.post("/api/rent-car/", {"car": self.car.id, "driver": self.driver.id}, HTTP_IDEMPOTENCY_KEY="jkl")
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(DriverInventory.objects.filter(car=self.car).exists())
+
+    def test_keys_are_scoped_to_the_caller(self):
+        """Test that another caller using the same key is not replayed the first caller's response"""
+        first = Client()
+        first.force_login(User.objects.create_user("first"))
+        second = Client()
+        second.force_login(User.objects.create_user("second"))
+        other_car = Car.objects.create(make="Tesla", model="Model S", year_of_manufacture=2016)
+
+        first.post("/api/rent-car/", {"car": self.car.id, "driver": self.driver.id}, HTTP_IDEMPOTENCY_KEY="mno")
+        response = second.post("/api/rent-car/", {"car": other_car.id, "driver": self.driver.id}, HTTP_IDEMPOTENCY_KEY="mno")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+        self.assertTrue(DriverInventory.objects.filter(car=other_car).exists())
+
+    def test_fingerprint_of_any_body(self):
+        """Test that bodies that are not objects can be fingerprinted, and different bodies differ"""
+        def body_fingerprint(body):
+            request = RequestFactory().post("/api/batch/", body, content_type="application/json")
+            return fingerprint(Request(request, parsers=[JSONParser()]))
+
+        self.assertEqual(body_fingerprint('[1, 2]'), body_fingerprint('[1, 2]'))
+        self.assertNotEqual(body_fingerprint('[1, 2]'), body_fingerprint('[2, 1]'))
+        self.assertNotEqual(body_fingerprint('{"car": 1}'), body_fingerprint('{"car": [1]}'))
+
+    @override_settings(IDEMPOTENCY_KEY_TTL=600, IDEMPOTENCY_WAIT_TIMEOUT=0.1)
+    def test_claim_lasts_as_long_as_the_key(self):
+        """Test that a key is claimed for as long as it is kept, and released if the request fails"""
+        with mock.patch.object(cache, "add", wraps=cache.add) as add:
+            Client().post("/api/rent-car/", {"car": self.car.id, "driver": self.driver.id}, HTTP_IDEMPOTENCY_KEY="pqr")
+        self.assertEqual(add.call_args[0][2], 600)
+
+        with mock.patch.object(services, "rent_car", side_effect=RuntimeError("Failed")):
+            with self.assertRaises(RuntimeError):
+                Client().post("/api/rent-car/", {"car": self.car.id, "driver": self.driver.id}, HTTP_IDEMPOTENCY_KEY="stu")
+        self.assertIsNone(cache.get("idempotency:anon-127.0.0.1:/api/rent-car/:stu"))
@@ -0,0 +1,102 @@
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test import Client
+from django.test import override_settings
+
+from rest_framework import status
+
+from carmanagement_api.models import Branch, Car
+from carmanagement_api import profiling
+from carmanagement_api import services
+
+
+def slow_function():
+    """Take long enough to be sampled"""
+    time.sleep(0.05)
+
+
+class ProfilerTestCase(TestCase):
+    """Tests for sampling the stack of a request"""
+
+    def test_samples_are_collapsed_below_the_root(self):
+        """Test that samples give the stack from the frame that started the profiler down"""
+        with profiling.Profiler(0.001) as profiler:
+            slow_function()
+
+        stack, count = profiler.stacks.most_common(1)[0]
+        self.assertTrue(stack.startswith("slow_function (carmanagement_api/test_profiling.py:"))
+        self.assertGreater(count, 10)
+        self.assertIn(f"{stack} {count}\n", profiler.folded())
+
+    def test_queries_are_attributed_to_their_frame(self):
+        """Test that each query is recorded with the frame of this app that issued it"""
+        branch = Branch.objects.create(city="London", postcode="WC2B 6ST")
+
+        with profiling.Profiler(0.001) as profiler:
+            services.branch_states()
+
+        self.assertEqual(len(profiler.queries), 1)
+        self.assertIn(branch._meta.db_table, profiler.queries[0]["sql"])
+        self.assertTrue(profiler.queries[0]["frame"].startswith("branch_states (carmanagement_api/services.py:"))
+
+    def test_sql_is_one_frame(self):
+        """Test that a statement is shortened to a single line without semicolons"""
+        self.assertEqual(profiling.summarise_sql("SELECT 1;\n  SELECT   2"), "SELECT 1, SELECT 2")
+        self.assertEqual(len(profiling.summarise_sql("x" * 500)), 120)
+
+
+class ProfilingMiddlewareTestCase(TestCase):
+    """Tests for profiling requests on demand"""
+
+    def setUp(self):
+        """Set up a car, and an admin client whose profiles are written to a temporary directory"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(PROFILE_DIR=directory, PROFILE_INTERVAL=0.001, PROFILE_KEEP=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        services.return_car(
+            Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018),
+            Branch.objects.create(city="London", postcode="WC2B 6ST")
+        )
+        self.client = Client()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+
+    def test_profiled_request(self):
+        """Test that a request asking to be profiled is listed with its queries and collapsed stacks"""
+        response = self.client.get("/api/cars/?search=ford", HTTP_X_PROFILE="1")
+        profile_id = response["X-Profile-Id"]
+
+        profiles = self.client.get("/api/profiles/").json()["results"]
+        self.assertEqual([(p["id"], p["path"], p["status"]) for p in profiles], [(profile_id, "/api/cars/?search=ford", 200)])
+
+        profile = self.client.get(f"/api/profiles/{profile_id}/").json()
+        self.assertTrue(any(q["frame"].startswith("list (carmanagement_api/views.py:") for q in profile["queries"]))
+
+        response = self.client.get(f"/api/profiles/{profile_id}/flamegraph/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+
+    def test_only_recent_profiles_are_kept(self):
+        """Test that old profiles are removed once more than PROFILE_KEEP have been made"""
+        ids = [self.client.get("/api/cars/?profile=1")["X-Profile-Id"] for _ in range(3)]
+
+        self.assertEqual(profiling.profile_ids(), ids[:0:-1])
+        self.assertEqual(self.client.get(f"/api/profiles/{ids[0]}/").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_other_clients_are_not_profiled(self):
+        """Test that only admin users can profile their requests or read the profiles"""
+        response = Client().get("/api/cars/", HTTP_X_PROFILE="1")
+
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(profiling.profile_ids(), [])
+        self.assertEqual(Client().get("/api/profiles/").status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_unprofiled_request(self):
+        """Test that requests which do not ask to be profiled are not"""
+        self.assertNotIn("X-Profile-Id", self.client.get("/api/cars/"))
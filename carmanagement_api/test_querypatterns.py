@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.test import override_settings
+
+from carmanagement_api.models import Branch, Car, CarListing
+from carmanagement_api.querypatterns import QueryPatterns, QueryScalingTestMixin, query_shape
+from carmanagement_api import services
+
+
+class QueryPatternsTestCase(QueryScalingTestMixin, TestCase):
+    """Tests for finding queries that are repeated for each row"""
+
+    def add_cars(self):
+        """Add a branch with two cars at it"""
+        branch = Branch.objects.create(city="London", postcode="WC2B 6ST")
+        for _ in range(2):
+            services.return_car(Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018), branch)
+
+    def test_values_are_left_out_of_shapes(self):
+        """Test that queries which only differ in their values have the same shape"""
+        self.assertEqual(
+            query_shape('SELECT * FROM "car" WHERE "id" IN (1, 2, 3) AND "make" = \'Ford\''),
+            query_shape('SELECT *\n FROM "car" WHERE "id" IN (%s) AND "make" = %s')
+        )
+
+    def test_query_for_each_row_is_found(self):
+        """Test that a query made for each car is reported with the frame that made it"""
+        self.add_cars()
+
+        with QueryPatterns() as patterns:
+            for car in Car.objects.all():
+                car.current_branch.city
+
+        ((shape, count, frame),) = patterns.repeated(2)
+        self.assertEqual(count, 2)
+        self.assertIn('"carmanagement_api_branch"', shape)
+        self.assertTrue(frame.startswith("test_query_for_each_row_is_found (carmanagement_api/test_querypatterns.py:"))
+
+    def test_scaling_endpoint_fails(self):
+        """Test that the test mixin fails an endpoint that makes a query for each row"""
+        with mock.patch.object(CarListing, "as_json", lambda listing: {"make": listing.car.make}):
+            with self.assertRaisesRegex(AssertionError, r"made 3 queries and then 5 with more rows"):
+                self.assertQueriesDoNotScale(self.add_cars, "/api/cars/")
+
+    @override_settings(DEBUG=True, QUERY_REPEAT_THRESHOLD=2)
+    def test_middleware_reports_repeated_queries(self):
+        """Test that repeated queries are logged and counted in a header while DEBUG is on"""
+        self.add_cars()
+
+        with mock.patch.object(CarListing, "as_json", lambda listing: {"make": listing.car.make}):
+            with self.assertLogs("carmanagement_api.querypatterns", "WARNING"):
+                response = self.client.get("/api/cars/")
+
+        self.assertEqual(response["X-Repeated-Queries"], "1")
+        self.assertNotIn("X-Repeated-Queries", self.client.get("/api/cars/"))
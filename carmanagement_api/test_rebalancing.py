@@ -0,0 +1,117 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test import Client
+from django.utils import timezone
+
+from rest_framework import status
+
+from carmanagement_api.models import Branch, Driver, Car, BranchInventory
+from carmanagement_api import rebalancing
+from carmanagement_api import services
+
+
+class PlanTestCase(TestCase):
+    """Tests for planning transfers between branches"""
+
+    def test_cars_go_to_the_nearest_branch(self):
+        """Test that a full branch sends its spare cars to the nearest branch that is short of them"""
+        branches = [
+            rebalancing.BranchState(1, 51.5151, -0.1211, 10, 10),  # London
+            rebalancing.BranchState(2, 51.4636, 0.1088, 0, 10),    # Welling
+            rebalancing.BranchState(3, 53.7960, -1.5476, 0, 10),   # Leeds
+        ]
+
+        transfers = rebalancing.plan(branches, 0.5)
+
+        self.assertEqual([(t.from_branch_id, t.to_branch_id, t.count) for t in transfers], [(1, 2, 5)])
+        self.assertAlmostEqual(transfers[0].distance_km, 16.9, places=1)
+
+    def test_every_branch_reaches_its_target(self):
+        """Test that when there are enough spare cars every branch short of them reaches its target and none are lost"""
+        rng = random.Random(1)
+        branches = []
+        for i in range(500):
+            capacity = rng.randint(1, 20)
+            branches.append(rebalancing.BranchState(i, rng.uniform(50, 58), rng.uniform(-5, 1), rng.randint(0, capacity), capacity))
+
+        # Add a large branch with enough spare cars for every branch that is short of them
+        shortfall = sum(max(rebalancing.target(b, 0.5) - b.occupancy, 0) for b in branches)
+        branches.append(rebalancing.BranchState(500, 54, -2, 2 * shortfall, 2 * shortfall))
+
+        occupancy = {b.id: b.occupancy for b in branches}
+        for t in rebalancing.plan(branches, 0.5):
+            occupancy[t.from_branch_id] -= t.count
+            occupancy[t.to_branch_id] += t.count
+
+        for b in branches:
+            if b.occupancy < rebalancing.target(b, 0.5):
+                self.assertEqual(occupancy[b.id], rebalancing.target(b, 0.5))
+            else:
+                self.assertGreaterEqual(occupancy[b.id], rebalancing.target(b, 0.5))
+        self.assertEqual(sum(occupancy.values()), sum(b.occupancy for b in branches))
+
+    def test_balanced_fleet_needs_no_transfers(self):
+        """Test that no transfers are planned when every branch is at its target"""
+        branches = [rebalancing.BranchState(i, 51 + i, 0, 8, 10) for i in range(3)]
+        self.assertEqual(rebalancing.plan(branches, 0.8), [])
+
+
+class RebalanceViewTestCase(TestCase):
+    """Tests for the rebalancing endpoint"""
+
+    def setUp(self):
+        """Set up a full branch in London and empty branches in Welling and Leeds"""
+        self.london = Branch.objects.create(city="London", postcode="WC2B 6ST", latitude=51.5151, longitude=-0.1211, capacity=4)
+        self.welling = Branch.objects.create(city="Welling", postcode="DA16 3RR", latitude=51.4636, longitude=0.1088, capacity=4)
+        self.leeds = Branch.objects.create(city="Leeds", postcode="LS1 4DY", latitude=53.7960, longitude=-1.5476, capacity=4)
+
+        self.cars = [Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018) for _ in range(4)]
+        for car in self.cars:
+            services.return_car(car, self.london)
+
+        self.client = Client()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        services._schedulers.clear()
+
+    def test_planning_does_not_move_cars(self):
+        """Test that getting a plan lists the transfers without moving any cars"""
+        response = self.client.get("/api/rebalance/", {"fill": 0.5})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["cars"], 2)
+        self.assertEqual(response.json()["transfers"][0]["to_branch_id"], self.welling.id)
+        self.assertEqual(BranchInventory.objects.filter(branch=self.london).count(), 4)
+
+    def test_rebalancing_moves_cars(self):
+        """Test that posting a plan moves the cars and keeps their locations in step"""
+        response = self.client.post("/api/rebalance/", {"fill": 0.5})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()["moves"]), 2)
+        self.assertEqual(BranchInventory.objects.filter(branch=self.welling).count(), 2)
+        for move in response.json()["moves"]:
+            self.assertEqual(Car.objects.get(pk=move["car"]).currently_with, self.welling)
+
+    def test_reserved_cars_are_not_moved(self):
+        """Test that cars reserved for pickup at their branch stay where they are"""
+        driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+        start = timezone.now() + timedelta(days=1)
+        for car in self.cars[:3]:
+            services.create_reservation(car, driver, self.london, self.london, start, start + timedelta(hours=2))
+
+        response = self.client.post("/api/rebalance/", {"fill": 0.5})
+
+        self.assertEqual([m["car"] for m in response.json()["moves"]], [self.cars[3].id])
+
+    def test_invalid_fill_is_rejected(self):
+        """Test that a fill level outside 0 to 1 is rejected"""
+        response = self.client.get("/api/rebalance/", {"fill": 2})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebalancing_requires_admin(self):
+        """Test that other clients cannot plan or move cars"""
+        self.assertEqual(Client().get("/api/rebalance/").status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Client().post("/api/rebalance/").status_code, status.HTTP_403_FORBIDDEN)
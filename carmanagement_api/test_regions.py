@@ -0,0 +1,85 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test import Client
+
+from rest_framework import status
+
+from carmanagement_api.models import Branch, Driver, Car, DriverInventory
+from carmanagement_api.dbrouters import use_region
+from carmanagement_api import services
+
+
+# The settings only define a database for each region when REGIONS is set, so the test runner adds an in-memory
+# database for each region these tests use
+REGIONS = {'north': 'region_north', 'south': 'region_south'}
+
+
+@override_settings(DATABASE_REGIONS=REGIONS, ALLOWED_HOSTS=['.testserver'])
+class RegionRoutingTestCase(TestCase):
+    """Tests for serving each region's fleet data from its own database"""
+    databases = {'default', 'region_north', 'region_south'}
+
+    def setUp(self):
+        """Set up a car in each region"""
+        for region, make in (('north', 'Ford'), ('south', 'Tesla')):
+            with use_region(region):
+                Car.objects.create(make=make, model="Model", year_of_manufacture=2018)
+
+    def test_header_selects_region(self):
+        """Test that a car added with the X-Region header is stored only in that region's database"""
+        c = Client()
+        response = c.post("/api/cars/", {"make": "Reliant", "model": "Robin", "year_of_manufacture": 1990}, HTTP_X_REGION="north")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Car.objects.using('region_north').filter(make="Reliant").exists())
+        self.assertFalse(Car.objects.using('region_south').filter(make="Reliant").exists())
+        self.assertFalse(Car.objects.using('default').filter(make="Reliant").exists())
+
+    def test_subdomain_selects_region(self):
+        """Test that listing cars through a region's subdomain only shows that region's cars"""
+        response = Client().get("/api/cars/", HTTP_HOST="south.testserver")
+        self.assertEqual([car["make"] for car in response.json()["cars"]], ["Tesla"])
+
+    def test_unknown_region_returns_400(self):
+        """Test that naming a region that does not exist returns an error"""
+        response = Client().get("/api/cars/", HTTP_X_REGION="west")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rent_runs_in_region_database(self):
+        """Test that renting and returning a car is done in its region's database"""
+        with use_region('south'):
+            car = Car.objects.get(make="Tesla")
+            branch = Branch.objects.create(city="Bristol", postcode="BS1 4DJ")
+            driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+            services.return_car(car, branch)
+            services.rent_car(car, driver)
+
+        self.assertTrue(DriverInventory.objects.using('region_south').filter(car=car).exists())
+        self.assertFalse(DriverInventory.objects.using('region_north').exists())
+
+
+@override_settings(DATABASE_REGIONS=REGIONS)
+class RegionFanOutTestCase(TransactionTestCase):
+    """Tests for aggregate queries across every region"""
+    databases = {'default', 'region_north', 'region_south'}
+
+    def test_summary_totals_every_region(self):
+        """Test that an admin can see the fleet of each region and the total"""
+        for region, cars in (('north', 2), ('south', 3)):
+            with use_region(region):
+                Branch.objects.create(city="City", postcode="AB1 2CD", capacity=cars)
+                for _ in range(cars):
+                    Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+
+        c = Client()
+        c.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        response = c.get("/api/regions/")
+
+        self.assertEqual(response.json()["regions"]["north"]["cars"], 2)
+        self.assertEqual(response.json()["regions"]["south"]["cars"], 3)
+        self.assertEqual(response.json()["totals"]["capacity"], 5)
+
+    def test_summary_requires_admin(self):
+        """Test that the summary of every region is not available to other clients"""
+        response = Client().get("/api/regions/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
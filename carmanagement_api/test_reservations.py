@@ -0,0 +1,152 @@
+import random
+from datetime import timedelta
+
+from django.test import TestCase
+from django.test import Client
+from django.utils import timezone
+
+from rest_framework import status
+
+from carmanagement_api.models import Branch, Driver, Car, Reservation
+from carmanagement_api import scheduling
+from carmanagement_api import services
+
+
+class OccupancyTreeTestCase(TestCase):
+    """Tests for the segment tree of branch occupancy changes"""
+
+    def test_peak_matches_running_total(self):
+        """Test that the peak occupancy matches the largest running total of the changes"""
+        rng = random.Random(1)
+        tree = scheduling.OccupancyTree(depth=8)
+        changes = [0] * 256
+
+        for _ in range(500):
+            slot = rng.randrange(256)
+            delta = rng.choice((-1, 1))
+            tree.add(slot, delta)
+            changes[slot] += delta
+
+        for from_slot, after_slot in [(0, 0), (0, 100), (50, 200), (10, 255)]:
+            running = sum(changes[from_slot:after_slot])
+            expected = running
+            for change in changes[after_slot:]:
+                running += change
+                expected = max(expected, running)
+
+            self.assertEqual(tree.peak(from_slot, after_slot), expected)
+
+    def test_removed_changes_are_pruned(self):
+        """Test that nodes are removed once their changes cancel out"""
+        tree = scheduling.OccupancyTree()
+        tree.add(1000, 1)
+        tree.add(1000, -1)
+
+        self.assertEqual(tree.nodes, {})
+
+
+class CarScheduleTestCase(TestCase):
+    """Tests for the sorted reservations of a car"""
+
+    def test_conflicts(self):
+        """Test that only reservations overlapping a period are reported as conflicts"""
+        schedule = scheduling.CarSchedule()
+        schedule.add(scheduling.Booking(1, 1, 1, 1, 100, 200))
+        schedule.add(scheduling.Booking(2, 1, 1, 1, 300, 400))
+
+        self.assertIsNone(schedule.conflict(200, 300))
+        self.assertEqual(schedule.conflict(150, 250).id, 1)
+        self.assertEqual(schedule.conflict(250, 350).id, 2)
+        self.assertEqual(schedule.conflict(0, 1000).id, 2)
+        self.assertIsNone(schedule.conflict(0, 100))
+
+
+class ReservationViewSetTestCase(TestCase):
+    """Tests for the Reservation ViewSet"""
+    def setUp(self):
+        """Set up cars at two branches and a driver"""
+        self.london = Branch.objects.create(city="London", postcode="WC2B 6ST")
+        self.welling = Branch.objects.create(city="Welling", postcode="DA16 3RR", capacity=1)
+        self.driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+        self.car = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+        self.other_car = Car.objects.create(make="Tesla", model="Model S", year_of_manufacture=2016)
+        services.return_car(self.car, self.london)
+        services.return_car(self.other_car, self.london)
+
+        self.now = timezone.now().replace(microsecond=0)
+        services._schedulers.clear()
+
+    def reserve(self, car, start, end, return_branch=None):
+        """Post a reservation starting and ending the given number of hours from now"""
+        data = {
+            "car": car.id,
+            "driver": self.driver.id,
+            "pickup_branch": self.london.id,
+            "start": (self.now + timedelta(hours=start)).isoformat(),
+            "end": (self.now + timedelta(hours=end)).isoformat(),
+        }
+        if return_branch is not None:
+            data["return_branch"] = return_branch.id
+
+        return Client().post("/api/reservations/", data)
+
+    def test_creating_reservation(self):
+        """Test that reserving a free car creates the reservation"""
+        response = self.reserve(self.car, 1, 5)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["return_branch"], self.london.id)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_overlapping_reservation_is_rejected(self):
+        """Test that a car cannot be reserved twice at the same time"""
+        self.reserve(self.car, 1, 5)
+        response = self.reserve(self.car, 4, 8)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_back_to_back_reservations_are_allowed(self):
+        """Test that a reservation can start when the previous one ends"""
+        self.reserve(self.car, 1, 5)
+        response = self.reserve(self.car, 5, 8)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_return_branch_capacity_is_enforced_over_time(self):
+        """Test that a one-way reservation cannot fill a return branch beyond its capacity after it ends"""
+        self.assertEqual(self.reserve(self.car, 1, 5, self.welling).status_code, status.HTTP_201_CREATED)
+        response = self.reserve(self.other_car, 10, 20, self.welling)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_car_must_be_at_pickup_branch(self):
+        """Test that a car moved to another branch by a reservation cannot then be picked up from the first branch"""
+        self.reserve(self.car, 1, 5, self.welling)
+        response = self.reserve(self.car, 10, 20)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_free_cars(self):
+        """Test that only cars without a reservation during a period are listed as free"""
+        self.reserve(self.car, 1, 5)
+
+        c = Client()
+        response = c.get("/api/reservations/free-cars/", {
+            "branch": self.london.id,
+            "start": (self.now + timedelta(hours=2)).isoformat(),
+            "end": (self.now + timedelta(hours=3)).isoformat(),
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c["id"] for c in response.json()], [self.other_car.id])
+
+    def test_cancelling_reservation(self):
+        """Test that cancelling a reservation frees the car"""
+        reservation = self.reserve(self.car, 1, 5).json()
+
+        c = Client()
+        response = c.delete(f"/api/reservations/{reservation['id']}/")
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.reserve(self.car, 1, 5).status_code, status.HTTP_201_CREATED)
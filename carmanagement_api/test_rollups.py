@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import status
+
+from carmanagement_api.models import Branch, Car, OccupancyRollup
+from carmanagement_api import rollups
+from carmanagement_api import services
+
+
+class BucketTestCase(TestCase):
+    """Tests for working out which bucket a moment falls in"""
+
+    def test_bucket_starts(self):
+        """Test that hours and days start on the hour and at midnight, and weeks start on a Monday"""
+        moment = datetime(2026, 10, 15, 13, 45, 12, tzinfo=timezone.utc)
+
+        self.assertEqual(rollups.bucket_start(moment, 'hour'), datetime(2026, 10, 15, 13, tzinfo=timezone.utc))
+        self.assertEqual(rollups.bucket_start(moment, 'day'), datetime(2026, 10, 15, tzinfo=timezone.utc))
+        self.assertEqual(rollups.bucket_start(moment, 'week'), datetime(2026, 10, 12, tzinfo=timezone.utc))
+
+    def test_resolution_suits_the_range(self):
+        """Test that longer ranges are read at coarser resolutions"""
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+        self.assertEqual(rollups.choose_resolution(start, start + timedelta(days=2)), 'hour')
+        self.assertEqual(rollups.choose_resolution(start, start + timedelta(days=90)), 'day')
+        self.assertEqual(rollups.choose_resolution(start, start + timedelta(days=400)), 'week')
+
+
+class SampleOccupancyTestCase(TestCase):
+    """Tests for sampling branch occupancy into rollups"""
+
+    def setUp(self):
+        """Set up a branch with room for four cars holding one"""
+        self.branch = Branch.objects.create(city="London", postcode="WC2B 6ST", capacity=4)
+        self.cars = [Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018) for _ in range(3)]
+        services.return_car(self.cars[0], self.branch)
+        self.now = datetime(2026, 10, 15, 13, 0, tzinfo=timezone.utc)
+
+    def test_samples_are_rolled_up(self):
+        """Test that samples within a bucket are combined into its average and peak"""
+        services.sample_occupancy(self.now)
+        for car in self.cars[1:]:
+            services.return_car(car, self.branch)
+        services.sample_occupancy(self.now + timedelta(minutes=30))
+
+        hour = OccupancyRollup.objects.get(resolution='hour').as_json()
+        self.assertEqual(hour['samples'], 2)
+        self.assertEqual(hour['average_occupancy'], 2)
+        self.assertEqual(hour['peak_occupancy'], 3)
+        self.assertEqual(hour['average_fill'], 0.5)
+        self.assertEqual(hour['peak_fill'], 0.75)
+
+    def test_each_resolution_has_its_own_buckets(self):
+        """Test that a sample in the next hour starts a new hourly bucket but adds to the same day and week"""
+        services.sample_occupancy(self.now)
+        services.sample_occupancy(self.now + timedelta(hours=1))
+
+        self.assertEqual(OccupancyRollup.objects.filter(resolution='hour').count(), 2)
+        self.assertEqual(OccupancyRollup.objects.get(resolution='day').samples, 2)
+        self.assertEqual(OccupancyRollup.objects.get(resolution='week').samples, 2)
+
+    @override_settings(OCCUPANCY_ROLLUP_RETENTION={'hour': 2, 'day': None, 'week': None})
+    def test_expired_buckets_are_dropped(self):
+        """Test that only the configured number of buckets are kept"""
+        for hours in range(5):
+            services.sample_occupancy(self.now + timedelta(hours=hours))
+
+        starts = OccupancyRollup.objects.filter(resolution='hour').order_by('start').values_list('start', flat=True)
+        self.assertEqual(list(starts), [self.now + timedelta(hours=3), self.now + timedelta(hours=4)])
+
+    def test_sampling_queries_do_not_grow_with_branches(self):
+        """Test that sampling takes the same number of queries however many branches there are"""
+        services.sample_occupancy(self.now)
+        with CaptureQueriesContext(connection) as few:
+            services.sample_occupancy(self.now)
+
+        for i in range(20):
+            Branch.objects.create(city=f"City {i}", postcode="WC2B 6ST")
+        services.sample_occupancy(self.now)
+        with CaptureQueriesContext(connection) as many:
+            services.sample_occupancy(self.now)
+
+        self.assertEqual(len(few), len(many))
+
+
+class OccupancyViewTestCase(TestCase):
+    """Tests for the occupancy endpoint"""
+
+    def setUp(self):
+        """Set up two branches with a day of hourly samples"""
+        self.london = Branch.objects.create(city="London", postcode="WC2B 6ST", capacity=4)
+        self.leeds = Branch.objects.create(city="Leeds", postcode="LS1 4DY", capacity=4)
+        self.start = datetime(2026, 10, 15, tzinfo=timezone.utc)
+
+        for hours in range(24):
+            services.sample_occupancy(self.start + timedelta(hours=hours))
+
+        self.client = Client()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+
+    def test_range_of_one_branch(self):
+        """Test that the buckets of one branch within the range are returned"""
+        response = self.client.get("/api/occupancy/", {
+            "branch": self.london.id,
+            "resolution": "hour",
+            "start": "2026-10-15T06:00:00Z",
+            "end": "2026-10-15T12:00:00Z"
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results[0]["start"], "2026-10-15T06:00:00Z")
+        self.assertEqual({r["branch"] for r in results}, {self.london.id})
+
+    def test_resolution_is_chosen_from_the_range(self):
+        """Test that a long range is read from the daily buckets of every branch"""
+        response = self.client.get("/api/occupancy/", {"start": "2026-09-01T00:00:00Z", "end": "2026-11-01T00:00:00Z"})
+
+        self.assertEqual(response.json()["resolution"], "day")
+        self.assertEqual([r["samples"] for r in response.json()["results"]], [24, 24])
+
+    def test_results_are_paged(self):
+        """Test that the buckets of every branch are returned a page at a time, following the next cursor"""
+        query = {"resolution": "hour", "start": "2026-10-15T00:00:00Z", "end": "2026-10-16T00:00:00Z"}
+        everything = self.client.get("/api/occupancy/", query).json()
+        self.assertEqual(len(everything["results"]), 48)
+        self.assertIsNone(everything["next"])
+
+        pages = []
+        response = self.client.get("/api/occupancy/", dict(query, limit=20)).json()
+        pages.append(response["results"])
+        while response["next"]:
+            response = self.client.get("/api/occupancy/", dict(query, limit=20, after=response["next"])).json()
+            pages.append(response["results"])
+
+        self.assertEqual([len(p) for p in pages], [20, 20, 8])
+        self.assertEqual([r for p in pages for r in p], everything["results"])
+
+    @override_settings(OCCUPANCY_PAGE_SIZE=10)
+    def test_page_size_is_capped(self):
+        """Test that no more than OCCUPANCY_PAGE_SIZE buckets are returned at once, and bad cursors are rejected"""
+        query = {"resolution": "hour", "start": "2026-10-15T00:00:00Z", "end": "2026-10-16T00:00:00Z"}
+
+        self.assertEqual(len(self.client.get("/api/occupancy/", dict(query, limit=100)).json()["results"]), 10)
+        response = self.client.get("/api/occupancy/", dict(query, after="london"))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_range_is_rejected(self):
+        """Test that a range ending before it starts is rejected"""
+        response = self.client.get("/api/occupancy/", {"start": "2026-10-16T00:00:00Z", "end": "2026-10-15T00:00:00Z"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_occupancy_requires_admin(self):
+        """Test that other clients cannot see the occupancy of branches"""
+        self.assertEqual(Client().get("/api/occupancy/").status_code, status.HTTP_403_FORBIDDEN)
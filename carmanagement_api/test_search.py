@@ -0,0 +1,70 @@
+from django.test import TestCase
+from django.test import Client
+
+from rest_framework import status
+
+from carmanagement_api.models import Driver, DriverNameToken
+from carmanagement_api import search
+
+
+class NameTokenTestCase(TestCase):
+    """Tests for normalising names and measuring the distance between them"""
+
+    def test_names_are_case_folded_and_accent_stripped(self):
+        """Test that case, accents, apostrophes and hyphens are normalised away"""
+        self.assertEqual(search.tokenise("Zoë O'Brien-Ávila"), ['zoe', 'obrien', 'avila'])
+
+    def test_edit_distance(self):
+        """Test that insertions, deletions, substitutions and transpositions each count as one edit"""
+        self.assertEqual(search.edit_distance("traynor", "traynor"), 0)
+        self.assertEqual(search.edit_distance("traynor", "trainor"), 1)
+        self.assertEqual(search.edit_distance("traynor", "tarynor"), 1)
+        self.assertEqual(search.edit_distance("traynor", "trayno"), 1)
+        self.assertEqual(search.edit_distance("traynor", "trainer"), 2)
+
+
+class DriverSearchTestCase(TestCase):
+    """Tests for looking drivers up with the driver search index"""
+    def setUp(self):
+        """Set up drivers to be used in testing the driver search"""
+        self.aaron = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+        self.zoe = Driver.objects.create(first_name="Zoë", middle_names="Anne", last_name="Trayner", date_of_birth="1990-01-01")
+        self.sam = Driver.objects.create(first_name="Sam", last_name="Smith", date_of_birth="1997-11-07")
+
+    def search(self, **params):
+        """Return the ids of the drivers found by a search"""
+        response = Client().get("/api/drivers/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [d["id"] for d in response.json()]
+
+    def test_prefix_search(self):
+        """Test that a partial surname finds every driver whose name starts with it, ordered by surname"""
+        self.assertEqual(self.search(name="tray"), [self.zoe.id, self.aaron.id])
+
+    def test_typo_tolerant_search(self):
+        """Test that a name with a typo finds the driver, listing the exact match first"""
+        self.assertEqual(self.search(name="traynor"), [self.aaron.id, self.zoe.id])
+        self.assertEqual(self.search(name="tranyor"), [self.aaron.id])
+
+    def test_every_term_must_match(self):
+        """Test that each term of a name must match one of the driver's names"""
+        self.assertEqual(self.search(name="zoe tray"), [self.zoe.id])
+        self.assertEqual(self.search(search="anne traynor"), [self.zoe.id])
+
+    def test_date_of_birth_filter(self):
+        """Test that drivers can be filtered by their exact date of birth"""
+        self.assertEqual(self.search(date_of_birth="1997-11-07"), [self.sam.id, self.aaron.id])
+        self.assertEqual(self.search(name="tray", date_of_birth="1997-11-07"), [self.aaron.id])
+
+    def test_invalid_date_of_birth_returns_400(self):
+        """Test that a date of birth that is not a date returns an error"""
+        response = Client().get("/api/drivers/", {"date_of_birth": "07/11/1997"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_renaming_driver_updates_index(self):
+        """Test that saving a driver replaces their name tokens"""
+        self.sam.last_name = "Jones"
+        self.sam.save()
+
+        self.assertEqual(set(DriverNameToken.objects.filter(driver=self.sam).values_list("token", flat=True)), {"sam", "jones"})
+        self.assertEqual(self.search(name="smith"), [])
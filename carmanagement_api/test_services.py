@@ -0,0 +1,154 @@
+from unittest import mock
+
+from django.db import OperationalError
+from django.db.models.query import QuerySet
+from django.test import TestCase, TransactionTestCase
+
+from carmanagement_api.models import Branch, Driver, Car, BranchInventory, DriverInventory, BranchAvailability, CarListing
+from carmanagement_api import services
+
+
+class InventoryServiceTestCase(TestCase):
+    """Tests for the rent and return domain service"""
+    def setUp(self):
+        """Set up objects to be used in testing the inventory service"""
+        self.car = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+        self.driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+        self.branch1 = Branch.objects.create(city="London", postcode="WC2B 6ST")
+        self.branch2 = Branch.objects.create(city="Welling", postcode="DA16 3RR", capacity=1)
+
+        # Create the availability counts up front, as they will already exist for most cars
+        for branch in (self.branch1, self.branch2):
+            BranchAvailability.objects.create(branch=branch, make="Ford", model="Fiesta", year_of_manufacture=2018)
+
+    # Each budget includes the SAVEPOINT and RELEASE SAVEPOINT statements issued because
+    # TestCase wraps every test in a transaction, and on SQLite each lock is a write followed by a read
+
+    def test_rent_query_budget(self):
+        """Test that renting a car takes a lock, a lookup, a delete, an insert and three updates"""
+        services.return_car(self.car, self.branch1)
+
+        with self.assertNumQueries(10):
+            services.rent_car(self.car, self.driver)
+
+        self.assertFalse(BranchInventory.objects.filter(car=self.car).exists())
+        self.assertEqual(DriverInventory.objects.get(car=self.car).driver, self.driver)
+        self.assertEqual(Car.objects.get(pk=self.car.pk).currently_with, self.driver)
+
+    def test_rent_already_rented_query_budget(self):
+        """Test that renting a car that is already rented takes a lock and a single lookup"""
+        DriverInventory.objects.create(car=self.car, driver=self.driver)
+
+        # The error rolls back to the savepoint before releasing it
+        with self.assertNumQueries(6):
+            with self.assertRaises(services.InventoryError):
+                services.rent_car(self.car, self.driver)
+
+    def test_return_query_budget(self):
+        """Test that returning a car takes two locks, a lookup, a capacity count, a delete, an insert and three updates"""
+        DriverInventory.objects.create(car=self.car, driver=self.driver)
+
+        with self.assertNumQueries(13):
+            previous_branch = services.return_car(self.car, self.branch1)
+
+        self.assertIsNone(previous_branch)
+        self.assertFalse(DriverInventory.objects.filter(car=self.car).exists())
+        self.assertEqual(BranchInventory.objects.get(car=self.car).branch, self.branch1)
+
+    def test_move_query_budget(self):
+        """Test that moving a car between branches takes two locks, a lookup, a capacity count and five updates"""
+        services.return_car(self.car, self.branch1)
+
+        with self.assertNumQueries(13):
+            previous_branch = services.return_car(self.car, self.branch2)
+
+        self.assertEqual(previous_branch, self.branch1)
+        self.assertEqual(BranchInventory.objects.get(car=self.car).branch, self.branch2)
+        self.assertEqual(Car.objects.get(pk=self.car.pk).currently_with, self.branch2)
+
+    def test_move_to_full_branch_is_rejected(self):
+        """Test that moving a car to a branch that is at full capacity raises an error"""
+        other_car = Car.objects.create(make="Tesla", model="Model S", year_of_manufacture=2016)
+        BranchInventory.objects.create(car=other_car, branch=self.branch2)
+        services.return_car(self.car, self.branch1)
+
+        with self.assertRaises(services.InventoryError):
+            services.return_car(self.car, self.branch2)
+
+        self.assertEqual(BranchInventory.objects.get(car=self.car).branch, self.branch1)
+
+
+class CarListingTestCase(TestCase):
+    """Tests for keeping the car listing rows in step with the cars and their locations"""
+    def setUp(self):
+        """Set up objects to be used in testing the car listing"""
+        self.car = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+        self.driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+        self.branch = Branch.objects.create(city="London", postcode="WC2B 6ST")
+
+    def test_listing_follows_rent_and_return(self):
+        """Test that renting and returning a car updates its listing row"""
+        services.return_car(self.car, self.branch)
+        self.assertEqual(CarListing.objects.get(car=self.car).city, "London")
+
+        services.rent_car(self.car, self.driver)
+        listing = CarListing.objects.get(car=self.car)
+        self.assertEqual((listing.location_type, listing.location_id), (Car.WITH_DRIVER, self.driver.id))
+        self.assertEqual(listing.last_name, "Traynor")
+        self.assertIsNone(listing.city)
+
+    def test_listing_follows_branch_changes(self):
+        """Test that changing the details of a branch updates the listing of each car at it"""
+        services.return_car(self.car, self.branch)
+        self.branch.city = "Westminster"
+        self.branch.save()
+
+        self.assertEqual(CarListing.objects.get(car=self.car).city, "Westminster")
+
+    def test_rebuild_repairs_listings(self):
+        """Test that rebuilding the listings repairs rows changed without saving the car"""
+        services.return_car(self.car, self.branch)
+        Car.objects.filter(pk=self.car.pk).update(model="Focus")
+        CarListing.objects.filter(car=self.car).update(city=None)
+
+        services.rebuild_car_listings()
+
+        listing = CarListing.objects.get(car=self.car)
+        self.assertEqual((listing.model, listing.city), ("Focus", "London"))
+
+
+class LockContentionTestCase(TransactionTestCase):
+    """Tests for changes that find the database locked by other requests"""
+    def setUp(self):
+        """Set up a car at a branch and a driver to rent it to"""
+        self.car = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+        self.driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+        self.branch = Branch.objects.create(city="London", postcode="WC2B 6ST")
+        services.return_car(self.car, self.branch)
+
+    def test_busy_changes_are_retried(self):
+        """Test that a rental is made again in a new transaction when the database is locked"""
+        lock_row = services.lock_row
+        busy = [services.FleetBusy("Locked"), services.FleetBusy("Locked")]
+
+        def locked_twice(model, pk):
+            if busy:
+                raise busy.pop()
+            return lock_row(model, pk)
+
+        with mock.patch.object(services, "lock_row", side_effect=locked_twice) as locked:
+            services.rent_car(self.car, self.driver)
+
+        self.assertEqual(locked.call_count, 3)
+        self.assertEqual(DriverInventory.objects.get(car=self.car).driver, self.driver)
+
+    @mock.patch.object(services, "LOCK_RETRIES", 1)
+    @mock.patch.object(QuerySet, "update", side_effect=OperationalError("database is locked"))
+    def test_locked_database_is_reported_as_unavailable(self, update):
+        """Test that a rental that cannot take its locks is refused with a 503 rather than failing with a 500"""
+        response = self.client.post("/api/rent-car/", {"car": self.car.id, "driver": self.driver.id})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(update.call_count, 2)
+        self.assertFalse(DriverInventory.objects.filter(car=self.car).exists())
@@ -0,0 +1,211 @@
+import shutil
+import tempfile
+import threading
+import tracemalloc
+from datetime import date
+from io import StringIO
+from unittest import mock, skipIf
+
+from django.core.management import call_command
+from django.db import connection, DatabaseError
+from django.test import TestCase, TransactionTestCase
+from django.test import override_settings
+
+from carmanagement_api.models import Branch, Car, Driver
+from carmanagement_api import services
+from carmanagement_api import snapshots
+
+
+class SnapshotTestCase(TestCase):
+    """Tests for exporting columnar snapshots of the fleet"""
+
+    def setUp(self):
+        """Set up a branch, a driver and two cars, exporting to a temporary directory"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(EXPORT_DIR=directory, EXPORT_CHUNK_SIZE=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.branch = Branch.objects.create(city="London", postcode="SW1A 1AA", capacity=20, latitude=51.5, longitude=-0.1)
+        self.driver = Driver.objects.create(first_name="Jane", last_name="Doe", date_of_birth=date(1990, 5, 17))
+        self.fiesta = self.add_car("Ford", "Fiesta", 2018, self.branch)
+        self.tesla = self.add_car("Tesla", "Model S", 2016, self.driver)
+
+    def add_car(self, make, model, year, location=None):
+        """Add a car at a branch, with a driver or unassigned"""
+        car = Car(make=make, model=model, year_of_manufacture=year)
+        car.currently_with = location
+        car.save()
+        return car
+
+    def rows(self, export_id, name, deleted=False):
+        """Return the rows of a table of an export as dicts"""
+        rows = []
+        for group in snapshots.row_groups(snapshots.table_path(export_id, name, deleted)):
+            rows.extend(dict(zip(group, values)) for values in zip(*group.values()))
+        return rows
+
+    def check_full_and_incremental_exports(self):
+        """Check a first export has every row, and a second only the changed rows and deleted ids"""
+        first = snapshots.export_snapshot()
+        self.assertIsNone(first["base"])
+        self.assertEqual(first["tables"]["cars"], {"rows": 2, "changed": 2, "deleted": 0})
+
+        cars = self.rows(first["id"], "cars")
+        self.assertEqual([c["make"] for c in cars], ["Ford", "Tesla"])
+        self.assertEqual([c["location_type"] for c in cars], ["branch", "driver"])
+        self.assertEqual(cars[0]["current_branch_id"], self.branch.id)
+        self.assertEqual(self.rows(first["id"], "drivers")[0]["date_of_birth"], date(1990, 5, 17))
+        self.assertEqual(self.rows(first["id"], "branches")[0]["latitude"], 51.5)
+
+        self.fiesta.currently_with = self.driver
+        self.fiesta.save()
+        tesla_id = self.tesla.id
+        self.tesla.delete()
+        golf = self.add_car("Volkswagen", "Golf", 2020)
+
+        second = snapshots.export_snapshot()
+        self.assertEqual(second["base"], first["id"])
+        self.assertEqual(second["tables"]["cars"], {"rows": 2, "changed": 2, "deleted": 1})
+        self.assertEqual(second["tables"]["branches"], {"rows": 1, "changed": 0, "deleted": 0})
+
+        cars = self.rows(second["id"], "cars")
+        self.assertEqual([(c["id"], c["location_type"]) for c in cars], [(self.fiesta.id, "driver"), (golf.id, "unassigned")])
+        self.assertEqual(self.rows(second["id"], "cars", deleted=True), [{"id": tesla_id}])
+        self.assertEqual(self.rows(second["id"], "branches"), [])
+        self.assertEqual(snapshots.export_ids(), [second["id"], first["id"]])
+
+    @skipIf(snapshots.pyarrow is None, "pyarrow is not installed")
+    def test_parquet_exports_are_incremental(self):
+        """Test that Parquet exports write every row first, and then only the rows changed since"""
+        self.check_full_and_incremental_exports()
+
+    def test_columnar_exports_are_incremental(self):
+        """Test that exports without pyarrow write every row first, and then only the rows changed since"""
+        with mock.patch.object(snapshots, "pyarrow", None):
+            self.check_full_and_incremental_exports()
+            self.assertEqual(snapshots.read_manifest(snapshots.export_ids()[0])["format"], snapshots.COLUMNAR)
+
+    def test_full_export_writes_every_row(self):
+        """Test that a full export writes every row even when there is a previous export"""
+        snapshots.export_snapshot()
+        manifest = snapshots.export_snapshot(full=True)
+        self.assertIsNone(manifest["base"])
+        self.assertEqual(manifest["tables"]["cars"]["changed"], 2)
+
+    def test_failed_exports_are_not_used(self):
+        """Test that an export that fails part way through is removed, so the next export is full"""
+        with mock.patch.object(snapshots.TableWriter, "close", side_effect=OSError("Disk full")):
+            with self.assertRaises(OSError):
+                snapshots.export_snapshot()
+
+        self.assertEqual(snapshots.export_ids(), [])
+        self.assertIsNone(snapshots.export_snapshot()["base"])
+
+    def check_aggregates(self):
+        """Check cars can be counted by location, and their years summarised"""
+        self.add_car("Ford", "Focus", 2020, self.branch)
+        self.add_car("Ford", "Ka", 2010)
+        export_id = snapshots.export_snapshot()["id"]
+
+        by_location = snapshots.aggregate(export_id, "cars", by=["location_type"], column="year_of_manufacture")
+        self.assertEqual(by_location[("branch",)], {"rows": 2, "count": 2, "sum": 4038, "min": 2018, "max": 2020, "mean": 2019})
+        self.assertEqual(by_location[("driver",)]["rows"], 1)
+        self.assertEqual(by_location[("unassigned",)]["min"], 2010)
+
+        everything = snapshots.aggregate(export_id, "cars")
+        self.assertEqual(everything[()]["rows"], 4)
+
+        latitudes = snapshots.aggregate(export_id, "branches", by=["city"], column="latitude")
+        self.assertEqual(latitudes[("London",)]["mean"], 51.5)
+
+    @skipIf(snapshots.pyarrow is None, "pyarrow is not installed")
+    def test_aggregates_with_pyarrow(self):
+        """Test that aggregates over Parquet exports are computed by pyarrow"""
+        self.check_aggregates()
+
+    def test_aggregates_without_pyarrow(self):
+        """Test that aggregates over the fallback format are computed the same way"""
+        with mock.patch.object(snapshots, "pyarrow", None):
+            self.check_aggregates()
+
+    def test_memory_does_not_grow_with_the_fleet(self):
+        """Test that exporting many more cars does not use much more memory"""
+        def peak(cars):
+            Car.objects.bulk_create(Car(make="Ford", model="Fiesta", year_of_manufacture=2018) for _ in range(cars))
+            tracemalloc.start()
+            try:
+                snapshots.export_snapshot(full=True)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        with override_settings(EXPORT_CHUNK_SIZE=100):
+            # The first export loads what every export needs, such as the modules of the format
+            peak(0)
+            fewer = peak(500)
+            more = peak(4000)
+
+        self.assertLess(more, fewer * 1.5)
+
+    def test_export_snapshot_command(self):
+        """Test that the export_snapshot command reports the rows it wrote"""
+        out = StringIO()
+        call_command("export_snapshot", "--format", "columnar", stdout=out)
+        self.assertIn("cars: 2 of 2 rows written, 0 deleted", out.getvalue())
+
+
+class SnapshotConsistencyTestCase(TransactionTestCase):
+    """Tests for exporting the fleet while it is being changed"""
+
+    def setUp(self):
+        """Set up a car at a branch, exporting to a temporary directory"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(EXPORT_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.branch = Branch.objects.create(city="London", postcode="SW1A 1AA", capacity=20)
+        self.car = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+        services.return_car(self.car, self.branch)
+
+    def rows(self, export_id, name):
+        """Return the rows of a table of an export as dicts"""
+        rows = []
+        for group in snapshots.row_groups(snapshots.table_path(export_id, name)):
+            rows.extend(dict(zip(group, values)) for values in zip(*group.values()))
+        return rows
+
+    def rent_to_new_driver(self):
+        """Rent the car to a driver who is added at the same time, from a connection of this thread's own"""
+        try:
+            driver = Driver.objects.create(first_name="Jane", last_name="Doe", date_of_birth=date(1990, 5, 17))
+            services.rent_car(self.car, driver)
+        except (DatabaseError, services.FleetBusy):
+            # The export's reads keep the database locked until it finishes
+            pass
+        finally:
+            connection.close()
+
+    def test_tables_are_read_from_one_snapshot(self):
+        """Test that a car rented between the export of two tables is exported where it was in every table"""
+        export_table = snapshots.export_table
+        renting = threading.Thread(target=self.rent_to_new_driver)
+
+        def export_then_rent(name, *args, **kwargs):
+            result = export_table(name, *args, **kwargs)
+            if name == "drivers":
+                # The rental either waits for the export to finish or is refused, depending on the database
+                renting.start()
+                renting.join(1)
+            return result
+
+        with mock.patch.object(snapshots, "export_table", side_effect=export_then_rent):
+            export_id = snapshots.export_snapshot(fmt=snapshots.COLUMNAR)["id"]
+        renting.join()
+
+        cars = self.rows(export_id, "cars")
+        self.assertEqual([(c["location_type"], c["current_branch_id"]) for c in cars], [("branch", self.branch.id)])
+        self.assertEqual(self.rows(export_id, "drivers"), [])
@@ -0,0 +1,107 @@
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipIf
+
+import requests
+
+from django.db import connection
+from django.db.models import Count
+from django.test import LiveServerTestCase, override_settings
+
+from carmanagement_api.models import Branch, Driver, Car, BranchInventory, DriverInventory, BranchAvailability, CarListing
+from carmanagement_api import services
+
+
+# The number of operations and threads can be changed for a longer or shorter run, e.g. STRESS_OPERATIONS=10000
+OPERATIONS = int(os.environ.get('STRESS_OPERATIONS', 2000))
+WORKERS = int(os.environ.get('STRESS_WORKERS', 24))
+
+
+# SQLite only lets one connection at a time use a table of an in-memory database, so the requests would fail
+# rather than wait for each other
+@skipIf(connection.vendor == 'sqlite' and not os.environ.get('TEST_DATABASE_PATH'), "Set TEST_DATABASE_PATH to run")
+@override_settings(RATE_LIMIT_BUCKET_SIZE=10 ** 9, RATE_LIMIT_REFILL_RATE=10 ** 9)
+class RentReturnStressTestCase(LiveServerTestCase):
+    """Stress test renting, returning and moving cars with concurrent requests to a live server"""
+
+    def setUp(self):
+        """Set up a small fleet with fewer spaces than cars, so that branches are often full"""
+        self.branches = [Branch.objects.create(city=f"City {i}", postcode="WC2B 6ST", capacity=4) for i in range(4)]
+        self.drivers = [
+            Driver.objects.create(first_name="Driver", last_name=str(i), date_of_birth="1990-01-01") for i in range(10)
+        ]
+        self.cars = [Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018) for _ in range(20)]
+
+        for i, car in enumerate(self.cars[:12]):
+            services.return_car(car, self.branches[i % 4])
+
+    def operation(self, session, rng):
+        """Rent a random car to a random driver, or return or move it to a random branch, and return the status"""
+        car = rng.choice(self.cars)
+
+        if rng.random() < 0.5:
+            response = session.post(f"{self.live_server_url}/api/rent-car/", {
+                "car": car.id,
+                "driver": rng.choice(self.drivers).id
+            })
+        else:
+            response = session.post(f"{self.live_server_url}/api/return-car/", {
+                "car": car.id,
+                "branch": rng.choice(self.branches).id
+            })
+
+        return response.status_code
+
+    def worker(self, seed, count):
+        """Run a number of operations one after another with a session of its own"""
+        rng = random.Random(seed)
+        with requests.Session() as session:
+            return [self.operation(session, rng) for _ in range(count)]
+
+    def assert_invariants(self):
+        """Check that every car is in one place and the inventory, locations, counts and listings agree"""
+        branch_cars = Counter(BranchInventory.objects.values_list('car_id', flat=True))
+        driver_cars = Counter(DriverInventory.objects.values_list('car_id', flat=True))
+
+        for car in Car.objects.all():
+            self.assertLessEqual(branch_cars[car.id] + driver_cars[car.id], 1, f"{car} is in more than one place")
+
+            if branch_cars[car.id]:
+                self.assertEqual(car.currently_with, BranchInventory.objects.get(car=car).branch)
+            elif driver_cars[car.id]:
+                self.assertEqual(car.currently_with, DriverInventory.objects.get(car=car).driver)
+            else:
+                self.assertIsNone(car.currently_with)
+
+            listing = CarListing.objects.get(car=car)
+            self.assertEqual((listing.location_type, listing.location_id), (car.location_type, car.current_branch_id or car.current_driver_id))
+
+        for branch in Branch.objects.annotate(occupancy=Count('branchinventory')):
+            self.assertLessEqual(branch.occupancy, branch.capacity, f"{branch} is over capacity")
+
+            available = sum(BranchAvailability.objects.filter(branch=branch).values_list('available', flat=True))
+            self.assertEqual(available, branch.occupancy, f"The availability counts of {branch} have drifted")
+
+    def test_concurrent_rent_and_return(self):
+        """Test that concurrent rentals, returns and moves keep the fleet consistent"""
+        per_worker = [OPERATIONS // WORKERS + (1 if i < OPERATIONS % WORKERS else 0) for i in range(WORKERS)]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            statuses = Counter(s for result in pool.map(self.worker, range(WORKERS), per_worker) for s in result)
+        elapsed = time.perf_counter() - started
+
+        sys.stderr.write(
+            f"\n{OPERATIONS} operations with {WORKERS} workers in {elapsed:.2f}s "
+            f"({OPERATIONS / elapsed:.0f} operations per second), statuses: {dict(sorted(statuses.items()))}\n"
+        )
+
+        # Requests either succeed or are refused because the car or branch is not available, never fail outright or
+        # give up waiting for each other
+        self.assertEqual(sum(statuses.values()), OPERATIONS)
+        self.assertLessEqual(set(statuses), {200, 201, 400})
+        self.assert_invariants()
@@ -0,0 +1,215 @@
+import json
+from datetime import datetime, timedelta
+from unittest import mock, skipIf
+
+from django.db import connection, OperationalError
+from django.test import TestCase
+from django.test import Client
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework import status
+
+from carmanagement_api.models import Car, TelemetryReading, LatestTelemetry
+from carmanagement_api import parsers
+from carmanagement_api import telemetry
+
+
+@override_settings(TELEMETRY_FLUSH_INTERVAL=None)
+class TelemetryTestCase(TestCase):
+    """Tests for receiving and storing telemetry readings from cars"""
+
+    def setUp(self):
+        """Set up two cars, with no readings waiting from earlier tests"""
+        telemetry.buffer.take()
+        self.fiesta = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+        self.tesla = Car.objects.create(make="Tesla", model="Model S", year_of_manufacture=2016)
+
+    def send(self, readings, content_type="application/x-ndjson"):
+        """Send readings as newline delimited JSON, or as a JSON list"""
+        if content_type == "application/x-ndjson":
+            body = "\n".join(json.dumps(r) for r in readings) + "\n"
+        else:
+            body = json.dumps(readings)
+        return Client().post("/api/telemetry/", body, content_type=content_type)
+
+    def test_readings_are_stored(self):
+        """Test that readings are stored and each car's latest is the newest of them, whatever order they came in"""
+        response = self.send([
+            {"car": self.fiesta.id, "time": "2026-03-01T12:00:10Z", "odometer_km": 1000.5, "fuel_level": 0.5},
+            {"car": self.fiesta.id, "time": "2026-03-01T12:00:00Z", "odometer_km": 1000.2, "fuel_level": 0.51},
+            {"car": self.tesla.id, "time": 1772366400, "latitude": 51.5151, "longitude": -0.1211},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.json(), {"accepted": 3, "rejected": 0, "errors": []})
+        self.assertEqual(TelemetryReading.objects.count(), 3)
+
+        response = Client().get(f"/api/cars/{self.fiesta.id}/telemetry/")
+        self.assertEqual(response.json(), {
+            "car": self.fiesta.id,
+            "time": "2026-03-01T12:00:10Z",
+            "odometer_km": 1000.5,
+            "fuel_level": 0.5,
+            "latitude": None,
+            "longitude": None,
+        })
+
+    def test_older_reading_does_not_replace_latest(self):
+        """Test that a reading arriving late does not replace a newer one"""
+        self.send([{"car": self.fiesta.id, "time": "2026-03-01T12:00:10Z", "odometer_km": 1000.5}])
+        self.send([{"car": self.fiesta.id, "time": "2026-03-01T12:00:00Z", "odometer_km": 1000.2}], "application/json")
+
+        self.assertEqual(LatestTelemetry.objects.get(car=self.fiesta).odometer_km, 1000.5)
+        self.assertEqual(TelemetryReading.objects.count(), 2)
+
+    def test_invalid_readings_are_rejected(self):
+        """Test that invalid readings are listed by position without stopping the others from being accepted"""
+        response = self.send([
+            {"car": self.fiesta.id, "time": "2026-03-01T12:00:00Z", "fuel_level": 1.5},
+            {"car": self.fiesta.id, "time": "2026-03-01T12:00:00Z"},
+            {"car": 999, "time": "2026-03-01T12:00:00Z"},
+            {"car": self.tesla.id, "time": "yesterday"},
+        ])
+
+        self.assertEqual(response.json(), {"accepted": 1, "rejected": 3, "errors": [
+            {"index": 0, "error": "fuel_level must be between 0 and 1."},
+            {"index": 2, "error": "There is no car 999."},
+            {"index": 3, "error": "'yesterday' is not a time."},
+        ]})
+
+    def test_times_out_of_range_are_rejected(self):
+        """Test that times in the right form but out of range are rejected rather than failing the request"""
+        response = self.send([
+            {"car": self.fiesta.id, "time": "2020-13-45T00:00:00Z"},
+            {"car": self.fiesta.id, "time": 1e20},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.json()["errors"], [
+            {"index": 0, "error": "'2020-13-45T00:00:00Z' is not a time."},
+            {"index": 1, "error": "1e+20 is not a time."},
+        ])
+
+    def test_values_that_are_not_finite_are_rejected(self):
+        """Test that NaN and Infinity, which NDJSON and MessagePack can carry, are rejected rather than stored"""
+        body = (
+            f'{{"car": {self.fiesta.id}, "time": "2026-03-01T12:00:00Z", "odometer_km": NaN}}\n'
+            f'{{"car": {self.fiesta.id}, "time": "2026-03-01T12:00:00Z", "fuel_level": NaN}}\n'
+            f'{{"car": {self.fiesta.id}, "time": "2026-03-01T12:00:00Z", "odometer_km": Infinity}}\n'
+        )
+        response = Client().post("/api/telemetry/", body, content_type="application/x-ndjson")
+
+        self.assertEqual(response.json(), {"accepted": 0, "rejected": 3, "errors": [
+            {"index": 0, "error": "odometer_km must be a number."},
+            {"index": 1, "error": "fuel_level must be a number."},
+            {"index": 2, "error": "odometer_km must be a number."},
+        ]})
+        self.assertEqual(telemetry.buffer.flush(), 0)
+        self.assertFalse(TelemetryReading.objects.exists())
+
+    def test_invalid_ndjson(self):
+        """Test that a body with a line that is not JSON is rejected"""
+        response = Client().post("/api/telemetry/", '{"car": 1}\n{car', content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"detail": "Line 2 is not valid JSON."})
+
+    @skipIf(parsers.msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        """Test that readings can be sent as MessagePack"""
+        body = parsers.msgpack.packb([{"car": self.tesla.id, "time": 1772366400, "fuel_level": 0.25}])
+        response = Client().post("/api/telemetry/", body, content_type="application/msgpack")
+
+        self.assertEqual(response.json()["accepted"], 1)
+
+    def test_writes_are_batched(self):
+        """Test that writing readings takes the same number of queries however many there are"""
+        def count_queries(readings):
+            with CaptureQueriesContext(connection) as queries:
+                self.send(readings)
+            return len(queries)
+
+        base = timezone.now().timestamp()
+        self.send([{"car": car.id, "time": base} for car in (self.fiesta, self.tesla)])
+
+        # Fewer than TELEMETRY_BATCH_SIZE readings are written with one insert
+        few = [{"car": car.id, "time": base + 1 + i} for i in range(5) for car in (self.fiesta, self.tesla)]
+        many = [{"car": car.id, "time": base + 10 + i} for i in range(200) for car in (self.fiesta, self.tesla)]
+
+        self.assertEqual(count_queries(few), count_queries(many))
+
+    @override_settings(TELEMETRY_FLUSH_INTERVAL=0, TELEMETRY_FLUSH_SIZE=3)
+    def test_readings_wait_in_buffer(self):
+        """Test that readings wait until enough of them have been received to be written together"""
+        self.send([{"car": self.fiesta.id, "time": 1772366400 + i} for i in range(2)])
+        self.assertEqual(TelemetryReading.objects.count(), 0)
+
+        self.send([{"car": self.fiesta.id, "time": 1772366402 + i} for i in range(2)])
+        self.assertEqual(TelemetryReading.objects.count(), 4)
+        self.assertEqual(telemetry.buffer.flush(), 0)
+
+    def test_times_outside_window_are_rejected(self):
+        """Test that times before 1970, which cannot be stored, or too far in the future are rejected"""
+        response = self.send([
+            {"car": self.fiesta.id, "time": "1969-12-31T23:59:59Z"},
+            {"car": self.fiesta.id, "time": (timezone.now() + timedelta(days=2)).timestamp()},
+        ])
+
+        self.assertEqual(response.json()["accepted"], 0)
+        self.assertEqual({e["error"] for e in response.json()["errors"]},
+                         {"time must be after 1970 and no more than a day from now."})
+
+    @override_settings(TELEMETRY_FLUSH_INTERVAL=0)
+    def test_bad_readings_do_not_lose_the_batch(self):
+        """Test that a reading which cannot be stored is dropped without losing the rest of its batch"""
+        self.send([{"car": self.fiesta.id, "time": 1772366400 + i} for i in range(2)])
+        bad = telemetry.Reading(self.tesla.id, datetime(1960, 1, 1, tzinfo=timezone.utc), None, None, None, None)
+        telemetry.buffer.requeue("default", [bad])
+
+        with self.assertLogs("carmanagement_api.telemetry", "WARNING"):
+            self.assertEqual(telemetry.buffer.flush(), 2)
+
+        self.assertEqual(TelemetryReading.objects.count(), 2)
+        self.assertEqual(telemetry.buffer.take(), {})
+
+    @override_settings(TELEMETRY_FLUSH_INTERVAL=0)
+    def test_readings_wait_while_database_is_unavailable(self):
+        """Test that readings that could not be written are kept for the next flush"""
+        self.send([{"car": self.fiesta.id, "time": 1772366400 + i} for i in range(2)])
+
+        with mock.patch.object(telemetry, "write", side_effect=OperationalError("database is locked")):
+            with self.assertLogs("carmanagement_api.telemetry", "ERROR"):
+                self.assertEqual(telemetry.buffer.flush(), 0)
+
+        self.assertEqual(telemetry.buffer.flush(), 2)
+        self.assertEqual(TelemetryReading.objects.count(), 2)
+
+    def test_history(self):
+        """Test that a car's readings between two times are listed oldest first"""
+        start = datetime(2026, 3, 1, 23, 59, tzinfo=timezone.utc)
+        self.send([{"car": self.fiesta.id, "time": (start + timedelta(minutes=i)).isoformat()} for i in range(4)])
+
+        response = Client().get(f"/api/cars/{self.fiesta.id}/telemetry/history/", {
+            "start": "2026-03-01T23:59:30Z", "end": "2026-03-02T00:02:00Z"
+        })
+
+        self.assertEqual([r["time"] for r in response.json()["readings"]], ["2026-03-02T00:00:00Z", "2026-03-02T00:01:00Z"])
+
+    def test_pruning_drops_old_days(self):
+        """Test that readings older than the retention period are dropped while the latest reading is kept"""
+        now = timezone.now()
+        self.send([
+            {"car": self.fiesta.id, "time": (now - timedelta(days=40)).isoformat()},
+            {"car": self.tesla.id, "time": (now - timedelta(days=40)).isoformat()},
+            {"car": self.tesla.id, "time": now.isoformat()},
+        ])
+
+        self.assertEqual(telemetry.prune(), 2)
+        self.assertEqual(TelemetryReading.objects.count(), 1)
+        self.assertEqual(LatestTelemetry.objects.count(), 2)
+
+    def test_no_readings(self):
+        """Test that a car which has not sent a reading has no latest reading"""
+        self.assertEqual(Client().get(f"/api/cars/{self.tesla.id}/telemetry/").status_code, status.HTTP_404_NOT_FOUND)
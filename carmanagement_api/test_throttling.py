@@ -0,0 +1,76 @@
+import threading
+
+from django.test import TestCase, override_settings
+from django.test import Client
+from django.core.cache import cache
+
+from rest_framework import status
+from rest_framework.request import Request
+from django.test.client import RequestFactory
+
+from carmanagement_api.models import Car
+from carmanagement_api.throttling import TokenBucketThrottle
+
+
+@override_settings(RATE_LIMIT_BUCKET_SIZE=20, RATE_LIMIT_REFILL_RATE=0.001)
+class TokenBucketThrottleTestCase(TestCase):
+    """Tests for the token bucket rate limiter"""
+    def setUp(self):
+        """Set up objects to be used in testing the rate limiter"""
+        cache.clear()
+        self.car = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+
+    def tearDown(self):
+        """Empty the buckets so other tests are not limited"""
+        cache.clear()
+
+    def test_headers_report_remaining_quota(self):
+        """Test that responses report the size of the bucket and the number of tokens remaining"""
+        c = Client()
+        response = c.get(f"/api/cars/{self.car.id}/")
+
+        self.assertEqual(response["X-RateLimit-Limit"], "20")
+        self.assertEqual(response["X-RateLimit-Remaining"], "19")
+
+    def test_list_costs_more_than_retrieve(self):
+        """Test that listing all cars takes more tokens than retrieving one"""
+        c = Client()
+        response = c.get("/api/cars/")
+
+        self.assertEqual(response["X-RateLimit-Remaining"], "10")
+
+    def test_exhausted_bucket_returns_429(self):
+        """Test that a client that has used all of its tokens is refused until the bucket refills"""
+        c = Client()
+        c.get("/api/cars/")
+        c.get("/api/cars/")
+        response = c.get(f"/api/cars/{self.car.id}/")
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+
+    @override_settings(RATE_LIMIT_CLIENT_QUOTAS={"127.0.0.1": (100, 1)})
+    def test_per_client_quota(self):
+        """Test that a client with its own quota gets its own bucket size"""
+        c = Client()
+        response = c.get("/api/cars/")
+
+        self.assertEqual(response["X-RateLimit-Limit"], "100")
+        self.assertEqual(response["X-RateLimit-Remaining"], "90")
+
+    def test_concurrent_requests_do_not_overspend(self):
+        """Test that requests from one client at the same time never take more tokens than the bucket holds"""
+        allowed = []
+        start = threading.Barrier(40)
+
+        def request():
+            start.wait()
+            allowed.append(TokenBucketThrottle().allow_request(Request(RequestFactory().get("/api/cars/")), None))
+
+        threads = [threading.Thread(target=request) for _ in range(40)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(allowed.count(True), 20)
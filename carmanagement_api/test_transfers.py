@@ -0,0 +1,119 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test import Client
+from django.utils import timezone
+
+from rest_framework import status
+
+from carmanagement_api.models import Branch, Driver, Car, BranchInventory, BranchAvailability, CarListing, BranchTransfer
+from carmanagement_api import services
+
+
+class BranchTransferTestCase(TestCase):
+    """Tests for moving every car at a branch to other branches"""
+
+    def setUp(self):
+        """Set up five cars in London, and branches in Welling and Leeds with room for three each"""
+        self.london = Branch.objects.create(city="London", postcode="WC2B 6ST", latitude=51.5151, longitude=-0.1211)
+        self.welling = Branch.objects.create(city="Welling", postcode="DA16 3RR", latitude=51.4636, longitude=0.1088, capacity=3)
+        self.leeds = Branch.objects.create(city="Leeds", postcode="LS1 4DY", latitude=53.7960, longitude=-1.5476, capacity=3)
+
+        self.cars = [Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018) for _ in range(5)]
+        for car in self.cars:
+            services.return_car(car, self.london)
+
+        self.client = Client()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+
+    def transfer(self, **data):
+        """Post a transfer of the cars at London"""
+        return self.client.post(f"/api/branches/{self.london.id}/transfer/", data, content_type="application/json")
+
+    def test_destinations_are_filled_in_turn(self):
+        """Test that the cars fill each destination in the order given and their details are kept in step"""
+        response = self.transfer(destinations=[self.leeds.id, self.welling.id])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([len(t["cars"]) for t in response.json()["transfers"]], [3, 2])
+        self.assertFalse(BranchInventory.objects.filter(branch=self.london).exists())
+        self.assertEqual(BranchInventory.objects.filter(branch=self.leeds).count(), 3)
+
+        for car_id in response.json()["transfers"][0]["cars"]:
+            car = Car.objects.get(pk=car_id)
+            self.assertEqual(car.currently_with, self.leeds)
+            self.assertEqual(car.version, 3)
+            self.assertEqual(CarListing.objects.get(car=car).city, "Leeds")
+
+        available = dict(BranchAvailability.objects.values_list('branch', 'available'))
+        self.assertEqual(available, {self.leeds.id: 3, self.welling.id: 2})
+
+    def test_nearest_branches_are_used_by_default(self):
+        """Test that without destinations the cars go to the nearest branches with room first"""
+        response = self.transfer()
+
+        self.assertEqual([t["branch"] for t in response.json()["transfers"]], [self.welling.id, self.leeds.id])
+
+    def test_nothing_is_moved_without_room_for_every_car(self):
+        """Test that the transfer is refused if the destinations cannot take every car"""
+        response = self.transfer(destinations=[self.welling.id])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(BranchInventory.objects.filter(branch=self.london).count(), 5)
+
+    def test_dry_run_moves_nothing(self):
+        """Test that a dry run returns the planned moves without making them"""
+        response = self.transfer(dry_run=True, close=True)
+
+        self.assertEqual(response.json()["cars"], 5)
+        self.assertTrue(response.json()["dry_run"])
+        self.assertEqual(BranchInventory.objects.filter(branch=self.london).count(), 5)
+        self.assertEqual(Branch.objects.get(pk=self.london.pk).capacity, 10)
+
+    def test_closing_the_branch(self):
+        """Test that a closed branch cannot have cars returned to it"""
+        self.transfer(close=True)
+
+        with self.assertRaises(services.InventoryError):
+            services.return_car(self.cars[0], self.london)
+
+    def test_affected_reservations_are_listed(self):
+        """Test that future reservations picking up at the branch are listed so they can be changed"""
+        driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+        start = timezone.now() + timedelta(days=1)
+        services._schedulers.clear()
+        reservation = services.create_reservation(self.cars[0], driver, self.london, self.london, start, start + timedelta(hours=2))
+
+        response = self.transfer(dry_run=True)
+
+        self.assertEqual(response.json()["reservations"], [reservation.id])
+
+    def test_background_transfer(self):
+        """Test that a background transfer is run by the worker and its result can be read"""
+        response = self.transfer(background=True, destinations=[self.welling.id, self.leeds.id])
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.json()["status"], BranchTransfer.PENDING)
+        self.assertEqual(BranchInventory.objects.filter(branch=self.london).count(), 5)
+
+        self.assertEqual(services.run_branch_transfers(), 1)
+
+        job = self.client.get(f"/api/branch-transfers/{response.json()['id']}/").json()
+        self.assertEqual(job["status"], BranchTransfer.DONE)
+        self.assertEqual(job["result"]["cars"], 5)
+        self.assertFalse(BranchInventory.objects.filter(branch=self.london).exists())
+
+    def test_failed_background_transfer(self):
+        """Test that a background transfer that cannot be made is marked as failed"""
+        response = self.transfer(background=True, destinations=[self.welling.id])
+        services.run_branch_transfers()
+
+        job = BranchTransfer.objects.get(pk=response.json()["id"])
+        self.assertEqual(job.status, BranchTransfer.FAILED)
+        self.assertIn("room for 3 of the 5 cars", job.error)
+
+    def test_transfer_requires_admin(self):
+        """Test that other clients cannot transfer the cars at a branch"""
+        response = Client().post(f"/api/branches/{self.london.id}/transfer/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
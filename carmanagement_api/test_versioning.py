@@ -0,0 +1,141 @@
+from django.db import transaction
+from django.test import TestCase
+from django.test import Client
+from django.test import override_settings
+
+from rest_framework import status
+
+from carmanagement_api.models import Branch, Driver, Car, BranchAvailability, VersionConflict
+from carmanagement_api import services
+
+
+class VersionedModelTestCase(TestCase):
+    """Tests for the version checked saves of cars, branches and drivers"""
+
+    def setUp(self):
+        """Set up a car and a driver"""
+        self.car = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+        self.driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+
+    def test_save_moves_to_the_next_version(self):
+        """Test that every save of a row moves it on to the next version"""
+        self.assertEqual(self.car.version, 1)
+
+        self.car.model = "Focus"
+        self.car.save()
+
+        self.assertEqual(self.car.version, 2)
+        self.assertEqual(Car.objects.get(pk=self.car.pk).version, 2)
+
+    def test_stale_save_is_rejected(self):
+        """Test that saving a row over a version other than the one read raises an error and changes nothing"""
+        first = Driver.objects.get(pk=self.driver.pk)
+        second = Driver.objects.get(pk=self.driver.pk)
+
+        first.first_name = "Erin"
+        first.save()
+
+        second.last_name = "Smith"
+        with self.assertRaises(VersionConflict), transaction.atomic():
+            second.save()
+
+        driver = Driver.objects.get(pk=self.driver.pk)
+        self.assertEqual((driver.first_name, driver.last_name, driver.version), ("Erin", "Traynor", 2))
+
+    def test_renting_moves_the_car_to_the_next_version(self):
+        """Test that renting and returning a car, which only save its location, move it on to the next version"""
+        branch = Branch.objects.create(city="London", postcode="WC2B 6ST")
+
+        services.return_car(self.car, branch)
+        services.rent_car(self.car, self.driver)
+
+        self.assertEqual(Car.objects.get(pk=self.car.pk).version, 3)
+
+
+class ConditionalUpdateTestCase(TestCase):
+    """Tests for updating cars, branches and drivers with If-Match"""
+
+    def setUp(self):
+        """Set up a branch with a car at it"""
+        self.branch = Branch.objects.create(city="London", postcode="WC2B 6ST")
+        self.car = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+        services.return_car(self.car, self.branch)
+        self.car.refresh_from_db()
+
+    def test_retrieve_gives_version_as_etag(self):
+        """Test that a retrieved row has its version as its ETag"""
+        self.assertEqual(Client().get(f"/api/branches/{self.branch.id}/")["ETag"], '"1"')
+        self.assertEqual(Client().get(f"/api/cars/{self.car.id}/")["ETag"], f'"{self.car.version}"')
+
+    def test_update_with_current_version(self):
+        """Test that an update naming the current version succeeds and gives the next version"""
+        response = Client().patch(
+            f"/api/branches/{self.branch.id}/", {"capacity": 20}, content_type="application/json", HTTP_IF_MATCH='"1"'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["ETag"], '"2"')
+        self.assertEqual(Branch.objects.get(pk=self.branch.pk).capacity, 20)
+
+    def test_update_with_stale_version(self):
+        """Test that an update naming an old version is rejected without changing the row"""
+        Client().patch(f"/api/branches/{self.branch.id}/", {"capacity": 20}, content_type="application/json")
+
+        response = Client().patch(
+            f"/api/branches/{self.branch.id}/", {"capacity": 5}, content_type="application/json", HTTP_IF_MATCH='"1"'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Branch.objects.get(pk=self.branch.pk).capacity, 20)
+
+    def test_stale_car_update_is_rolled_back(self):
+        """Test that a rejected car update leaves the branch availability counts as they were"""
+        response = Client().put(
+            f"/api/cars/{self.car.id}/",
+            {"make": "Tesla", "model": "Model S", "year_of_manufacture": 2016},
+            content_type="application/json",
+            HTTP_IF_MATCH=f'"{self.car.version - 1}"'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(BranchAvailability.objects.get(branch=self.branch).make, "Ford")
+        self.assertEqual(Car.objects.get(pk=self.car.pk).make, "Ford")
+
+    def test_invalid_if_match(self):
+        """Test that an If-Match that is not a version never matches"""
+        response = Client().patch(
+            f"/api/branches/{self.branch.id}/", {"capacity": 5}, content_type="application/json", HTTP_IF_MATCH='"abc"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+    def test_weak_if_match(self):
+        """Test that a weak ETag never matches, even when it names the current version"""
+        response = Client().patch(
+            f"/api/branches/{self.branch.id}/", {"capacity": 5}, content_type="application/json", HTTP_IF_MATCH='W/"1"'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Branch.objects.get(pk=self.branch.pk).capacity, self.branch.capacity)
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_compressed_etag_can_be_sent_back(self):
+        """Test that the ETag of a compressed response stays strong, so it can be sent back with If-Match"""
+        # A repetitive name lets such a small response get smaller when it is compressed
+        Branch.objects.filter(pk=self.branch.pk).update(city="London" * 8)
+
+        response = Client().get(f"/api/branches/{self.branch.id}/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["ETag"], '"1"')
+
+        response = Client().patch(
+            f"/api/branches/{self.branch.id}/", {"capacity": 5}, content_type="application/json",
+            HTTP_IF_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_update_without_if_match(self):
+        """Test that an update without If-Match is applied to the current version"""
+        response = Client().patch(f"/api/branches/{self.branch.id}/", {"capacity": 5}, content_type="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["ETag"], '"2"')
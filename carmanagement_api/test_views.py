@@ -4,7 +4,12 @@ from django.test import Client
 from rest_framework import status
 
 from carmanagement_api.models import Branch, Driver, Car, BranchInventory, DriverInventory
-from datetime import date, datetime
+from carmanagement_api.querypatterns import QueryScalingTestMixin
+from carmanagement_api import services
+from carmanagement_api.serializers import CarSerializer
+from django.contrib.contenttypes.models import ContentType
+from datetime import date, datetime, timedelta
+from django.utils import timezone
 
 import requests
 
@@ -44,6 +49,21 @@ class CarViewSetTestCase(TestCase):
         })
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_cars_list_locations_in_one_query(self):
+        """Test that listing cars at a branch and with a driver reads their locations with a single query"""
+        c = Client()
+        branch = Branch.objects.create(city="London", postcode="WC2B 6ST")
+        driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+        for car, location in ((Car.objects.get(make="Ford"), branch), (Car.objects.get(make="Tesla"), driver)):
+            car.currently_with = location
+            car.save()
+
+        with self.assertNumQueries(1):
+            response = c.get("/api/cars/")
+
+        self.assertEqual(response.json()["cars"][0]["currently_with"]["city"], "London")
+        self.assertEqual(response.json()["cars"][1]["currently_with"]["first_name"], "Aaron")
+
     def test_empty_POST_returns_400(self):
         """Test that attempting to create a car with no information returns a HTTP 400 status"""
         c = Client()
@@ -99,6 +119,16 @@ class CarViewSetTestCase(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_location_is_reported_as_content_type(self):
+        """Test that a saved car reports its location with the content type id of Branch or Driver, as it always has"""
+        car = Car.objects.get(make="Ford")
+        car.currently_with = Branch.objects.create(city="London", postcode="WC2B 6ST")
+        car.save()
+
+        data = CarSerializer(car).data
+        self.assertEqual(data["currently_with_type"], ContentType.objects.get_for_model(Branch).id)
+        self.assertEqual(data["currently_with_id"], car.current_branch_id)
+
     def test_retrieving_specific_car(self):
         """Test that getting information for a specific car returns the correct information"""
         car = Car.objects.get(make="Ford")
@@ -451,3 +481,49 @@ class DriverInventoryViewSetTestCase(TestCase):
         self.assertEqual(response.json(), {
             "error": f"Car {car.__str__()} is already assigned to {DriverInventory.objects.get(car=car).driver.__str__()}"
         })
+
+
+class QueryScalingTestCase(QueryScalingTestMixin, TestCase):
+    """Tests that listing endpoints make the same number of queries however many rows they return"""
+    def setUp(self):
+        """Start with no reservations cached from earlier tests"""
+        services._schedulers.clear()
+
+    def add_rows(self):
+        """Add branches with cars at them, drivers renting cars and reservations of the cars at the branches"""
+        start = timezone.now() + timedelta(days=1)
+
+        for i in range(3):
+            branch = Branch.objects.create(city="London", postcode="WC2B 6ST")
+            driver = Driver.objects.create(first_name="Aaron", last_name="Traynor", date_of_birth="1997-11-07")
+
+            car = Car.objects.create(make="Ford", model="Fiesta", year_of_manufacture=2018)
+            services.return_car(car, branch)
+            services.create_reservation(car, driver, branch, branch, start, start + timedelta(hours=2))
+
+            services.rent_car(Car.objects.create(make="Tesla", model="Model S", year_of_manufacture=2016), driver)
+
+    def test_listing_cars(self):
+        """Test that listing and searching cars does not make a query for each car"""
+        self.assertQueriesDoNotScale(self.add_rows, "/api/cars/")
+        self.assertQueriesDoNotScale(self.add_rows, "/api/cars/?search=ford")
+
+    def test_listing_branches_and_drivers(self):
+        """Test that listing branches and drivers does not make a query for each of them"""
+        self.assertQueriesDoNotScale(self.add_rows, "/api/branches/")
+        self.assertQueriesDoNotScale(self.add_rows, "/api/drivers/")
+        self.assertQueriesDoNotScale(self.add_rows, "/api/drivers/?name=traynor")
+
+    def test_listing_inventories(self):
+        """Test that listing rentals and branch inventory does not make a query for each row"""
+        self.assertQueriesDoNotScale(self.add_rows, "/api/rent-car/")
+        self.assertQueriesDoNotScale(self.add_rows, "/api/return-car/")
+
+    def test_listing_reservations(self):
+        """Test that listing reservations does not make a query for each reservation"""
+        self.assertQueriesDoNotScale(self.add_rows, "/api/reservations/")
+
+    def test_listing_availability(self):
+        """Test that grouped availability counts do not make a query for each group"""
+        self.assertQueriesDoNotScale(self.add_rows, "/api/availability/?group_by=make,city")
+
@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError
+from django.test import TestCase
+
+from carmanagement_api.models import Branch, Driver, Car
+from carmanagement_api import serializers
+from carmanagement_api.warmup import warm_up
+
+
+class WarmUpTestCase(TestCase):
+    """Tests for preparing a worker before its first request"""
+
+    def setUp(self):
+        """Start from a worker that has not looked up any content types"""
+        ContentType.objects.clear_cache()
+        serializers.forget_location_content_types()
+
+    def test_warm_up_looks_up_location_types(self):
+        """Test that warming up looks up the content types of car locations in a single query"""
+        with self.assertNumQueries(1):
+            warm_up()
+
+        self.assertEqual(serializers.LOCATION_CONTENT_TYPE_IDS, {
+            Car.AT_BRANCH: ContentType.objects.get_for_model(Branch).id,
+            Car.WITH_DRIVER: ContentType.objects.get_for_model(Driver).id,
+        })
+
+    def test_warm_up_before_migrations(self):
+        """Test that warming up works before migrations have run, leaving the content types to the first request"""
+        with mock.patch.object(ContentType.objects, "get_for_models", side_effect=DatabaseError("no such table")):
+            warm_up()
+
+        self.assertEqual(serializers.LOCATION_CONTENT_TYPE_IDS, {})
+
+    def run_worker(self, script):
+        """Run a script in a new process using the API-only settings and a new database, returning its output"""
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                DJANGO_SETTINGS_MODULE="carmanagement_project.settings_api",
+                DATABASE_PATH=os.path.join(directory, "db.sqlite3"),
+                PYTHONPATH=settings.BASE_DIR
+            )
+            output = subprocess.run([sys.executable, "-c", script], stdout=subprocess.PIPE, cwd=settings.BASE_DIR, env=env)
+
+        return output.stdout.decode().strip()
+
+    def test_first_car_request_does_not_query_content_types(self):
+        """Test that the first car a new worker serializes reports its location without querying content types"""
+        script = (
+            "import django\n"
+            "django.setup()\n"
+            "from django.core.management import call_command\n"
+            "call_command('migrate', verbosity=0)\n"
+            "from django.contrib.contenttypes.models import ContentType\n"
+            "from carmanagement_api.models import Branch, Car\n"
+            "car = Car(make='Ford', model='Fiesta', year_of_manufacture=2018)\n"
+            "car.currently_with = Branch.objects.create(city='London', postcode='WC2B 6ST')\n"
+            "car.save()\n"
+            "# A new worker has not looked up any content types before it is started\n"
+            "ContentType.objects.clear_cache()\n"
+            "from carmanagement_project.wsgi import application\n"
+            "from django.db import connection\n"
+            "from django.test import Client\n"
+            "from django.test.utils import CaptureQueriesContext\n"
+            "with CaptureQueriesContext(connection) as queries:\n"
+            "    response = Client().patch(f'/api/cars/{car.id}/', {'make': 'Ford'}, content_type='application/json')\n"
+            "print(response.status_code, response.json()['currently_with_type'] is not None)\n"
+            "print(sum('django_content_type' in q['sql'] for q in queries))\n"
+        )
+
+        self.assertEqual(self.run_worker(script), "200 True\n0")
+
+    def test_api_settings_serve_requests(self):
+        """Test that a worker using the API-only settings boots and serves the API root"""
+        script = (
+            "from carmanagement_project.wsgi import application\n"
+            "from wsgiref.util import setup_testing_defaults\n"
+            "environ = {}\n"
+            "setup_testing_defaults(environ)\n"
+            "environ['PATH_INFO'] = '/api/'\n"
+            "statuses = []\n"
+            "application(environ, lambda status, headers: statuses.append(status))\n"
+            "print(statuses[0])\n"
+        )
+        self.assertEqual(self.run_worker(script), "200 OK")
@@ -0,0 +1,105 @@
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+
+# Seconds a bucket stays locked if the request holding the lock never releases it, and the longest a request waits
+# for the lock before it is refused
+LOCK_TIMEOUT = 2
+LOCK_WAIT = 0.5
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Limit each client with a token bucket, where each request costs a number of tokens based on the view's action"""
+
+    def get_cache(self):
+        """Return the cache used to hold the state of each bucket"""
+        return caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+    def get_quota(self, ident):
+        """Return the bucket size and refill rate (tokens per second) for a client"""
+        quotas = getattr(settings, 'RATE_LIMIT_CLIENT_QUOTAS', {})
+        return quotas.get(ident, (settings.RATE_LIMIT_BUCKET_SIZE, settings.RATE_LIMIT_REFILL_RATE))
+
+    def get_cost(self, request, view):
+        """Return the number of tokens the request costs, set per action with a throttle_costs dict on the view"""
+        costs = getattr(view, 'throttle_costs', {})
+        return costs.get(getattr(view, 'action', None), 1)
+
+    @contextmanager
+    def lock(self, cache, key):
+        """Lock a bucket against other requests of the same client in any worker, yielding whether it was locked
+
+        cache.add only sets a key that is not already set, atomically in every shared cache backend, so only one
+        request at a time can add the lock.
+        """
+        lock_key = f'{key}:lock'
+        deadline = time.monotonic() + LOCK_WAIT
+        locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+        while not locked and time.monotonic() < deadline:
+            time.sleep(0.001)
+            locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+
+        try:
+            yield locked
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+    def allow_request(self, request, view):
+        """Take the cost of the request from the client's bucket, refusing the request if there are not enough tokens"""
+        ident = self.get_ident(request)
+        size, rate = self.get_quota(ident)
+        cost = self.get_cost(request, view)
+        cache = self.get_cache()
+        key = f'throttle:{ident}'
+
+        # The bucket is read and written back under a lock, so concurrent requests cannot both spend the same tokens
+        with self.lock(cache, key) as locked:
+            now = time.time()
+
+            # Bucket state is stored as a (tokens, timestamp) pair and topped up based on the time since the last request
+            tokens, last = cache.get(key, (size, now))
+            tokens = min(size, tokens + (now - last) * rate)
+
+            # A client whose requests are queued up on its bucket is sending too many at once
+            allowed = locked and tokens >= cost
+            if allowed:
+                tokens -= cost
+                # A full bucket is the default, so expire the state once it would have refilled
+                cache.set(key, (tokens, now), int((size - tokens) / rate) + 1)
+
+        if allowed:
+            self.wait_time = 0
+        elif not locked:
+            self.wait_time = LOCK_WAIT
+        else:
+            self.wait_time = (cost - tokens) / rate
+
+        # Store the quota on the underlying HttpRequest so the middleware can report it
+        request._request.rate_limit = (size, int(tokens))
+        return allowed
+
+    def wait(self):
+        """Return the number of seconds until the request could be allowed"""
+        return self.wait_time
+
+
+class RateLimitHeadersMiddleware:
+    """Report the remaining quota of the client on each throttled response"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        rate_limit = getattr(request, 'rate_limit', None)
+
+        if rate_limit is not None:
+            response['X-RateLimit-Limit'] = rate_limit[0]
+            response['X-RateLimit-Remaining'] = rate_limit[1]
+
+        return response
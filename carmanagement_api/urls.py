@@ -10,7 +10,20 @@ router.register('branches', views.BranchViewSet)
 router.register('drivers', views.DriverViewSet)
 router.register('rent-car', views.DriverInventoryViewSet)
 router.register('return-car', views.BranchInventoryViewSet)
+router.register('reservations', views.ReservationViewSet)
+router.register('branch-transfers', views.BranchTransferViewSet)
 
 urlpatterns = [
+    path('availability/', views.AvailabilityView.as_view()),
+    path('batch/', views.BatchView.as_view(), name='batch'),
+    path('graphql/', views.GraphQLView.as_view()),
+    path('occupancy/', views.OccupancyView.as_view()),
+    path('profiles/', views.ProfileView.as_view()),
+    path('profiles/<str:profile_id>/', views.ProfileView.as_view()),
+    path('profiles/<str:profile_id>/flamegraph/', views.FlamegraphView.as_view()),
+    path('rebalance/', views.RebalanceView.as_view()),
+    path('regions/', views.RegionSummaryView.as_view()),
+    path('telemetry/', views.TelemetryView.as_view()),
+    path('tokens/', views.TokenView.as_view()),
     path('', include(router.urls))
 ]
@@ -0,0 +1,71 @@
+from django.db import transaction
+from rest_framework.response import Response
+from rest_framework import status
+
+from carmanagement_api.models import VersionConflict
+from carmanagement_api.dbrouters import fleet_database
+
+
+IF_MATCH_HEADER = 'HTTP_IF_MATCH'
+
+
+def etag(version):
+    """Return the ETag of a version of a row"""
+    return f'"{version}"'
+
+
+def if_match_version(request):
+    """Return the version named by the If-Match header, or None if any version may be updated"""
+    value = request.META.get(IF_MATCH_HEADER, '').strip()
+
+    if not value or value == '*':
+        return None
+
+    # If-Match only uses strong comparison, so a weak ETag never matches
+    if value.startswith('W/'):
+        raise VersionConflict(f'If-Match {value} is a weak ETag, send the ETag as it was given.')
+
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise VersionConflict(f'If-Match {value} is not a version.')
+
+
+class VersionedViewSetMixin:
+    """Give the version of a row as its ETag, and only update it if it still has the version named by If-Match
+
+    Without If-Match an update is still checked against the version read at the start of the request, so a write
+    made by another request in the meantime is never overwritten.
+    """
+
+    def get_object(self):
+        """Expect the version named by If-Match when the row is updated"""
+        instance = super().get_object()
+
+        if self.request.method in ('PUT', 'PATCH'):
+            expected = if_match_version(self.request)
+            if expected is not None:
+                instance.version = expected
+
+        # Saving the row moves this instance on to its new version, which is given as the ETag of the response
+        self.versioned_instance = instance
+        return instance
+
+    def retrieve(self, request, *args, **kwargs):
+        """Return the row with its version as the ETag"""
+        response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = etag(self.versioned_instance.version)
+        return response
+
+    def update(self, request, *args, **kwargs):
+        """Update the row, returning a 412 status if it does not have the expected version"""
+        # The update is rolled back on a conflict without breaking a transaction it runs in, such as a batch's
+        try:
+            with transaction.atomic(using=fleet_database()):
+                response = super().update(request, *args, **kwargs)
+        except VersionConflict as e:
+            return Response({'error': str(e)}, status.HTTP_412_PRECONDITION_FAILED)
+
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag(self.versioned_instance.version)
+        return response
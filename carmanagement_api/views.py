@@ -1,93 +1,111 @@
-from django.db.models import Q
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db.models import Q, Sum, Count
+from django.http import HttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import viewsets
 from rest_framework import filters
+from rest_framework import permissions
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
 
 from carmanagement_api import serializers
 from carmanagement_api import models
-
-import requests
-
-
-class CarViewSet(viewsets.ModelViewSet):
+from carmanagement_api import services
+from carmanagement_api import geo
+from carmanagement_api import batch
+from carmanagement_api.scheduling import ReservationError
+from carmanagement_api.idempotency import idempotent
+from carmanagement_api.versioning import VersionedViewSetMixin, etag
+from carmanagement_api.dbrouters import fan_out
+from carmanagement_api import authentication
+from carmanagement_api import profiling
+from carmanagement_api import telemetry
+from carmanagement_api.parsers import NDJSONParser, MessagePackParser
+from carmanagement_api import graph
+
+
+class CarViewSet(VersionedViewSetMixin, viewsets.ModelViewSet):
     """Handle creating, viewing and updating cars in the system"""
     # Setup
     serializer_class = serializers.CarSerializer
     queryset = models.Car.objects.all()
     filter_backends = (filters.SearchFilter,)
     search_fields = ('make', 'model', 'year_of_manufacture')
+    # Listing cars is unpaginated, so it costs more of the client's rate limit than retrieving a single car
+    throttle_costs = {'list': 10}
 
     def list(self, request):
         """Custom list implementation to correctly show Cars with currently_with attribute"""
 
-        # Arrays used to store results
-        query_results = None
-        cars_json = []
-
-        # Get all cars if no search parameter is provided, or get only matching cars if there is one given
+        # Cars are listed from their listing rows, which already hold the details of their location
         if request.query_params.get('search') == None:
             # Get all cars in the database
-            query_results = models.Car.objects.all()
+            query_results = models.CarListing.objects.order_by('car')
         else:
             # Get all cars in the database that match the search string given in either the make, model or year of manufacture
             search_str = request.query_params.get('search')
-            query_results = models.Car.objects.filter(Q(make__contains=search_str) | Q(model__contains=search_str) | Q(year_of_manufacture__contains=search_str))
+            query_results = models.CarListing.objects.order_by('car') \
+                .filter(Q(make__contains=search_str) | Q(model__contains=search_str) | Q(year_of_manufacture__contains=search_str))
 
         # Generate a dict for each car
-        for c in list(query_results):
-            cars_json = cars_json + [self.get_car_as_json(c),]
+        cars_json = [listing.as_json() for listing in query_results]
 
         # Return the response as JSON
         return Response({"cars": cars_json})
 
     def retrieve(self, request, pk=None):
         """Custom retrieve implementation to correctly show a Car with currently_with attribute"""
-        c = models.Car.objects.get(pk=pk)
-        return Response(self.get_car_as_json(c))
+        c = models.Car.objects.select_related('current_branch', 'current_driver').get(pk=pk)
+        return Response(self.get_car_as_json(c), headers={'ETag': etag(c.version)})
 
-    def get_car_as_json(self, c):
-        """Creates a dict used to show a given Car as JSON"""
+    @action(detail=True)
+    def telemetry(self, request, pk=None):
+        """Return the most recent telemetry reading of a car"""
+        reading = models.LatestTelemetry.objects.filter(car_id=pk).first()
 
-        currently_with_json = {}
-
-        # Determine if currently_with is of type Branch or Driver and set attribute accordingly
-        if type(c.currently_with) == models.Branch:
-            currently_with_json.update({
-                'id': c.currently_with.id,
-                'city': c.currently_with.city,
-                'postcode': c.currently_with.postcode,
-            })
-        elif type(c.currently_with) == models.Driver:
-            currently_with_json.update({
-                'id': c.currently_with.id,
-                'first_name': c.currently_with.first_name,
-                'middle_names': c.currently_with.middle_names,
-                'last_name': c.currently_with.last_name,
-                'date_of_birth': c.currently_with.date_of_birth
-            })
-        else:
-            currently_with_json.update({
-                'message': 'Currently unassigned. Please assign this car to a Branch or Driver'
-            })
+        if reading is None:
+            return Response({'error': 'No readings have been received from this car.'}, status.HTTP_404_NOT_FOUND)
 
-        return {
-            'id': c.id,
-            'make': c.make,
-            'model': c.model,
-            'year_of_manufacture': c.year_of_manufacture,
-            'currently_with': currently_with_json
-        }
+        return Response(reading.as_json())
 
+    @action(detail=True, url_path='telemetry/history')
+    def telemetry_history(self, request, pk=None):
+        """Return the telemetry readings of a car between two times, oldest first"""
+        serializer = serializers.TelemetryQuerySerializer(data=request.query_params)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
-class BranchViewSet(viewsets.ModelViewSet):
+        params = serializer.validated_data
+        readings = telemetry.readings(pk, params['start'], params['end'], params['limit'])
+        return Response({'readings': [r.as_json() for r in readings]})
+
+    def perform_update(self, serializer):
+        """Keep the branch availability counts up to date when a car's details change"""
+        services.update_car(serializer)
+
+    def perform_destroy(self, instance):
+        """Remove a deleted car from the branch availability counts"""
+        services.delete_car(instance)
+
+    def get_car_as_json(self, c):
+        """Creates a dict used to show a given Car as JSON"""
+        # A car is shown the same way as its listing row, which is built from the car without saving it
+        return models.CarListing.from_car(c).as_json()
+
+
+class BranchViewSet(VersionedViewSetMixin, viewsets.ModelViewSet):
     """Handle creating, viewing and updating branches in the system"""
     # Setup
     serializer_class = serializers.BranchSerializer
     queryset = models.Branch.objects.all()
     filter_backends = (filters.SearchFilter,)
     search_fields = ('city', 'postcode')
+    throttle_costs = {'list': 5, 'nearest': 2}
 
     def create(self, request):
         """Custom implementation of create method to include postcode validation"""
@@ -97,42 +115,150 @@ class BranchViewSet(viewsets.ModelViewSet):
             city = serializer.validated_data['city']
             postcode = serializer.validated_data['postcode']
             capacity = None
-            response_json = requests.get(f'https://api.postcodes.io/postcodes/{postcode}/validate').json()
+
+            # Looking up the postcode both validates it and gives the coordinates used by the nearest branch search
+            try:
+                coordinates = geo.lookup_postcode(postcode)
+            except geo.PostcodeLookupError:
+                return Response({'postcode': 'There was an error validating your postcode. Please try again later.'}, status.HTTP_400_BAD_REQUEST)
 
             try:
                 capacity = serializer.validated_data['capacity']
             except:
                 capacity = -1
 
-            if response_json['status'] == 200:
-                if response_json['result'] == True:
-                    if capacity == -1:
-                        branch = models.Branch.objects.create(
-                            city = city,
-                            postcode = postcode
-                        )
-                    else:
-                        branch = models.Branch.objects.create(
-                            city = city,
-                            postcode = postcode,
-                            capacity = capacity
-                        )
-
-                    return Response({'message': f'A branch in {branch} was created successfully.'})
+            if coordinates is not None:
+                latitude, longitude = coordinates
+
+                if capacity == -1:
+                    branch = models.Branch.objects.create(
+                        city = city,
+                        postcode = postcode,
+                        latitude = latitude,
+                        longitude = longitude
+                    )
                 else:
-                    return Response({'postcode': 'An invalid postcode was given.'}, status.HTTP_400_BAD_REQUEST)
+                    branch = models.Branch.objects.create(
+                        city = city,
+                        postcode = postcode,
+                        capacity = capacity,
+                        latitude = latitude,
+                        longitude = longitude
+                    )
+
+                return Response({'message': f'A branch in {branch} was created successfully.'})
             else:
+                return Response({'postcode': 'An invalid postcode was given.'}, status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    def perform_update(self, serializer):
+        """Look up the coordinates of a branch again when its postcode is changed, so it is found where it now is"""
+        branch = serializer.instance
+        postcode = serializer.validated_data.get('postcode')
+        extra = {}
+
+        if postcode is not None and geo.normalise_postcode(postcode) != geo.normalise_postcode(branch.postcode):
+            try:
+                coordinates = geo.lookup_postcode(postcode)
+            except geo.PostcodeLookupError:
+                raise ValidationError({'postcode': 'There was an error validating your postcode. Please try again later.'})
+
+            if coordinates is None:
+                raise ValidationError({'postcode': 'An invalid postcode was given.'})
+
+            extra['latitude'], extra['longitude'] = coordinates
+
+        serializer.save(**extra)
+
+    @action(detail=False)
+    def nearest(self, request):
+        """List the branches with free capacity nearest to a postcode or a latitude and longitude"""
+        serializer = serializers.NearestBranchQuerySerializer(data=request.query_params)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        if 'postcode' in serializer.validated_data:
+            try:
+                coordinates = geo.lookup_postcode(serializer.validated_data['postcode'])
+            except geo.PostcodeLookupError:
                 return Response({'postcode': 'There was an error validating your postcode. Please try again later.'}, status.HTTP_400_BAD_REQUEST)
+
+            if coordinates is None:
+                return Response({'postcode': 'An invalid postcode was given.'}, status.HTTP_400_BAD_REQUEST)
         else:
+            coordinates = (serializer.validated_data['latitude'], serializer.validated_data['longitude'])
+
+        results = services.nearest_branches(*coordinates, count=serializer.validated_data['count'])
+
+        return Response([
+            dict(serializers.BranchSerializer(b).data, distance_km=round(d, 3), free_capacity=b.capacity - b.occupancy)
+            for b, d in results
+        ])
+
+    @action(detail=True, methods=['post'], permission_classes=(permissions.IsAdminUser,))
+    @idempotent
+    def transfer(self, request, pk=None):
+        """Move every car at the branch to other branches, or preview the moves, or start moving them in the background"""
+        branch = self.get_object()
+        serializer = serializers.BranchTransferRequestSerializer(data=request.data)
+
+        if not serializer.is_valid():
             return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
-class DriverViewSet(viewsets.ModelViewSet):
+        params = serializer.validated_data
+        destinations = params.get('destinations')
+
+        if params['background']:
+            job = models.BranchTransfer(branch=branch, close=params['close'])
+            job.destination_ids = [d.id for d in destinations or []]
+            job.save()
+            return Response(serializers.BranchTransferSerializer(job).data, status.HTTP_202_ACCEPTED)
+
+        try:
+            result = services.transfer_branch(branch, destinations, close=params['close'], dry_run=params['dry_run'])
+        except services.InventoryError as e:
+            return Response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+        except services.FleetBusy as e:
+            return Response({'error': str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
+
+        return Response(result)
+
+class DriverViewSet(VersionedViewSetMixin, viewsets.ModelViewSet):
     """Handle creating, viewing and updating drivers in the system"""
 
     serializer_class = serializers.DriverSerializer
     queryset = models.Driver.objects.all()
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('first_name', 'middle_names', 'last_name', 'date_of_birth')
+    throttle_costs = {'list': 5}
+
+    def list(self, request):
+        """List all drivers, or look drivers up by name and date of birth using the driver search index"""
+        params = request.query_params.copy()
+
+        # The search parameter used by the other viewsets is treated as a name
+        if 'search' in params and 'name' not in params:
+            params['name'] = params['search']
+
+        if not any(p in params for p in ('name', 'date_of_birth')):
+            return super().list(request)
+
+        serializer = serializers.DriverSearchQuerySerializer(data=params)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        drivers = services.search_drivers(**serializer.validated_data)
+        return Response(self.serializer_class(drivers, many=True).data)
+
+
+class BranchTransferViewSet(viewsets.ReadOnlyModelViewSet):
+    """Show the progress of transfers of every car at a branch that run in the background"""
+
+    serializer_class = serializers.BranchTransferSerializer
+    queryset = models.BranchTransfer.objects.all().order_by('-id')
+    permission_classes = (permissions.IsAdminUser,)
+
 
 class BranchInventoryViewSet(viewsets.ModelViewSet):
     """Handle creating, viewing and updating associations between cars and branches"""
@@ -140,7 +266,9 @@ class BranchInventoryViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.BranchInventorySerializer
     queryset = models.BranchInventory.objects.all()
     http_method_names = ['get', 'post', 'head']
+    throttle_costs = {'list': 5, 'create': 2}
 
+    @idempotent
     def create(self, request):
         """Remove a Car from a Driver and assign it to a Branch"""
         serializer = self.serializer_class(data=request.data)
@@ -150,40 +278,18 @@ class BranchInventoryViewSet(viewsets.ModelViewSet):
             car = serializer.validated_data['car']
             branch = serializer.validated_data['branch']
 
-            # Only proceed if the car is not already with a branch
-            if(models.BranchInventory.objects.filter(car=car).count() == 0):
-                if branch.capacity > models.BranchInventory.objects.filter(branch=branch).count():
-                    # Remove the car from the driver's inventory
-                    models.DriverInventory.objects.filter(car=car).delete()
-
-                    # Assign the car to the branch
-                    models.BranchInventory.objects.create(
-                        car = car,
-                        branch = branch
-                    )
-
-                    # Update the Car's currently_with attribute
-                    car.currently_with = branch
-                    car.save()
-
-                    # Return a message to confirm that the association has been successfully added
-                    return Response({'message': f'Car {car} has been returned to {branch}'}, status.HTTP_201_CREATED)
-                else:
-                    return Response({'error': f'The branch {branch} is currently at full capacity.'}, status.HTTP_400_BAD_REQUEST)
+            try:
+                previous_branch = services.return_car(car, branch)
+            except services.InventoryError as e:
+                return Response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+            except services.FleetBusy as e:
+                return Response({'error': str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
+
+            # Return a message to confirm that the association has been successfully added
+            if previous_branch is None:
+                return Response({'message': f'Car {car} has been returned to {branch}'}, status.HTTP_201_CREATED)
             else:
-                # Inform the user that the car is already assigned to a branch
-                current_branch = models.BranchInventory.objects.get(car=car).branch
-                models.BranchInventory.objects.filter(car=car).delete()
-
-                models.BranchInventory.objects.create(
-                    car = car,
-                    branch = branch
-                )
-
-                car.currently_with = branch
-                car.save()
-
-                return Response({'message': f'Car {car} has been moved from {current_branch} to {branch}'}, status.HTTP_201_CREATED)
+                return Response({'message': f'Car {car} has been moved from {previous_branch} to {branch}'}, status.HTTP_201_CREATED)
         else:
             # Return the error that occurred
             return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
@@ -194,7 +300,9 @@ class DriverInventoryViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.DriverInventorySerializer
     queryset = models.DriverInventory.objects.all()
     http_method_names = ['get', 'post', 'head']
+    throttle_costs = {'list': 5, 'create': 2}
 
+    @idempotent
     def create(self, request):
         """Remove a Car from a Branch and assign it to a Driver"""
         serializer = self.serializer_class(data=request.data)
@@ -204,27 +312,331 @@ class DriverInventoryViewSet(viewsets.ModelViewSet):
             car = serializer.validated_data['car']
             driver = serializer.validated_data['driver']
 
-            # Only proceed if the car is not already assigned to a driver
-            if(models.DriverInventory.objects.filter(car=car).count() == 0):
-                # Remove the car from the branch's inventory
-                models.BranchInventory.objects.filter(car=car).delete()
+            try:
+                services.rent_car(car, driver)
+            except services.InventoryError as e:
+                # Inform the user that the car is already assigned to a driver
+                return Response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+            except services.FleetBusy as e:
+                return Response({'error': str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
 
-                # Assign the car to the driver
-                models.DriverInventory.objects.create(
-                    car = car,
-                    driver = driver
-                )
+            # Return a message to confirm that the association has been successfully added
+            return Response({'message': f'Car {car} has been assigned to Driver {driver}'}, status.HTTP_201_CREATED)
+        else:
+            # Return the error that occurred
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
-                # Update the Car's currently_with attribute
-                car.currently_with=driver
-                car.save()
 
-                # Return a message to confirm that the association has been successfully added
-                return Response({'message': f'Car {car} has been assigned to Driver {driver}'}, status.HTTP_201_CREATED)
-            else:
-                # Inform the user that the car is already assigned to a driver
-                current_driver = models.DriverInventory.objects.get(car=car).driver
-                return Response({'error': f'Car {car} is already assigned to {current_driver}'}, status.HTTP_400_BAD_REQUEST)
+class AvailabilityView(APIView):
+    """Count the cars matching the given filters, optionally grouped by make, model, year or city"""
+
+    # Map query parameters onto the fields of the availability counts and the Car model
+    BRANCH_FIELDS = {
+        'make': 'make',
+        'model': 'model',
+        'year': 'year_of_manufacture',
+        'year_min': 'year_of_manufacture__gte',
+        'year_max': 'year_of_manufacture__lte',
+        'city': 'branch__city',
+    }
+    CAR_FIELDS = {
+        'make': 'make',
+        'model': 'model',
+        'year': 'year_of_manufacture',
+        'year_min': 'year_of_manufacture__gte',
+        'year_max': 'year_of_manufacture__lte',
+    }
+
+    def get(self, request):
+        """Return the number of matching cars, and the count for each group if group_by is given"""
+        serializer = serializers.AvailabilityQuerySerializer(data=request.query_params)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        params = serializer.validated_data
+        location = params['location']
+        group_by = params.get('group_by', [])
+
+        # Cars at a branch are counted from the precomputed availability counts rather than the inventory tables
+        if location == 'branch':
+            fields = self.BRANCH_FIELDS
+            query_results = models.BranchAvailability.objects.all()
+            total = Sum('available')
         else:
-            # Return the error that occurred
+            fields = self.CAR_FIELDS
+            query_results = models.Car.objects.filter(driverinventory__isnull=(location == 'none'))
+            if location == 'none':
+                query_results = query_results.filter(branchinventory__isnull=True)
+            total = Count('id')
+
+        query_results = query_results.filter(**{fields[p]: params[p] for p in fields if p in params})
+
+        if not group_by:
+            return Response({'count': query_results.aggregate(count=total)['count'] or 0})
+
+        groups = query_results.values(*[fields[f] for f in group_by]) \
+            .annotate(count=total).filter(count__gt=0).order_by(*[fields[f] for f in group_by])
+
+        results = [dict([(f, g[fields[f]]) for f in group_by] + [('count', g['count'])]) for g in groups]
+
+        return Response({
+            'count': sum(r['count'] for r in results),
+            'results': results
+        })
+
+
+class BatchView(APIView):
+    """Run several API requests in order within one HTTP request"""
+
+    @idempotent
+    def post(self, request):
+        """Run each request of the batch, returning all of their responses
+
+        Later requests can use values from earlier responses with references such as {{driver.body.0.id}}.
+        """
+        serializer = serializers.BatchSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        responses, committed = batch.run_batch(
+            request._request,
+            serializer.validated_data['requests'],
+            atomic=serializer.validated_data['transaction']
+        )
+
+        return Response({'committed': committed, 'responses': responses})
+
+
+class RegionSummaryView(APIView):
+    """Summarise the fleet of every region, querying the regions in parallel"""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        """Return the counts of branches, drivers and cars for each region and in total"""
+        regions = fan_out(services.fleet_summary)
+
+        totals = {}
+        for summary in regions.values():
+            for key, value in summary.items():
+                totals[key] = totals.get(key, 0) + value
+
+        return Response({'regions': regions, 'totals': totals})
+
+
+class OccupancyView(APIView):
+    """Report the average and peak occupancy of branches over time from the rolled up samples"""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        """Return the buckets of the chosen resolution that overlap the range, for one branch or all of them"""
+        serializer = serializers.OccupancyQuerySerializer(data=request.query_params)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        params = serializer.validated_data
+        buckets = list(services.occupancy_rollups(
+            params['resolution'], params['start'], params['end'], params.get('branch'), params.get('after')
+        )[:params['limit'] + 1])
+
+        # One more bucket than a page is read to tell whether there is another page
+        next_page = None
+        if len(buckets) > params['limit']:
+            buckets = buckets[:params['limit']]
+            next_page = f'{buckets[-1].branch_id}:{int(buckets[-1].start.timestamp())}'
+
+        return Response({
+            'resolution': params['resolution'],
+            'start': params['start'],
+            'end': params['end'],
+            'results': [b.as_json() for b in buckets],
+            'next': next_page
+        })
+
+
+class RebalanceView(APIView):
+    """Plan and make moves of cars from full branches to empty ones"""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        """Return the transfers that would bring every branch close to the target fill level"""
+        serializer = serializers.RebalanceSerializer(data=request.query_params)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        transfers = services.plan_rebalancing(serializer.validated_data['fill'])
+        return Response(self.plan_as_json(serializer.validated_data['fill'], transfers))
+
+    @idempotent
+    def post(self, request):
+        """Plan the transfers and move the cars, returning the plan and each car moved"""
+        serializer = serializers.RebalanceSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        transfers = services.plan_rebalancing(serializer.validated_data['fill'])
+        moves = services.rebalance_fleet(transfers)
+
+        response = self.plan_as_json(serializer.validated_data['fill'], transfers)
+        response['moves'] = moves
+        return Response(response)
+
+    def plan_as_json(self, fill, transfers):
+        """Return a plan with its totals"""
+        return {
+            'fill': fill,
+            'cars': sum(t.count for t in transfers),
+            'distance_km': round(sum(t.count * t.distance_km for t in transfers), 3),
+            'transfers': [t._asdict() for t in transfers]
+        }
+
+
+class TokenView(APIView):
+    """Issue and revoke signed API tokens"""
+    authentication_classes = (authentication.SignedTokenAuthentication,)
+
+    def post(self, request):
+        """Return a token for the user with the given username and password, and the time it expires"""
+        serializer = serializers.TokenRequestSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        user = authenticate(request._request, **serializer.validated_data)
+        if user is None:
+            return Response({'error': 'Invalid username or password.'}, status.HTTP_400_BAD_REQUEST)
+
+        token, expires_at = authentication.issue_token(user)
+        return Response({'token': token, 'expires_at': expires_at})
+
+    def delete(self, request):
+        """Revoke the token the request was made with"""
+        if request.auth is None:
+            return Response({'error': 'Only a token can be revoked.'}, status.HTTP_401_UNAUTHORIZED)
+
+        authentication.revoke(request.user.id, request.user.token_id, request.user.expires_at)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ProfileView(APIView):
+    """List and read the profiles of requests that asked to be profiled"""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, profile_id=None):
+        """Return the summaries of the recent profiles, or every query of one profile"""
+        if profile_id is None:
+            profiles = (profiling.read_profile(p) for p in profiling.profile_ids())
+            return Response({'results': [
+                {k: v for k, v in p.items() if k != 'queries'} for p in profiles if p is not None
+            ]})
+
+        profile = profiling.read_profile(profile_id)
+        if profile is None:
+            return Response({'error': f'There is no profile {profile_id}.'}, status.HTTP_404_NOT_FOUND)
+
+        return Response(profile)
+
+
+class FlamegraphView(APIView):
+    """Download the samples of a profile as collapsed stacks, which flamegraph.pl and speedscope can draw"""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, profile_id):
+        """Return the collapsed stacks of a profile as plain text"""
+        folded = profiling.read_profile(profile_id, 'folded')
+        if folded is None:
+            return Response({'error': f'There is no profile {profile_id}.'}, status.HTTP_404_NOT_FOUND)
+
+        return HttpResponse(folded, content_type='text/plain; charset=utf-8')
+
+
+class GraphQLView(APIView):
+    """Read cars, branches, drivers and the relations between them in the shape each client needs"""
+
+    def get(self, request):
+        """Run a query given in the query string"""
+        return self.run_query(request.query_params)
+
+    def post(self, request):
+        """Run a query given in the body"""
+        return self.run_query(request.data)
+
+    def run_query(self, data):
+        """Run a query, returning its data and any errors"""
+        serializer = serializers.GraphQLRequestSerializer(data=data)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        result, status_code = graph.run_query(
+            serializer.validated_data['query'],
+            serializer.validated_data.get('variables'),
+            serializer.validated_data.get('operationName')
+        )
+        return Response(result, status_code)
+
+
+class TelemetryView(APIView):
+    """Receive batches of telemetry readings from cars"""
+    parser_classes = (NDJSONParser, MessagePackParser, JSONParser)
+
+    def post(self, request):
+        """Accept the valid readings to be written shortly, and list the position and problem of each invalid one"""
+        if not isinstance(request.data, list):
+            return Response({'error': 'Send a list of readings.'}, status.HTTP_400_BAD_REQUEST)
+
+        if len(request.data) > settings.TELEMETRY_MAX_READINGS:
+            return Response(
+                {'error': f'Up to {settings.TELEMETRY_MAX_READINGS} readings can be sent at once.'},
+                status.HTTP_400_BAD_REQUEST
+            )
+
+        accepted, errors = telemetry.ingest(request.data)
+        return Response({'accepted': accepted, 'rejected': len(errors), 'errors': errors[:20]}, status.HTTP_202_ACCEPTED)
+
+
+class ReservationViewSet(viewsets.ModelViewSet):
+    """Handle creating, viewing and cancelling future reservations of cars"""
+
+    serializer_class = serializers.ReservationSerializer
+    queryset = models.Reservation.objects.all().order_by('start')
+    http_method_names = ['get', 'post', 'delete', 'head']
+    throttle_costs = {'list': 5, 'create': 2, 'free_cars': 2}
+
+    def create(self, request):
+        """Reserve a car if it is free and its return branch will have room for it"""
+        serializer = self.serializer_class(data=request.data)
+
+        if serializer.is_valid():
+            try:
+                reservation = services.create_reservation(**serializer.validated_data)
+            except ReservationError as e:
+                return Response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+            return Response(self.serializer_class(reservation).data, status.HTTP_201_CREATED)
+        else:
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    def destroy(self, request, pk=None):
+        """Cancel a reservation"""
+        try:
+            services.cancel_reservation(self.get_object())
+        except ReservationError as e:
+            return Response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, url_path='free-cars')
+    def free_cars(self, request):
+        """List the cars at a branch which are not reserved during a period"""
+        serializer = serializers.FreeCarsQuerySerializer(data=request.query_params)
+
+        if not serializer.is_valid():
             return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        cars = services.free_cars(**serializer.validated_data)
+        return Response(serializers.CarSerializer(cars, many=True).data)
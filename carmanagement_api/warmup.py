@@ -0,0 +1,18 @@
+from django.db import DatabaseError
+from django.urls import get_resolver, reverse
+
+from carmanagement_api import serializers
+
+
+def warm_up():
+    """Load everything the first request would otherwise have to, so that it is as fast as every other request"""
+    # Importing the URL configuration imports every view and serializer, and reversing a URL builds the lookup tables
+    get_resolver().url_patterns
+    reverse('api-root')
+
+    # Look up the content type ids reported as the type of a car's location
+    try:
+        serializers.load_location_content_types()
+    except DatabaseError:
+        # The database may not have been migrated yet, in which case they are looked up by the first car serialized
+        pass
@@ -0,0 +1,24 @@
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """Run the tests, giving any database a test names but the settings do not define an in-memory SQLite database
+
+    The regions tests need a database for each region, which the settings only define when REGIONS is set. The
+    databases are added only for runs that include those tests, and removed again once they have finished.
+    """
+
+    def setup_databases(self, aliases=None, **kwargs):
+        self.added_databases = [alias for alias in aliases or () if alias not in connections.databases]
+        for alias in self.added_databases:
+            connections.databases[alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+
+        return super().setup_databases(aliases=aliases, **kwargs)
+
+    def teardown_databases(self, old_config, **kwargs):
+        super().teardown_databases(old_config, **kwargs)
+
+        for alias in self.added_databases:
+            connections[alias].close()
+            del connections.databases[alias]
@@ -43,12 +43,18 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'carmanagement_api.compression.CompressionMiddleware',
+    'carmanagement_api.dbrouters.RegionMiddleware',
+    'carmanagement_api.dbrouters.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'carmanagement_api.throttling.RateLimitHeadersMiddleware',
+    'carmanagement_api.profiling.ProfilingMiddleware',
+    'carmanagement_api.querypatterns.RepeatedQueryMiddleware',
 ]
 
 ROOT_URLCONF = 'carmanagement_project.urls'
@@ -71,6 +77,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'carmanagement_project.wsgi.application'
 
+# Load the URL configuration and caches when the WSGI application is created, see carmanagement_api.warmup
+WARM_UP_ON_STARTUP = False
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -78,11 +87,236 @@ WSGI_APPLICATION = 'carmanagement_project.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': os.environ.get('DATABASE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')),
+        # Seconds SQLite waits for another connection to finish writing before giving up on a query
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        'TEST': {
+            # Tests use an in-memory database unless TEST_DATABASE_PATH is set, which concurrent tests need
+            'NAME': os.environ.get('TEST_DATABASE_PATH'),
+        },
+    }
+}
+
+# Tests that use databases these settings do not define, such as a region's, are given in-memory SQLite databases
+TEST_RUNNER = 'carmanagement_project.runner.TestRunner'
+
+# Read replicas, each an alias in DATABASES kept in sync with the default database.
+# Set REPLICA_DATABASE_PATH to use a second SQLite file as a replica when running locally.
+DATABASE_REPLICAS = []
+
+if os.environ.get('REPLICA_DATABASE_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['REPLICA_DATABASE_PATH'],
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    }
+    DATABASE_REPLICAS = ['replica']
+
+# Regions, each mapping to the alias of the database holding its branches, drivers, cars and inventory.
+# Set REGIONS to a comma separated list of names to give each region its own SQLite file when running locally,
+# stored in REGION_DATABASE_DIR if it is set.
+DATABASE_REGIONS = {}
+
+for region in filter(None, os.environ.get('REGIONS', '').split(',')):
+    DATABASES[f'region_{region}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(os.environ.get('REGION_DATABASE_DIR', BASE_DIR), f'{region}.sqlite3'),
+        'OPTIONS': {
+            'timeout': 20,
+        },
     }
+    DATABASE_REGIONS[region] = f'region_{region}'
+
+# Region used for requests that do not name one, if this is None they use the default database
+DEFAULT_REGION = os.environ.get('DEFAULT_REGION')
+
+# Maximum number of regions queried at once by aggregate queries across every region
+REGION_FAN_OUT_WORKERS = 8
+
+DATABASE_ROUTERS = [
+    'carmanagement_api.dbrouters.RegionRouter',
+    'carmanagement_api.dbrouters.ReplicaRouter',
+]
+
+# Replicas further behind the primary than this many seconds are not read from
+REPLICA_MAX_LAG = 5
+
+# Number of seconds between checks of each replica's lag
+REPLICA_LAG_CHECK_INTERVAL = 5
+
+# Number of seconds a client's reads go to the primary after it makes a write, this must be shared by every worker
+REPLICA_STICKY_SECONDS = 10
+REPLICA_STICKY_CACHE = 'default'
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# The local memory cache is per-process, use a shared backend such as memcached when running several workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+# Idempotency-Key support for the rent and return endpoints
+
+IDEMPOTENCY_CACHE = 'default'
+
+# Number of seconds a key and its stored response are kept for
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Number of seconds a duplicate request will wait for the original request to finish
+IDEMPOTENCY_WAIT_TIMEOUT = 5
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'carmanagement_api.renderers.ColumnarJSONRenderer',
+    ),
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+        'carmanagement_api.authentication.SignedTokenAuthentication',
+    ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'carmanagement_api.throttling.TokenBucketThrottle',
+    ),
+}
+
+
+# Signed API tokens, see carmanagement_api.authentication
+
+# Number of seconds a token can be used for after it is issued
+TOKEN_MAX_AGE = 12 * 60 * 60
+
+# Number of users of recently used tokens kept in each worker
+TOKEN_CACHE_SIZE = 10000
+
+# Number of seconds between reloads of the revoked tokens, so a revocation can take this long to reach every worker
+TOKEN_DENY_LIST_REFRESH = 30
+
+
+# Rate limiting
+# Each client gets a bucket of tokens which refills over time, and each request costs a number of tokens
+# set by the view (e.g. listing every car costs more than retrieving one)
+
+RATE_LIMIT_CACHE = 'default'
+
+RATE_LIMIT_BUCKET_SIZE = 600
+
+# Tokens added to each bucket per second
+RATE_LIMIT_REFILL_RATE = 10
+
+# Per-client overrides of the bucket size and refill rate, keyed by client IP address
+RATE_LIMIT_CLIENT_QUOTAS = {}
+
+
+# Cache used to tell each worker when the reservations have changed, this must be shared by every worker
+RESERVATION_CACHE = 'default'
+
+
+# Responses smaller than this many bytes are not compressed, as the saving would not be worth the time
+COMPRESSION_MIN_SIZE = 500
+
+# Compression level used for each encoding, brotli and zstd are only used if their packages are installed
+COMPRESSION_LEVELS = {
+    'gzip': 6,
+    'br': 5,
+    'zstd': 3,
 }
 
 
+# Maximum number of requests that can be sent to /api/batch/ at once
+BATCH_MAX_REQUESTS = 20
+
+
+# Telemetry readings sent by cars are buffered in each worker and written in batches, see carmanagement_api.telemetry
+# Readings are written once this many are waiting
+TELEMETRY_FLUSH_SIZE = 5000
+
+# Seconds between writes of the waiting readings by a background thread. 0 leaves readings waiting until there are
+# TELEMETRY_FLUSH_SIZE of them, and None writes them as soon as they are received
+TELEMETRY_FLUSH_INTERVAL = 1.0
+
+# Number of rows written by each insert
+TELEMETRY_BATCH_SIZE = 500
+
+# Most readings that can be sent in one request
+TELEMETRY_MAX_READINGS = 10000
+
+# Days of readings kept by the prune_telemetry command
+TELEMETRY_RETENTION_DAYS = 30
+
+
+# Limits on GraphQL queries, which are checked before a query is run
+# Most levels of relations a query can nest
+GRAPHQL_MAX_DEPTH = 5
+
+# Most rows a query could load, where each list is counted as its limit, or GRAPHQL_LIST_ESTIMATE rows for the
+# cars of a branch or driver
+GRAPHQL_MAX_COST = 5000
+GRAPHQL_LIST_ESTIMATE = 10
+
+# Largest limit that can be given to the cars, branches or drivers lists
+GRAPHQL_MAX_LIMIT = 500
+
+
+# Fraction of each branch's capacity that rebalancing fills with cars, unless another fraction is asked for
+REBALANCE_TARGET_FILL = 0.8
+
+
+# Most occupancy buckets returned in one page of GET /api/occupancy/, further pages are read with the next cursor
+OCCUPANCY_PAGE_SIZE = 1000
+
+
+# Number of occupancy buckets kept for each branch at each resolution, None keeps every bucket
+OCCUPANCY_ROLLUP_RETENTION = {
+    'hour': 24 * 35,
+    'day': 2 * 366,
+    'week': 10 * 53,
+}
+
+
+# Columnar snapshots of the fleet exported for analytics by the export_snapshot command, see
+# carmanagement_api.snapshots. Each region's exports are kept in a directory of its own
+EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(BASE_DIR, 'exports'))
+
+# Number of rows read from the database at a time and written as each row group, which bounds the memory an export uses
+EXPORT_CHUNK_SIZE = 10000
+
+
+# Profiles of requests made by admin users with an X-Profile: 1 header or ?profile=1, see carmanagement_api.profiling
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+
+# Number of seconds between samples of the stack
+PROFILE_INTERVAL = 0.005
+
+# Number of the most recent profiles kept
+PROFILE_KEEP = 100
+
+
+# While DEBUG is on, queries of the same shape made at least this many times in one request are logged as a
+# likely query for each row, see carmanagement_api.querypatterns. None turns the check off
+QUERY_REPEAT_THRESHOLD = 5
+
+
+# Path to an optional CSV file of postcode, latitude and longitude used to look up branch postcodes
+# without calling the postcode service (e.g. an extract of the ONS Postcode Directory)
+
+POSTCODE_DATASET = None
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,6 @@
+"""carmanagement_project URL Configuration for workers that only serve the JSON API"""
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/', include('carmanagement_api.urls'))
+]
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'carmanagement_project.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, 'WARM_UP_ON_STARTUP', False):
+    from carmanagement_api.warmup import warm_up
+    warm_up()